@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+from benchmarks.suite import FIXTURES_DIR, HISTORY_FILE, STAGES, compare, run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic data.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Time the stages and append the results to the history.')
+    run_parser.add_argument('--scale', type=float, nargs='+', default=[1],
+                            help="Multiples of today's data size, e.g. 1 10 100.")
+    run_parser.add_argument('--stages', nargs='+', choices=list(STAGES), help='Defaults to every stage.')
+    run_parser.add_argument('--repeat', type=int, default=1, help='Runs of every stage, the fastest one is kept.')
+    run_parser.add_argument('--fixtures-dir', default=FIXTURES_DIR)
+    run_parser.add_argument('--history', default=HISTORY_FILE)
+
+    compare_parser = subparsers.add_parser('compare', help='Flag the stages that regressed between two runs.')
+    compare_parser.add_argument('--history', default=HISTORY_FILE)
+    compare_parser.add_argument('--baseline', type=int,
+                                help="Index of the reference run, defaults to the previous run at the same scale.")
+    compare_parser.add_argument('--candidate', type=int, default=-1)
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Relative increase of wall time or peak RSS counted as a regression.')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        for scale in args.scale:
+            print(f'Scale {scale:g}')
+            run(scale, args.stages, args.repeat, args.fixtures_dir, args.history)
+    else:
+        regressions = compare(args.history, args.baseline, args.candidate, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,408 @@
+"""
+Timings of every stage of the pipeline, from parsing timelines to scoring games, tracked across runs.
+
+Each stage runs in a fresh process, so its peak RSS is its own and no stage profits from the imports or caches
+of another. The results of a run are appended to a JSON history file, and compare flags the stages that got
+slower or bigger than in an earlier run at the same scale. Run it with:
+
+    python -m benchmarks run --scale 1 10
+    python -m benchmarks compare
+"""
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from benchmarks.synthetic import FINAL_DATA, MATCH_DATA_CSV, MATCH_DATA_FEATHER, MATCH_IDS_FILE, MODEL_FILE, \
+    TIMELINES_FILE, write_fixtures
+
+HISTORY_FILE = 'Data/benchmark_history.json'
+FIXTURES_DIR = 'Data/benchmark_fixtures'
+PREDICT_ONE_ROWS = 10_000  # Rows scored one at a time by the predict_one stage
+FETCH_LATENCY = 0.05  # Seconds the mock server takes to answer, about what the Riot API takes
+FETCH_RATE_LIMIT = 500  # Requests per second the mock server allows, a production key's limit
+
+
+def _extract_timelines(paths: dict, output_dir: str):
+    from data_processing.timeline_extractor import TimelineExtractor
+
+    extractor = TimelineExtractor()
+
+    def run() -> int:
+        count = 0
+        with open(paths[TIMELINES_FILE], 'r') as f:
+            for line in f:
+                extractor.extract_row(json.loads(line))
+                count += 1
+        return count
+    return run
+
+
+def _fetch_timelines(paths: dict, output_dir: str):
+    """
+    Harvests match data with get_match_data from the mock Riot server answering in FETCH_LATENCY seconds, with
+    rate limits high enough to measure the client and the extraction instead of the limits of a development key.
+    """
+    import asyncio
+    import contextlib
+    import io
+
+    from aiohttp import web
+
+    from collecting_data.get_data import get_match_data_async
+    from collecting_data.riot_client import RiotClient
+    from testing.mock_riot_server import create_app
+
+    offsets = {}  # The recorded timelines are served as they are, generating them would be the bottleneck
+    with open(paths[TIMELINES_FILE], 'rb') as f:
+        position = 0
+        for line in f:
+            offsets[f'EUN1_{len(offsets)}'] = (position, len(line) - 1)
+            position += len(line)
+    count = len(offsets)
+    ids_file = os.path.join(output_dir, 'fetch_match_ids.txt')
+    with open(ids_file, 'w') as f:
+        f.writelines(match_id + '\n' for match_id in offsets)
+
+    async def harvest() -> None:
+        limit = f'{FETCH_RATE_LIMIT}:1'
+        fd = os.open(paths[TIMELINES_FILE], os.O_RDONLY)
+        runner = web.AppRunner(create_app(limit, latency=FETCH_LATENCY, latency_jitter=FETCH_LATENCY / 4,
+                                          method_rate_limits={'match-v5.timeline': limit},
+                                          timeline_source=lambda match_id: os.pread(fd, offsets[match_id][1],
+                                                                                    offsets[match_id][0])))
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        port = runner.addresses[0][1]  # Of the free port the system picked
+        try:
+            async with RiotClient('benchmark', app_rate_limit=limit,
+                                  url_template=f'http://127.0.0.1:{port}/{{route}}') as client:
+                with contextlib.redirect_stdout(io.StringIO()):  # get_match_data prints every match
+                    await get_match_data_async(client, ids_file, os.path.join(output_dir, 'fetched.csv'),
+                                               resume=False)
+        finally:
+            await runner.cleanup()
+            os.close(fd)
+
+    def run() -> int:
+        asyncio.run(harvest())
+        return count
+    return run
+
+
+def _remove_duplicates(paths: dict, output_dir: str):
+    from data_processing.change_format import remove_duplicates
+
+    with open(paths[MATCH_IDS_FILE], 'rb') as f:
+        lines = sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+
+    def run() -> int:
+        remove_duplicates(paths[MATCH_IDS_FILE], os.path.join(output_dir, 'unique_match_ids.txt'))
+        return lines
+    return run
+
+
+def _csv_to_feather(paths: dict, output_dir: str):
+    from data_processing.change_format import csv_to_feather
+
+    def run() -> int:
+        csv_to_feather(paths[MATCH_DATA_CSV], os.path.join(output_dir, 'match_data.feather'))
+        return _rows(paths[MATCH_DATA_FEATHER])
+    return run
+
+
+def _data_to_final(paths: dict, output_dir: str):
+    from data_processing.clean_data import data_to_final
+
+    def run() -> int:
+        data_to_final(paths[MATCH_DATA_FEATHER], os.path.join(output_dir, 'final_data.feather'))
+        return _rows(paths[MATCH_DATA_FEATHER])
+    return run
+
+
+def _prepare_data(paths: dict, output_dir: str):
+    from model.feature_engineering import prepare_data
+
+    def run() -> int:
+        prepare_data(paths[FINAL_DATA], output_dir, rebuild=True)
+        return _rows(paths[FINAL_DATA])
+    return run
+
+
+def _refresh_prepared_data(paths: dict, output_dir: str):
+    import pandas as pd
+
+    from model.feature_engineering import prepare_data
+
+    refresh_dir = os.path.join(output_dir, 'refresh')
+    os.makedirs(refresh_dir, exist_ok=True)
+    df = pd.read_feather(paths[FINAL_DATA])
+    history_file = os.path.join(refresh_dir, 'history.feather')
+    df.iloc[:int(len(df) * 0.99)].reset_index(drop=True).to_feather(history_file)  # The last 1% is the new day
+    prepare_data(history_file, refresh_dir, rebuild=True)
+
+    def run() -> int:
+        return prepare_data(paths[FINAL_DATA], refresh_dir)
+    return run
+
+
+def _load_prepared_data(paths: dict, output_dir: str):
+    from model.feature_engineering import SPLITS, load_prepared_data
+
+    def run() -> int:
+        rows = 0
+        for split in SPLITS:
+            values, win = load_prepared_data(paths[f'prepared_{split}'])
+            values.sum(), win.sum()  # Memory-mapped arrays are only read when touched
+            rows += len(values)
+        return rows
+    return run
+
+
+def _classifier(paths: dict):
+    from model.building_the_model import NeuralNetworkClassifier
+
+    classifier = NeuralNetworkClassifier(paths['prepared_train'], paths['prepared_test'], paths['prepared_val'])
+    classifier.build_model()
+    return classifier
+
+
+def _train_epoch(paths: dict, output_dir: str):
+    classifier = _classifier(paths)
+
+    def run() -> int:
+        classifier.train(epochs=1, verbose=0)
+        return len(classifier.dataset_train_values)
+    return run
+
+
+def _keras_predict(paths: dict, output_dir: str):
+    classifier = _classifier(paths)
+
+    def run() -> int:
+        return len(classifier.predict())
+    return run
+
+
+def _numpy_predict(paths: dict, output_dir: str):
+    from model.inference import NumpyModel
+
+    model = NumpyModel(paths[MODEL_FILE])
+    values = np.load(paths['prepared_test'])[:, :-1]
+
+    def run() -> int:
+        return len(model.predict(values))
+    return run
+
+
+def _numpy_predict_one(paths: dict, output_dir: str):
+    from model.inference import NumpyModel
+
+    model = NumpyModel(paths[MODEL_FILE])
+    values = np.load(paths['prepared_test'])[:PREDICT_ONE_ROWS, :-1]
+
+    def run() -> int:
+        for row in values:
+            model.predict_one(row)
+        return len(values)
+    return run
+
+
+def _win_curves(paths: dict, output_dir: str):
+    from data_processing.timeline_extractor import TimelineExtractor
+    from model.inference import NumpyModel
+    from model.win_curves import score_frames
+
+    model = NumpyModel(paths[MODEL_FILE])
+    extractor = TimelineExtractor()
+
+    def run() -> int:
+        with open(paths[TIMELINES_FILE], 'r') as f:
+            games = [extractor.extract_frames(json.loads(line)) for line in f]
+        score_frames(model, games)
+        return len(games)
+    return run
+
+
+def _rows(feather_file: str) -> int:
+    import pyarrow.feather as feather
+
+    return feather.read_table(feather_file, columns=[], memory_map=True).num_rows
+
+
+# Stage name -> (setup, unit). setup(fixture paths, scratch directory) loads what the stage needs and returns
+# the timed function, which returns the number of processed units.
+STAGES = {
+    'fetch_timelines': (_fetch_timelines, 'timeline'),
+    'extract_timelines': (_extract_timelines, 'timeline'),
+    'remove_duplicates': (_remove_duplicates, 'id'),
+    'csv_to_feather': (_csv_to_feather, 'row'),
+    'data_to_final': (_data_to_final, 'row'),
+    'prepare_data': (_prepare_data, 'row'),
+    'refresh_prepared_data': (_refresh_prepared_data, 'row'),
+    'load_prepared_data': (_load_prepared_data, 'row'),
+    'train_epoch': (_train_epoch, 'row'),
+    'keras_predict': (_keras_predict, 'row'),
+    'numpy_predict': (_numpy_predict, 'row'),
+    'numpy_predict_one': (_numpy_predict_one, 'row'),
+    'win_curves': (_win_curves, 'timeline'),
+}
+
+
+def _reset_peak_rss() -> None:
+    """
+    Linux keeps the peak RSS of the process a worker was forked from, start counting from the current RSS.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss() -> int:
+    try:
+        with open('/proc/self/status', 'r') as f:
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmHWM:'))
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _run_stage(stage: str, paths: dict, output_dir: str) -> dict:
+    """
+    Worker of run, times one stage in a fresh process.
+    """
+    _reset_peak_rss()
+    setup, unit = STAGES[stage]
+    try:
+        function = setup(paths, output_dir)
+    except ImportError as error:  # Keras stages without TensorFlow
+        return {'status': 'skipped', 'reason': str(error)}
+    start = time.perf_counter()
+    items = function()
+    seconds = time.perf_counter() - start
+    return {'status': 'ok', 'seconds': seconds, 'items': items, 'unit': unit, 'throughput': items / seconds,
+            'peak_rss_mb': _peak_rss() / 2 ** 20}
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(history_file: str = HISTORY_FILE) -> list:
+    if not os.path.exists(history_file):
+        return []
+    with open(history_file, 'r') as f:
+        return json.load(f)
+
+
+def run(scale: float = 1, stages: list = None, repeat: int = 1, fixtures_dir: str = FIXTURES_DIR,
+        history_file: str = HISTORY_FILE) -> dict:
+    """
+    Benchmarks the given stages on synthetic data and appends the results to the history file.
+
+    Args:
+    :argument: scale (float): Multiple of today's data size, see benchmarks.synthetic.
+    :argument: stages (list): Names of the stages to run, defaults to every stage of STAGES.
+    :argument: repeat (int): Runs of every stage, the fastest one is kept (and the highest peak RSS).
+    :argument: fixtures_dir (str): Directory the generated inputs are kept in between runs.
+    :argument: history_file (str): JSON file the results are appended to.
+
+    Returns:
+    :return: dict: The appended run: scale, time, commit, machine and the results of every stage.
+    """
+    stages = stages or list(STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f'Unknown stages: {sorted(unknown)}, expected some of {list(STAGES)}')
+
+    fixtures_dir = os.path.join(fixtures_dir, f'scale_{scale:g}')
+    paths = write_fixtures(fixtures_dir, scale)
+    output_dir = os.path.join(fixtures_dir, 'output')
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    for stage in stages:
+        attempts = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                attempts.append(executor.submit(_run_stage, stage, paths, output_dir).result())
+        result = min(attempts, key=lambda attempt: attempt.get('seconds', 0.0))
+        if result['status'] == 'ok':
+            result['peak_rss_mb'] = max(attempt['peak_rss_mb'] for attempt in attempts)
+            print(f'{stage:<22} {result["seconds"]:>9.3f} s {result["throughput"]:>14,.0f} {result["unit"]}/s '
+                  f'{result["peak_rss_mb"]:>9.1f} MB')
+        else:
+            print(f'{stage:<22} skipped: {result["reason"]}')
+        results[stage] = result
+
+    entry = {'scale': scale, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), 'commit': _commit(),
+             'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                         'cpus': os.cpu_count()},
+             'stages': results}
+    history = read_history(history_file)
+    history.append(entry)
+    os.makedirs(os.path.dirname(history_file) or '.', exist_ok=True)
+    with open(history_file, 'w') as f:
+        json.dump(history, f, indent=4)
+    return entry
+
+
+def compare(history_file: str = HISTORY_FILE, baseline: int = None, candidate: int = -1,
+            threshold: float = 0.1) -> list:
+    """
+    Compares two runs of the history and prints the change of every stage they both ran.
+
+    Args:
+    :argument: history_file (str): JSON file written by run.
+    :argument: baseline (int): Index of the reference run, defaults to the last run at the candidate's scale
+                               before it.
+    :argument: candidate (int): Index of the compared run, defaults to the latest one.
+    :argument: threshold (float): Relative increase of the wall time or the peak RSS flagged as a regression.
+
+    Returns:
+    :return: list: (stage, metric, baseline value, candidate value) of every regression.
+    """
+    history = read_history(history_file)
+    if not history:
+        raise ValueError(f'No benchmark runs in {history_file}')
+    candidate_entry = history[candidate]
+    if baseline is None:
+        position = candidate % len(history)
+        baseline = next((index for index in range(position - 1, -1, -1)
+                         if history[index]['scale'] == candidate_entry['scale']), None)
+        if baseline is None:
+            raise ValueError(f'No earlier run at scale {candidate_entry["scale"]:g} to compare with')
+    baseline_entry = history[baseline]
+    if baseline_entry['scale'] != candidate_entry['scale']:
+        raise ValueError(f'Runs at different scales cannot be compared: {baseline_entry["scale"]:g} '
+                         f'and {candidate_entry["scale"]:g}')
+
+    print(f'{baseline_entry["time"]} ({baseline_entry["commit"]}) -> '
+          f'{candidate_entry["time"]} ({candidate_entry["commit"]}), scale {candidate_entry["scale"]:g}')
+    regressions = []
+    for stage, after in candidate_entry['stages'].items():
+        before = baseline_entry['stages'].get(stage)
+        if before is None or before['status'] != 'ok' or after['status'] != 'ok':
+            continue
+        flags = []
+        for metric in ('seconds', 'peak_rss_mb'):
+            if after[metric] > before[metric] * (1 + threshold):
+                regressions.append((stage, metric, before[metric], after[metric]))
+                flags.append(metric)
+        print(f'{stage:<22} {before["seconds"]:>9.3f} s -> {after["seconds"]:>9.3f} s '
+              f'({after["seconds"] / before["seconds"] - 1:>+7.1%}) '
+              f'{before["peak_rss_mb"]:>8.1f} MB -> {after["peak_rss_mb"]:>8.1f} MB'
+              + (f'  REGRESSION: {", ".join(flags)}' if flags else ''))
+    return regressions
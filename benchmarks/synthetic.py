@@ -0,0 +1,129 @@
+"""
+Synthetic inputs of the benchmarked pipeline stages, at a multiple of today's data size.
+
+Scale 1 is the size of the collected data (41 282 clean matches), scale 10 and 100 are the sizes the pipeline
+is expected to grow to. Every generator is seeded, so the same scale always gives the same files.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_processing.clean_data import data_to_final
+from model.feature_engineering import SPLITS, prepare_data
+from testing.timeline_generator import write_timelines
+
+BASE_ROWS = 41_282  # Clean matches of the collected data
+BASE_TIMELINES = 1_000  # Timelines are parsed one by one, so their fixtures are smaller to keep the runs short
+REFERENCE_DATA = 'Data_initial/match_data.feather'
+DUPLICATE_IDS = 0.58  # Share of repeated IDs in the harvested match ID lists
+
+MATCH_IDS_FILE = 'match_ids.txt'
+TIMELINES_FILE = 'timelines.jsonl'
+MATCH_DATA_CSV = 'match_data.csv'
+MATCH_DATA_FEATHER = 'match_data.feather'
+FINAL_DATA = 'final_data.feather'
+MODEL_FILE = 'model_weights.npz'
+
+
+def match_data(rows: int, reference_file: str = REFERENCE_DATA, seed: int = 777) -> pd.DataFrame:
+    """
+    Draws match data rows from the collected data with replacement, so the columns keep their joint
+    distribution (and the incorrect rows data_to_final removes stay as frequent). The game durations are
+    jittered by up to half a minute, so the drawn rows are not duplicates of each other.
+
+    Args:
+    :argument: rows (int): Number of rows.
+    :argument: reference_file (str): Feather file with collected match data.
+    :argument: seed (int): Random seed.
+
+    Returns:
+    :return: pd.DataFrame: Match data with the columns of the reference file.
+    """
+    reference = pd.read_feather(reference_file)
+    rng = np.random.default_rng(seed)
+    df = reference.iloc[rng.integers(0, len(reference), rows)].reset_index(drop=True)
+    df['gameDuration'] = df['gameDuration'] + rng.uniform(-30, 30, rows).round(3)
+    return df
+
+
+def match_ids(count: int, duplicates: float = DUPLICATE_IDS, seed: int = 777) -> list:
+    """
+    Match IDs as harvested from match histories, where games of players of the same ladder repeat.
+
+    Args:
+    :argument: count (int): Number of IDs.
+    :argument: duplicates (float): Share of IDs repeating an earlier one.
+    :argument: seed (int): Random seed.
+
+    Returns:
+    :return: list: Match IDs like 'EUN1_3593845894'.
+    """
+    rng = np.random.default_rng(seed)
+    unique = 3_500_000_000 + rng.choice(100_000_000, max(1, int(count * (1 - duplicates))), replace=False)
+    return [f'EUN1_{number}' for number in rng.choice(unique, count)]
+
+
+def write_fixtures(output_dir: str, scale: float) -> dict:
+    """
+    Writes the inputs of every stage for the given scale to output_dir, the files already there are kept.
+
+    The match data is written as CSV and Feather, then cleaned and prepared with the pipeline itself. The network
+    weights are random, with the layers of NeuralNetworkClassifier, since scoring speed does not depend on them.
+
+    Args:
+    :argument: output_dir (str): Directory of the fixtures, created if it does not exist.
+    :argument: scale (float): Multiple of today's data size.
+
+    Returns:
+    :return: dict: Fixture name -> path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {name: os.path.join(output_dir, name) for name in (MATCH_IDS_FILE, TIMELINES_FILE, MATCH_DATA_CSV,
+                                                              MATCH_DATA_FEATHER, FINAL_DATA, MODEL_FILE)}
+    paths.update({f'prepared_{split}': os.path.join(output_dir, f'prepared_data_{split}.npy') for split in SPLITS})
+    rows = int(BASE_ROWS * scale)
+
+    if not os.path.exists(paths[MATCH_IDS_FILE]):
+        with open(paths[MATCH_IDS_FILE], 'w') as f:
+            f.writelines(match_id + '\n' for match_id in match_ids(int(rows / (1 - DUPLICATE_IDS))))
+
+    if not os.path.exists(paths[TIMELINES_FILE]):
+        write_timelines(paths[TIMELINES_FILE], int(BASE_TIMELINES * scale))
+
+    if not os.path.exists(paths[MATCH_DATA_FEATHER]):
+        df = match_data(rows)
+        df.to_csv(paths[MATCH_DATA_CSV], index=False)
+        df.to_feather(paths[MATCH_DATA_FEATHER])
+
+    if not os.path.exists(paths[FINAL_DATA]):
+        data_to_final(paths[MATCH_DATA_FEATHER], paths[FINAL_DATA])
+
+    if not all(os.path.exists(paths[f'prepared_{split}']) for split in SPLITS):
+        prepare_data(paths[FINAL_DATA], output_dir)
+
+    if not os.path.exists(paths[MODEL_FILE]):
+        _random_model(paths[MODEL_FILE], np.load(paths['prepared_train'], mmap_mode='r'))
+    return paths
+
+
+def _random_model(output_file: str, train: np.ndarray, hidden_layers: tuple = (7, 7), seed: int = 777) -> None:
+    """
+    Writes a network with random weights in the format of model.inference.export_model.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.asarray(train[:100_000, :-1])
+    layers = [{'kind': 'Normalization'}]
+    arrays = {'layer_0_mean': values.mean(axis=0), 'layer_0_variance': values.var(axis=0)}
+    widths = [values.shape[1], *hidden_layers, 1]
+    activations = ['elu'] + ['sigmoid'] * len(hidden_layers)
+    for width_in, width_out, activation in zip(widths, widths[1:], activations):
+        prefix = f'layer_{len(layers)}'
+        arrays[prefix + '_kernel'] = rng.normal(0, 1 / np.sqrt(width_in), (width_in, width_out))
+        arrays[prefix + '_bias'] = np.zeros(width_out)
+        layers.append({'kind': 'Dense', 'activation': activation})
+        if len(layers) == 2:  # PReLU after the first hidden layer
+            arrays['layer_2_alpha'] = np.full(width_out, 0.25)
+            layers.append({'kind': 'PReLU'})
+    np.savez(output_file, layers=np.array(json.dumps(layers)), **arrays)
@@ -0,0 +1,83 @@
+import sqlite3
+import time
+
+
+class CollectionState:
+    def __init__(self, path: str) -> None:
+        """
+        Persistent state shared by collection runs, stored in a SQLite file.
+
+        For every PUUID it keeps the newest match ID seen and when its history was last checked, so later runs
+        only ask the API for games played since then. It also maps summoner IDs to PUUIDs - the mapping never
+        changes, so a summoner only has to be resolved once.
+
+        Args:
+        :argument: path (str): Path to the SQLite state file.
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS puuid_watermarks (
+                puuid TEXT PRIMARY KEY,
+                newest_match_id TEXT,
+                last_checked REAL NOT NULL
+            ) WITHOUT ROWID""")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS summoner_puuids (
+                summoner_id TEXT PRIMARY KEY,
+                puuid TEXT NOT NULL,
+                last_verified REAL NOT NULL
+            ) WITHOUT ROWID""")
+        self.connection.commit()
+
+    def __enter__(self) -> 'CollectionState':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def watermark(self, puuid: str) -> tuple:
+        """
+        Returns (newest match ID, last checked epoch seconds) of a PUUID, or None if it was never checked.
+        """
+        return self.connection.execute('SELECT newest_match_id, last_checked FROM puuid_watermarks WHERE puuid = ?',
+                                       (puuid,)).fetchone()
+
+    def set_watermark(self, puuid: str, newest_match_id: str, last_checked: float) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO puuid_watermarks VALUES (?, ?, ?)',
+                                (puuid, newest_match_id, last_checked))
+        self.connection.commit()
+
+    def puuids(self, summoner_ids: list, max_age: float = None) -> dict:
+        """
+        Looks up cached PUUIDs.
+
+        Args:
+        :argument: summoner_ids (list): Summoner encrypted IDs.
+        :argument: max_age (float): Ignore mappings verified more than this many seconds ago. None keeps all.
+
+        Returns:
+        :return: dict: Summoner ID -> PUUID for the IDs found in the cache.
+        """
+        oldest = time.time() - max_age if max_age is not None else 0.0
+        found = {}
+        for summoner_id in summoner_ids:
+            row = self.connection.execute('SELECT puuid FROM summoner_puuids WHERE summoner_id = ? '
+                                          'AND last_verified >= ?', (summoner_id, oldest)).fetchone()
+            if row is not None:
+                found[summoner_id] = row[0]
+        return found
+
+    def set_puuids(self, pairs, verified_at: float = None) -> None:
+        """
+        Stores (summoner ID, PUUID) pairs.
+        """
+        verified_at = verified_at if verified_at is not None else time.time()
+        self.connection.executemany('INSERT OR REPLACE INTO summoner_puuids VALUES (?, ?, ?)',
+                                    ((summoner_id, puuid, verified_at) for summoner_id, puuid in pairs))
+        self.connection.commit()
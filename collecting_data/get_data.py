@@ -1,10 +1,98 @@
+import asyncio
 import csv
+import json
+import math
 import time
+from collections import deque
+
+import aiohttp
+
+from collecting_data.collection_state import CollectionState
+from collecting_data.ledger import DONE, FAILED, MatchLedger
+from collecting_data.riot_client import RiotClient, RiotAPIError
+from collecting_data.timeline_cache import MATCH, TIMELINE, TimelineCache
+from data_processing.timeline_extractor import extract_match_row
+from instrumentation import count, instrumented, timed
+
+PLATFORM_ROUTE = 'eun1'
+REGIONAL_ROUTES = {
+    'eun1': 'europe', 'euw1': 'europe', 'tr1': 'europe', 'ru': 'europe', 'me1': 'europe',
+    'na1': 'americas', 'br1': 'americas', 'la1': 'americas', 'la2': 'americas',
+    'kr': 'asia', 'jp1': 'asia',
+    'oc1': 'sea', 'ph2': 'sea', 'sg2': 'sea', 'th2': 'sea', 'tw2': 'sea', 'vn2': 'sea',
+}  # Platform routing value -> regional routing value used by match-v5
+LEAGUE_PAGE_SIZE = 205  # Number of entries returned by a single league-exp page
+MATCH_IDS_PAGE_SIZE = 100  # Maximum number of match IDs returned by a single by-puuid page
+MATCH_HISTORY_OVERLAP = 3600  # Seconds, games started before the last check could have ended after it
+
+
+def _run(API_key: str, collector, *args, **kwargs):
+    """
+    Runs an asynchronous collector with a freshly opened RiotClient.
 
-import requests
+    Args:
+    :argument: API_key (str): API key for Riot Games API.
+    :argument: collector: Coroutine function taking the client as its first argument.
 
+    Returns:
+    :return: Whatever the collector returns.
+    """
+    async def runner():
+        async with RiotClient(API_key) as client:
+            return await collector(client, *args, **kwargs)
 
-def gather_summoner_ids(API_key: str, output_file: str, tier: str = 'CHALLENGER', min_players: int = 200) -> None:
+    return asyncio.run(runner())
+
+
+def regional_route(match_id: str) -> str:
+    """
+    Returns the regional routing value a match has to be requested from, based on its platform prefix.
+
+    Args:
+    :argument: match_id (str): Match ID, e.g. 'EUN1_3600000000'.
+
+    Returns:
+    :return: str: Regional routing value, e.g. 'europe'.
+    """
+    return REGIONAL_ROUTES[match_id.partition('_')[0].lower()]
+
+
+async def _map_concurrently(coroutine_function, items, concurrency: int):
+    """
+    Runs coroutine_function over items keeping at most `concurrency` calls in flight.
+    Results are yielded as soon as they are ready, so memory stays bounded by `concurrency`.
+
+    Args:
+    :argument: coroutine_function: Coroutine function called with a single item.
+    :argument: items: Iterable of items, consumed lazily.
+    :argument: concurrency (int): Maximum number of calls in flight.
+
+    Returns:
+    :return: Async generator of (item, result) pairs, result is the raised exception if the call failed.
+    """
+    async def call(item):
+        try:
+            return item, await coroutine_function(item)
+        except Exception as error:
+            return item, error
+
+    items = iter(items)
+    pending = set()
+    for item in items:
+        pending.add(asyncio.ensure_future(call(item)))
+        if len(pending) >= concurrency:
+            break
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
+            for item in items:
+                pending.add(asyncio.ensure_future(call(item)))
+                break
+
+
+def gather_summoner_ids(API_key: str, output_file: str, tier: str = 'CHALLENGER', min_players: int = 200,
+                        state_file: str = None, puuids_file: str = None, platform: str = PLATFORM_ROUTE) -> None:
     """
     Gather master tier player data from Riot API and extract summoner encrypted IDs.
 
@@ -14,311 +102,326 @@ def gather_summoner_ids(API_key: str, output_file: str, tier: str = 'CHALLENGER'
     :argument: min_players (int): Minimum number of players to gather. Although the limit is reached
                we will scrap the remaining players of current page. Defaults to 200.
     :argument: tier (str): Tier from which we want to gather players. Defaults to CHALLENGER
+    :argument: state_file (str): Path to the collection state file. PUUIDs the league entries come with are
+               cached there, so extract_puuids does not have to request them.
+    :argument: puuids_file (str): Path to a file to write the PUUIDs the league entries come with,
+               which makes extract_puuids unnecessary.
+    :argument: platform (str): Platform routing value of the server. Defaults to eun1.
 
     Returns:
     :return None
     """
-    current_page = 1
-    total_players_gathered = 0
+    _run(API_key, gather_summoner_ids_async, output_file, tier, min_players, state_file, puuids_file, platform)
 
-    while total_players_gathered < min_players:
-        response = requests.get(
-            f'https://eun1.api.riotgames.com/lol/league-exp/v4/entries/RANKED_SOLO_5x5/{tier}/I?page={current_page}&api_key={API_key}')
-        with open(output_file, 'a') as f:
-            for summoner in response.json():
-                try:
-                    f.write(summoner['summonerId'] + '\n')
-                    total_players_gathered += 1
-                except UnicodeEncodeError:
-                    pass
-        time.sleep(1.21)  # Due to Riot API limitations required value is 1.2, 0.01 added for safety :)
-        current_page += 1
 
+@instrumented('gather_summoner_ids')
+async def gather_summoner_ids_async(client: RiotClient, output_file: str, tier: str = 'CHALLENGER',
+                                    min_players: int = 200, state_file: str = None, puuids_file: str = None,
+                                    platform: str = PLATFORM_ROUTE) -> None:
+    """
+    Asynchronous version of gather_summoner_ids. All pages needed to reach min_players are requested at once.
+    """
+    current_page = 1
+    total_players_gathered = 0
+    known_puuids = []
 
-def extract_puuids(API_key: str, input_file: str, output_file: str) -> None:
+    with open(output_file, 'a') as f:
+        while total_players_gathered < min_players:
+            pages_needed = math.ceil((min_players - total_players_gathered) / LEAGUE_PAGE_SIZE)
+            pages = range(current_page, current_page + pages_needed)
+            responses = await asyncio.gather(*(client.get(
+                platform, f'/lol/league-exp/v4/entries/RANKED_SOLO_5x5/{tier}/I', 'league-exp-v4.entries',
+                {'page': page}) for page in pages))
+            for response in responses:
+                for summoner in response:
+                    try:
+                        f.write(summoner['summonerId'] + '\n')
+                        total_players_gathered += 1
+                        count('rows')
+                    except UnicodeEncodeError:
+                        pass
+                    if 'puuid' in summoner:  # Newer league entries come with the PUUID
+                        known_puuids.append((summoner['summonerId'], summoner['puuid']))
+            if not all(responses):  # The ladder has fewer players than requested
+                break
+            current_page = pages.stop
+
+    if state_file is not None:
+        with CollectionState(state_file) as state:
+            state.set_puuids(known_puuids)
+    if puuids_file is not None:
+        with open(puuids_file, 'a') as f:
+            for summoner_id, puuid in known_puuids:
+                f.write(puuid + '\n')
+
+
+def extract_puuids(API_key: str, input_file: str, output_file: str, state_file: str = None,
+                   max_age_days: float = None, platform: str = PLATFORM_ROUTE) -> None:
     """
     Extract PUUIDs from Riot API using the provided list of summoner encrypted IDs.
 
+    With a state file, PUUIDs already known are taken from it and only the remaining summoner IDs are requested
+    (concurrently, within the rate limits). Newly resolved PUUIDs are stored for the next run.
+
     Args:
     :argument: API_key (str): API key for Riot Games API.
     :argument: input_file (str): Path to the input file containing summoner encrypted IDs.
     :argument: output_file (str): Path to the output file to write PUUIDs.
+    :argument: state_file (str): Path to the collection state file caching summoner ID -> PUUID.
+    :argument: max_age_days (float): Resolve cached summoners again if they were verified longer ago than this.
+    :argument: platform (str): Platform routing value of the server. Defaults to eun1.
 
     Returns:
     :return: None
     """
+    _run(API_key, extract_puuids_async, input_file, output_file, state_file, max_age_days, platform)
+
+
+@instrumented('extract_puuids')
+async def extract_puuids_async(client: RiotClient, input_file: str, output_file: str, state_file: str = None,
+                               max_age_days: float = None, platform: str = PLATFORM_ROUTE) -> None:
+    """
+    Asynchronous version of extract_puuids.
+    """
     with open(input_file, 'r') as f:
         summoner_encrypted_ids = f.read().splitlines()
 
-    with open(output_file, 'a') as f:
-        for summoner_id in summoner_encrypted_ids:
-            try:
-                response = requests.get(
-                    f'https://eun1.api.riotgames.com/lol/summoner/v4/summoners/{summoner_id}?api_key={API_key}')
-                f.write(response.json()['puuid'] + '\n')
-            except KeyError:
-                print(f'Error getting PUUUID from: {summoner_id}')
-                pass
-            time.sleep(1.21)  # Due to Riot API limitations required value is 1.2, 0.01 added for safety :)
-
-
-def fetch_match_ids(API_key: str, input_file: str, output_file: str) -> None:
+    state = CollectionState(state_file) if state_file is not None else None
+    max_age = max_age_days * 86400 if max_age_days is not None else None
+    cached = state.puuids(summoner_encrypted_ids, max_age) if state is not None else {}
+    misses = [summoner_id for summoner_id in summoner_encrypted_ids if summoner_id not in cached]
+
+    async def fetch(summoner_id: str) -> dict:
+        return await client.get(platform, f'/lol/summoner/v4/summoners/{summoner_id}', 'summoner-v4.by-id')
+
+    try:
+        with open(output_file, 'a') as f:
+            for puuid in cached.values():
+                f.write(puuid + '\n')
+            async for summoner_id, response in _map_concurrently(fetch, misses, client.max_in_flight(platform)):
+                try:
+                    if isinstance(response, Exception):
+                        raise KeyError(summoner_id) from response
+                    f.write(response['puuid'] + '\n')
+                    count('rows')
+                    if state is not None:
+                        state.set_puuids([(summoner_id, response['puuid'])])
+                except KeyError:
+                    print(f'Error getting PUUUID from: {summoner_id}')
+    finally:
+        if state is not None:
+            state.close()
+    print(f'PUUIDs taken from the cache: {len(cached)}, requested: {len(misses)}')
+
+
+def fetch_match_ids(API_key: str, input_file: str, output_file: str, state_file: str = None,
+                    ledger_file: str = None, platform: str = PLATFORM_ROUTE) -> None:
     """
     Fetch match IDs from Riot API using the provided list of PUUIDs.
 
+    With a state file the fetch is incremental: the newest match and the time of the check are remembered per
+    PUUID, and the next run only pages through games started since then. Match IDs already written by this run
+    or already known to the match ledger are skipped.
+
     Args:
     :argument: API_key (str): API key for Riot Games API.
     :argument: input_file (str): Path to the input file containing PUUIDs.
     :argument: output_file (str): Path to the output file to write match IDs.
+    :argument: state_file (str): Path to the collection state file. None fetches the 100 most recent games
+               of every PUUID, like the first incremental run does.
+    :argument: ledger_file (str): Path to the ledger of get_match_data, its match IDs are not written again.
+    :argument: platform (str): Platform routing value the PUUIDs were gathered on. Defaults to eun1.
 
     Returns:
     :return: None
     """
-    with open(input_file, 'r') as f:
-        puuids = f.read().splitlines()
-
-    with open(output_file, 'a') as f:
-        for puuid in puuids:
-            response = requests.get(
-                f'https://europe.api.riotgames.com/lol/match/v5/matches/by-puuid/{puuid}/ids?queue=420&type=ranked&start=0&count=100&api_key={API_key}')
+    _run(API_key, fetch_match_ids_async, input_file, output_file, state_file, ledger_file, platform)
 
-            for match in response.json():
-                f.write(match + '\n')
-
-            time.sleep(1.21)  # Due to Riot API limitations required value is 1.2, 0.01 added for safety :)
 
+@instrumented('fetch_match_ids')
+async def fetch_match_ids_async(client: RiotClient, input_file: str, output_file: str, state_file: str = None,
+                                ledger_file: str = None, platform: str = PLATFORM_ROUTE) -> None:
+    """
+    Asynchronous version of fetch_match_ids.
+    """
+    route = REGIONAL_ROUTES[platform]
+    with open(input_file, 'r') as f:
+        puuids = f.read().splitlines()
 
-def get_match_data(API_key: str, input_file: str, output_file: str) -> None:
+    state = CollectionState(state_file) if state_file is not None else None
+    ledger = MatchLedger(ledger_file) if ledger_file is not None else None
+    seen = set()
+
+    async def fetch(puuid: str) -> tuple:
+        checked_at = time.time()
+        path = f'/lol/match/v5/matches/by-puuid/{puuid}/ids'
+        params = {'queue': 420, 'type': 'ranked', 'start': 0, 'count': MATCH_IDS_PAGE_SIZE}
+        watermark = state.watermark(puuid) if state is not None else None
+        if watermark is None:
+            return await client.get(route, path, 'match-v5.ids-by-puuid', params), watermark, checked_at
+
+        newest_match_id, last_checked = watermark
+        params['startTime'] = int(last_checked) - MATCH_HISTORY_OVERLAP
+        matches = []
+        while True:  # Pages are ordered newest first, stop at the newest game we already know
+            page = await client.get(route, path, 'match-v5.ids-by-puuid', params)
+            if newest_match_id in page:
+                matches += page[:page.index(newest_match_id)]
+                break
+            matches += page
+            if len(page) < MATCH_IDS_PAGE_SIZE:
+                break
+            params['start'] += MATCH_IDS_PAGE_SIZE
+        return matches, watermark, checked_at
+
+    try:
+        with open(output_file, 'a') as f:
+            async for puuid, response in _map_concurrently(fetch, puuids, client.max_in_flight(route)):
+                if isinstance(response, Exception):
+                    print(f'Error getting match IDs of: {puuid} ({response})')
+                    continue
+                matches, watermark, checked_at = response
+                for match in matches:
+                    if match in seen or (ledger is not None and ledger.status(match) is not None):
+                        continue
+                    seen.add(match)
+                    f.write(match + '\n')
+                    count('rows')
+                if state is not None:
+                    newest_match_id = matches[0] if matches else watermark and watermark[0]
+                    state.set_watermark(puuid, newest_match_id, checked_at)
+    finally:
+        if state is not None:
+            state.close()
+        if ledger is not None:
+            ledger.close()
+
+
+def get_match_data(API_key: str, input_file: str, output_file: str, resume: bool = True,
+                   retry_failed: bool = False, cache_dir: str = None, details: bool = False) -> None:
     """
     Get specific match data from input_file containing id's of matches.
     Write data in csv file.
 
+    Progress is recorded in a ledger next to the output file (output_file + '.ledger'), so a killed harvest
+    can be restarted and only the matches that are not done yet are downloaded again.
+
     Args:
     :argument: API_key (str): API key for Riot Games API.
     :argument: input_file (str): Path to the input file containing match ID's.
     :argument: output_file (str): Path to the output file to write details about each game.
+    :argument: resume (bool): Skip matches the ledger marks as done and append to output_file. When False the
+               ledger is cleared first and output_file is rewritten from scratch.
+    :argument: retry_failed (bool): Give matches that ran out of retries another retry budget.
+    :argument: cache_dir (str): Directory of the raw timeline cache. Timelines are read from it first and
+               downloaded ones are stored in it, so features can be re-extracted without the API.
+    :argument: details (bool): Also download the match details into the cache, they give extract_bulk the patch
+               of every match (see match_store). Needs cache_dir, costs a second request per match.
 
     Returns:
     :return: None
     """
-    with open(input_file, 'r') as file_1:
-        matches = file_1.read().splitlines()
-
-    lenOfMatchesToIterate = len(matches)  # Percentage delete later
-
-    with open(output_file, 'a') as file_2:
-        writer = csv.writer(file_2, delimiter=',', lineterminator='\n')
-
-        # Iterate over matches while there are still matches to iterate over
-        while len(matches) > 0:
-
-            # API call sometimes returns error for no reason at all
-            # When querying the same game again it works
-            try:
-
-                # Reset values, some add up over iterations
-                blueTeamTotalGold = 0
-                blueTeamAvgLevel = 0
-                blueTeamTotalMinionsKilled = 0
-                blueTeamTotalJungleMonstersKilled = 0
-
-                redTeamTotalGold = 0
-                redTeamAvgLevel = 0
-                redTeamTotalMinionsKilled = 0
-                redTeamTotalJungleMonstersKilled = 0
-
-                blueTeamWardsPlaced = 0
-                blueTeamWardsDestroyed = 0
-                blueTeamTowersDestroyed = 0
-                blueTeamDragonsKilled = 0
-                blueTeamHeraldsKilled = 0
-                blueTeamVoidGrubsKilled = 0
-                blueTeamKills = 0
-                blueTeamDeaths = 0
-                blueTeamAssists = 0
-
-                redTeamWardsPlaced = 0
-                redTeamWardsDestroyed = 0
-                redTeamTowersDestroyed = 0
-                redTeamDragonsKilled = 0
-                redTeamHeraldsKilled = 0
-                redTeamVoidGrubsKilled = 0
-                redTeamKills = 0
-                redTeamDeaths = 0
-                redTeamAssists = 0
-
-                gameDuration = 0
-
-                # In case no first blood in first 15 min, later to sort out in the df
-                blueTeamFirstBlood = 2
-                redTeamFirstBlood = 2
-                # In case game was too short, later to sort out in the df
-                blueTeamWin = 2
-                redTeamWin = 2
-
-                print(matches[0], round(((lenOfMatchesToIterate - len(matches)) * 100) / lenOfMatchesToIterate, 2),
-                      '%')  # Debug printer
-
-                response = requests.get(
-                    f'https://europe.api.riotgames.com/lol/match/v5/matches/{matches[0]}/timeline?api_key={API_key}')
-                data = response.json()
-
-                # So python doesn't have to iterate over the whole dictionary each time
-                lastEvent = data['info']['frames'][-1]['events'][-1]
-
-                # Check if game is longer than 14.5 minutes (in case of early surrender or buggy return values)
-                if lastEvent['timestamp'] > 870000:
-                    # blueTeamWin redTeamWin
+    _run(API_key, get_match_data_async, input_file, output_file, resume, retry_failed, cache_dir, details)
+
+
+async def fetch_match_payload(client: RiotClient, match_id: str, kind: str = TIMELINE,
+                              cache: TimelineCache = None) -> dict:
+    """
+    Returns the timeline or the match details of a match, reading through the cache if one is given.
+
+    Args:
+    :argument: client (RiotClient): Client used on a cache miss.
+    :argument: match_id (str): Match ID.
+    :argument: kind (str): TIMELINE or MATCH.
+    :argument: cache (TimelineCache): Raw payload cache, None to always download.
+
+    Returns:
+    :return: dict: Decoded payload.
+    """
+    if cache is not None:
+        payload = cache.get(match_id, kind)
+        if payload is not None:
+            count('cache_hits')
+            return payload
+    path = f'/lol/match/v5/matches/{match_id}' + ('/timeline' if kind == TIMELINE else '')
+    raw = await client.get(regional_route(match_id), path, f'match-v5.{kind}', raw=True)
+    if cache is not None:
+        cache.put(match_id, kind, raw)
+    with timed('parse_seconds'):
+        return json.loads(raw)
+
+
+@instrumented('get_match_data')
+async def get_match_data_async(client: RiotClient, input_file: str, output_file: str, resume: bool = True,
+                               retry_failed: bool = False, cache_dir: str = None, details: bool = False) -> None:
+    """
+    Asynchronous version of get_match_data. Timelines are downloaded concurrently and rows are written
+    in the order the downloads finish.
+    """
+    cache = TimelineCache(cache_dir) if cache_dir is not None else None
+    with MatchLedger(output_file + '.ledger') as ledger:
+        if not resume:
+            ledger.reset()
+        elif retry_failed:
+            ledger.retry_failed()
+        with open(input_file, 'r') as file_1:
+            ledger.add(line.strip() for line in file_1 if line.strip())
+
+        lenOfMatchesToIterate = sum(ledger.counts().values())  # Percentage delete later
+        matchesDone = ledger.counts()[DONE]
+
+        async def fetch(match_id: str) -> dict:
+            timeline = await fetch_match_payload(client, match_id, TIMELINE, cache)
+            if details and cache is not None and not cache.contains(match_id, MATCH):
+                await fetch_match_payload(client, match_id, MATCH, cache)  # Only kept in the cache
+            return timeline
+
+        with open(output_file, 'a' if resume else 'w') as file_2:  # A fresh ledger writes every match again
+            writer = csv.writer(file_2, delimiter=',', lineterminator='\n')
+
+            # Iterate over matches while there are still matches waiting for a (re)try
+            while (wait := ledger.next_retry_in()) is not None:
+                await asyncio.sleep(wait)
+                queue = deque(ledger.ready())
+                # Every region has its own rate limits, so each of them can have as many requests in flight
+                routes = set()
+                for match_id in queue:
+                    try:
+                        routes.add(regional_route(match_id))
+                    except KeyError:  # Fails again when fetched, the ledger records why
+                        pass
+                concurrency = sum(client.max_in_flight(route) for route in routes)
+                async for match_id, data in _map_concurrently(fetch, _drain(queue), max(concurrency, 1)):
+                    # API call sometimes returns error for no reason at all, the match is retried after a backoff
                     try:
-                        if lastEvent['winningTeam'] == 100:
-                            blueTeamWin = 1
-                            redTeamWin = 0
-                        elif lastEvent['winningTeam'] == 200:
-                            blueTeamWin = 0
-                            redTeamWin = 1
-                        else:  # In case something is messed up to check after
-                            blueTeamWin = 2
-                            redTeamWin = 2
-                    except KeyError:
-                        blueTeamWin = 2
-                        redTeamWin = 2
-
-                    # Game duration, will be saved in seconds
-                    gameDuration = (lastEvent['timestamp']) / 1000
-
-                    x = 0  # x Equals every minute in the game
-                    while x <= 15:  # Get all information until (including) 15th minute
-
-                        # So python doesn't have to iterate over the whole dictionary each time
-                        events = data['info']['frames'][x]['events']
-
-                        # Iterates over each event in a game
-                        for y in range(len(events)):
-                            # Wards placed check
-                            if events[y]['type'] == 'WARD_PLACED':
-                                if 1 <= events[y]['creatorId'] <= 5:
-                                    blueTeamWardsPlaced += 1
-                                elif 6 <= events[y]['creatorId'] <= 10:
-                                    redTeamWardsPlaced += 1
-                            # Wards destroyed check
-                            if events[y]['type'] == 'WARD_KILL':
-                                if 1 <= events[y]['killerId'] <= 5:
-                                    blueTeamWardsDestroyed += 1
-                                elif 6 <= events[y]['killerId'] <= 10:
-                                    redTeamWardsDestroyed += 1
-                            # Towers destroyed check
-                            if events[y]['type'] == 'BUILDING_KILL':
-                                if events[y]['buildingType'] == 'TOWER_BUILDING':
-                                    if 1 <= events[y]['killerId'] <= 5:
-                                        blueTeamTowersDestroyed += 1
-                                    elif 6 <= events[y]['killerId'] <= 10:
-                                        redTeamTowersDestroyed += 1
-                            # Elite jungle monster check (Dragon / Herald / Void grubs)
-                            if events[y]['type'] == 'ELITE_MONSTER_KILL':
-                                # Dragon
-                                if events[y]['monsterType'] == 'DRAGON':
-                                    if 1 <= events[y]['killerId'] <= 5:
-                                        blueTeamDragonsKilled += 1
-                                    elif 6 <= events[y]['killerId'] <= 10:
-                                        redTeamDragonsKilled += 1
-                                # Herald
-                                if events[y]['monsterType'] == 'RIFTHERALD':
-                                    if 1 <= events[y]['killerId'] <= 5:
-                                        blueTeamHeraldsKilled += 1
-                                    elif 6 <= events[y]['killerId'] <= 10:
-                                        redTeamHeraldsKilled += 1
-                                # Void grubs
-                                if events[y]['monsterType'] == 'HORDE':
-                                    if 1 <= events[y]['killerId'] <= 5:
-                                        blueTeamVoidGrubsKilled += 1
-                                    elif 6 <= events[y]['killerId'] <= 10:
-                                        redTeamVoidGrubsKilled += 1
-                            # Kills / Deaths
-                            if events[y]['type'] == 'CHAMPION_KILL':
-                                if 1 <= events[y]['killerId'] <= 5:
-                                    blueTeamKills += 1
-                                    redTeamDeaths += 1
-                                    if 'assistingParticipantIds' in events[y]:
-                                        blueTeamAssists += len(
-                                            events[y]['assistingParticipantIds'])
-                                elif 6 <= events[y]['killerId'] <= 10:
-                                    blueTeamDeaths += 1
-                                    redTeamKills += 1
-                                    if 'assistingParticipantIds' in events[y]:
-                                        redTeamAssists += len(
-                                            events[y]['assistingParticipantIds'])
-                            # First blood check
-                            if 'killType' in events[y]:
-                                if events[y]['killType'] == 'KILL_FIRST_BLOOD':
-                                    if 1 <= events[y]['killerId'] <= 5:
-                                        blueTeamFirstBlood = 1
-                                        redTeamFirstBlood = 0
-                                    elif 6 <= events[y]['killerId'] <= 10:
-                                        blueTeamFirstBlood = 0
-                                        redTeamFirstBlood = 1
-
-                        # So python doesn't have to iterate over the whole dict each time
-                        participants = data['info']['frames'][x]['participantFrames']
-
-                        # Check timestamp values
-                        if 900000 < data['info']['frames'][x]['timestamp'] < 901000:  # See readme for range explanation
-                            for participant in participants:
-                                # Blue team
-                                if int(participant) <= 5:
-                                    blueTeamTotalGold += participants[participant][
-                                        'totalGold']
-                                    blueTeamAvgLevel += participants[participant]['level']
-                                    blueTeamTotalMinionsKilled += participants[participant][
-                                        'minionsKilled']
-                                    blueTeamTotalJungleMonstersKilled += participants[participant][
-                                        'jungleMinionsKilled']
-                                # Red team
-                                else:
-                                    redTeamTotalGold += participants[participant][
-                                        'totalGold']
-                                    redTeamAvgLevel += participants[participant]['level']
-                                    redTeamTotalMinionsKilled += participants[participant][
-                                        'minionsKilled']
-                                    redTeamTotalJungleMonstersKilled += participants[participant][
-                                        'jungleMinionsKilled']
-                        x += 1  # Increase to check next timestamp
-
-                # Get average team level
-                blueTeamAvgLevel = blueTeamAvgLevel / 5
-                redTeamAvgLevel = redTeamAvgLevel / 5
-                # Get average team cs
-                blueTeamCsPerMinute = (blueTeamTotalMinionsKilled + blueTeamTotalJungleMonstersKilled) / 15
-                redTeamCsPerMinute = (redTeamTotalMinionsKilled + redTeamTotalJungleMonstersKilled) / 15
-                # Get average team gold
-                blueTeamGoldPerMinute = blueTeamTotalGold / 15
-                redTeamGoldPerMinute = redTeamTotalGold / 15
-                # Get average wards placed
-                blueTeamWardsPlaced = blueTeamWardsPlaced / 5
-                redTeamWardsPlaced = redTeamWardsPlaced / 5
-                # Get average wards destroyed
-                blueTeamWardsDestroyed = blueTeamWardsDestroyed / 5
-                redTeamWardsDestroyed = redTeamWardsDestroyed / 5
-
-                # This will be written to csv file, some values rounded for data readability
-                writeToFile = [
-                    blueTeamTotalJungleMonstersKilled, blueTeamTotalMinionsKilled, blueTeamTowersDestroyed,
-                    blueTeamVoidGrubsKilled, round(blueTeamWardsDestroyed, 2), blueTeamDragonsKilled,
-                    blueTeamHeraldsKilled,
-                    round(blueTeamGoldPerMinute, 2), round(blueTeamWardsPlaced, 2), round(blueTeamCsPerMinute, 2),
-                    blueTeamFirstBlood,
-                    blueTeamTotalGold, round(blueTeamAvgLevel, 2), blueTeamAssists, blueTeamDeaths, blueTeamKills,
-                    blueTeamWin,
-                    redTeamTotalJungleMonstersKilled, redTeamTotalMinionsKilled, redTeamTowersDestroyed,
-                    redTeamVoidGrubsKilled, round(redTeamWardsDestroyed, 2), redTeamDragonsKilled, redTeamHeraldsKilled,
-                    round(redTeamGoldPerMinute, 2), round(redTeamWardsPlaced, 2), round(redTeamCsPerMinute, 2),
-                    redTeamFirstBlood,
-                    redTeamTotalGold, round(redTeamAvgLevel, 2), redTeamAssists, redTeamDeaths, redTeamKills,
-                    redTeamWin, gameDuration
-                ]
-
-                matches.pop(0)  # Removes currently checked game from the list
-                writer.writerow(writeToFile)
-                time.sleep(1.21)  # Due to Riot API limitations required value is 1.2, 0.01 added for safety :)
-            except KeyError:
-                print('Key error occurred.')
-                time.sleep(5)
+                        if isinstance(data, Exception):
+                            raise data
+                        with timed('extract_seconds'):
+                            row = extract_match_row(data)
+                        writer.writerow(row)
+                        file_2.flush()  # Row has to be on disk before the ledger says it is
+                        ledger.mark_done(match_id)
+                        matchesDone += 1
+                        count('rows')
+                    except (KeyError, IndexError, TypeError, ValueError, RiotAPIError, aiohttp.ClientError,
+                            asyncio.TimeoutError) as error:
+                        # Connection errors left after the client's retries and truncated or malformed timelines
+                        # are retried like API errors, a missing match will not appear by retrying
+                        ledger.mark_failed(match_id, repr(error),
+                                           retry=not (isinstance(error, RiotAPIError) and error.status == 404))
+                        count('failed')
+                        print(f'Error getting match data from: {match_id} ({error!r})')
+                    print(match_id, round((matchesDone * 100) / lenOfMatchesToIterate, 2), '%')  # Debug printer
+
+        counts = ledger.counts()
+        print(f'Done: {counts[DONE]}, failed: {counts[FAILED]}')
+    if cache is not None:
+        cache.close()
+
+
+def _drain(queue: deque):
+    """
+    Pops items from the front of the queue until it is empty.
+    """
+    while queue:
+        yield queue.popleft()
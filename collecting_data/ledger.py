@@ -0,0 +1,118 @@
+import sqlite3
+import time
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class MatchLedger:
+    def __init__(self, path: str, max_attempts: int = 5, retry_delay: float = 5.0) -> None:
+        """
+        Persistent record of which matches were harvested, stored in a SQLite file next to the output.
+
+        Every match ID is pending, done or failed (with the reason of the last failure). Failed attempts are
+        retried with exponential backoff until max_attempts is reached, after which the match is marked failed
+        for good. Lookups go through the primary key, so skipping finished matches costs constant time.
+
+        Args:
+        :argument: path (str): Path to the SQLite ledger file.
+        :argument: max_attempts (int): Number of attempts before a match is marked failed.
+        :argument: retry_delay (float): Delay in seconds before the first retry, doubled after each attempt.
+        """
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS matches (
+                match_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL DEFAULT 0,
+                reason TEXT
+            ) WITHOUT ROWID""")
+        self.connection.execute('CREATE INDEX IF NOT EXISTS matches_status ON matches (status, next_attempt)')
+        self.connection.commit()
+
+    def __enter__(self) -> 'MatchLedger':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def add(self, match_ids) -> None:
+        """
+        Registers match IDs as pending. IDs already in the ledger keep their status.
+        """
+        self.connection.executemany(f"INSERT OR IGNORE INTO matches (match_id, status) VALUES (?, '{PENDING}')",
+                                    ((match_id,) for match_id in match_ids))
+        self.connection.commit()
+
+    def reset(self) -> None:
+        """
+        Forgets every match, used when a harvest is started from scratch.
+        """
+        self.connection.execute('DELETE FROM matches')
+        self.connection.commit()
+
+    def retry_failed(self) -> None:
+        """
+        Gives every failed match a new retry budget.
+        """
+        self.connection.execute(f"UPDATE matches SET status = '{PENDING}', attempts = 0, next_attempt = 0 "
+                                f"WHERE status = '{FAILED}'")
+        self.connection.commit()
+
+    def status(self, match_id: str) -> str:
+        """
+        Returns the status of a match, or None if it is not in the ledger.
+        """
+        row = self.connection.execute('SELECT status FROM matches WHERE match_id = ?', (match_id,)).fetchone()
+        return row[0] if row else None
+
+    def ready(self) -> list:
+        """
+        Returns the pending match IDs whose backoff has expired.
+        """
+        return [row[0] for row in self.connection.execute(
+            f"SELECT match_id FROM matches WHERE status = '{PENDING}' AND next_attempt <= ?", (time.time(),))]
+
+    def next_retry_in(self) -> float:
+        """
+        Returns the number of seconds until the next pending match can be attempted, None if nothing is pending.
+        """
+        row = self.connection.execute(
+            f"SELECT MIN(next_attempt) FROM matches WHERE status = '{PENDING}'").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def mark_done(self, match_id: str) -> None:
+        self.connection.execute(f"UPDATE matches SET status = '{DONE}', attempts = attempts + 1, reason = NULL "
+                                f"WHERE match_id = ?", (match_id,))
+        self.connection.commit()
+
+    def mark_failed(self, match_id: str, reason: str, retry: bool = True) -> None:
+        """
+        Records a failed attempt. The match is retried after a backoff unless the retry budget is spent
+        or retry is False (e.g. the match does not exist).
+        """
+        attempts = self.connection.execute('SELECT attempts FROM matches WHERE match_id = ?',
+                                           (match_id,)).fetchone()[0] + 1
+        status = PENDING if retry and attempts < self.max_attempts else FAILED
+        next_attempt = time.time() + self.retry_delay * 2 ** (attempts - 1)
+        self.connection.execute('UPDATE matches SET status = ?, attempts = ?, next_attempt = ?, reason = ? '
+                                'WHERE match_id = ?', (status, attempts, next_attempt, reason, match_id))
+        self.connection.commit()
+
+    def counts(self) -> dict:
+        """
+        Returns the number of matches in each status.
+        """
+        counts = {PENDING: 0, DONE: 0, FAILED: 0}
+        counts.update(self.connection.execute('SELECT status, COUNT(*) FROM matches GROUP BY status'))
+        return counts
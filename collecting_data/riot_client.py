@@ -0,0 +1,299 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+import aiohttp
+
+from instrumentation import count
+
+URL_TEMPLATE = 'https://{route}.api.riotgames.com'
+DEFAULT_APP_RATE_LIMIT = '20:1,100:120'  # Personal key limits, the server corrects them with the first response
+WINDOW_MARGIN = 0.05  # Seconds added to every window, covers the difference between our clock and Riot's
+
+
+class RiotAPIError(Exception):
+    def __init__(self, status: int, url: str, message: str = '') -> None:
+        """
+        Error raised when the Riot API returns a status that should not be retried.
+
+        Args:
+        :argument: status (int): HTTP status code of the response.
+        :argument: url (str): Requested URL (without the API key).
+        :argument: message (str): Response body, if any.
+        """
+        super().__init__(f'{status} for {url} {message}'.strip())
+        self.status = status
+        self.url = url
+
+
+def parse_rate_limits(header: str) -> list:
+    """
+    Parses a Riot rate limit header such as '20:1,100:120'.
+
+    Args:
+    :argument: header (str): Value of X-App-Rate-Limit or X-Method-Rate-Limit.
+
+    Returns:
+    :return: list: (requests, seconds) pairs, one per window.
+    """
+    limits = []
+    for window in header.split(','):
+        if window.strip():
+            count, seconds = window.split(':')
+            limits.append((int(count), float(seconds)))
+    return limits
+
+
+class RateLimitBucket:
+    def __init__(self, capacity: int, period: float) -> None:
+        """
+        Token bucket for a single rate limit window.
+
+        A consumed token only comes back one full period after it was used, so the bucket never allows more
+        than `capacity` requests in any `period` long interval - which is how Riot counts them.
+
+        Args:
+        :argument: capacity (int): Number of requests allowed per window.
+        :argument: period (float): Length of the window in seconds.
+        """
+        self.capacity = capacity
+        self.period = period + WINDOW_MARGIN
+        self.used = deque()  # Timestamps of consumed tokens that have not been returned yet
+
+    def _refill(self, now: float) -> None:
+        while self.used and self.used[0] <= now - self.period:
+            self.used.popleft()
+
+    def delay(self, now: float) -> float:
+        """
+        Returns the number of seconds until a token is available (0 if one is available now).
+        """
+        self._refill(now)
+        if len(self.used) < self.capacity:
+            return 0.0
+        return self.used[len(self.used) - self.capacity] + self.period - now
+
+    def consume(self, now: float) -> None:
+        self.used.append(now)
+
+    def sync(self, count: int, now: float) -> None:
+        """
+        Aligns the bucket with the request count reported by the server (X-...-Rate-Limit-Count).
+        Requests we did not send ourselves (e.g. another process using the same key) are counted as sent now.
+        """
+        self._refill(now)
+        while len(self.used) < min(count, self.capacity):
+            self.used.append(now)
+
+
+class RateLimiter:
+    def __init__(self, limits: list = None) -> None:
+        """
+        Limiter combining every window of an application or method rate limit.
+
+        Args:
+        :argument: limits (list): (requests, seconds) pairs. None means the limits are not known yet,
+                   in which case only one probing request is let through until the server reports them.
+        """
+        self.buckets = []
+        self.known = False
+        self.probing = False
+        self.blocked_until = 0.0
+        if limits is not None:
+            self.update_limits(limits)
+
+    def update_limits(self, limits: list) -> None:
+        if self.known and [(b.capacity, b.period - WINDOW_MARGIN) for b in self.buckets] == limits:
+            return
+        old = {bucket.period: bucket for bucket in self.buckets}
+        buckets = []
+        for capacity, period in limits:
+            bucket = RateLimitBucket(capacity, period)
+            if bucket.period in old:
+                bucket.used = old[bucket.period].used
+            buckets.append(bucket)
+        self.buckets = buckets
+        self.known = True
+        self.probing = False
+
+    def update_counts(self, counts: list, now: float) -> None:
+        for bucket in self.buckets:
+            for count, period in counts:
+                if bucket.period - WINDOW_MARGIN == period:
+                    bucket.sync(count, now)
+
+    def block_for(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def delay(self, now: float) -> float:
+        delay = max(0.0, self.blocked_until - now)
+        if not self.known and self.probing:
+            return max(delay, 0.05)
+        for bucket in self.buckets:
+            delay = max(delay, bucket.delay(now))
+        return delay
+
+    def consume(self, now: float) -> None:
+        if not self.known:
+            self.probing = True
+        for bucket in self.buckets:
+            bucket.consume(now)
+
+    @property
+    def burst(self) -> int:
+        """
+        Largest number of requests that may be sent at once.
+        """
+        return min((bucket.capacity for bucket in self.buckets), default=1)
+
+
+class RiotClient:
+    def __init__(self, API_key: str, app_rate_limit: str = DEFAULT_APP_RATE_LIMIT, url_template: str = URL_TEMPLATE,
+                 max_retries: int = 5, timeout: float = 30) -> None:
+        """
+        Asynchronous Riot API client shared by all collectors.
+
+        Every routing value (eun1, europe, ...) gets its own keep-alive connection pool and application rate
+        limiter, every (routing value, method) pair its own method rate limiter. Limits are read from the
+        X-App-Rate-Limit / X-Method-Rate-Limit headers and 429 responses honor Retry-After, so as many requests
+        as the key allows are kept in flight at any time.
+
+        Args:
+        :argument: API_key (str): API key for Riot Games API.
+        :argument: app_rate_limit (str): Application rate limit used until the server reports the real one.
+        :argument: url_template (str): Base URL, '{route}' is replaced with the routing value. Point it at
+                   a local mock server to run collectors offline.
+        :argument: max_retries (int): Number of retries on 429 and 5xx responses.
+        :argument: timeout (float): Total timeout of a single request in seconds.
+        """
+        self.API_key = API_key
+        self.app_rate_limit = parse_rate_limits(app_rate_limit)
+        self.url_template = url_template
+        self.max_retries = max_retries
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+        self.sessions = {}
+        self.app_limiters = {}
+        self.method_limiters = {}
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'bytes': 0, 'wait_time': 0.0}
+
+    async def __aenter__(self) -> 'RiotClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        for session in self.sessions.values():
+            await session.close()
+        self.sessions.clear()
+
+    def max_in_flight(self, route: str) -> int:
+        """
+        Number of requests that can be in flight at once for the given routing value.
+        """
+        return self._app_limiter(route).burst
+
+    def _app_limiter(self, route: str) -> RateLimiter:
+        if route not in self.app_limiters:
+            self.app_limiters[route] = RateLimiter(self.app_rate_limit)
+        return self.app_limiters[route]
+
+    def _method_limiter(self, route: str, method: str) -> RateLimiter:
+        if (route, method) not in self.method_limiters:
+            self.method_limiters[(route, method)] = RateLimiter()
+        return self.method_limiters[(route, method)]
+
+    def _session(self, route: str) -> aiohttp.ClientSession:
+        if route not in self.sessions:
+            connector = aiohttp.TCPConnector(limit=0, keepalive_timeout=60)
+            self.sessions[route] = aiohttp.ClientSession(connector=connector, headers={'X-Riot-Token': self.API_key},
+                                                         timeout=self.timeout)
+        return self.sessions[route]
+
+    async def _acquire(self, app_limiter: RateLimiter, method_limiter: RateLimiter) -> None:
+        while True:
+            now = time.monotonic()
+            delay = max(app_limiter.delay(now), method_limiter.delay(now))
+            if delay <= 0:
+                app_limiter.consume(now)
+                method_limiter.consume(now)
+                return
+            self.stats['wait_time'] += delay
+            count('rate_limit_sleep_seconds', delay)
+            await asyncio.sleep(delay)
+
+    def _read_headers(self, headers, app_limiter: RateLimiter, method_limiter: RateLimiter) -> None:
+        now = time.monotonic()
+        for limiter, prefix in ((app_limiter, 'X-App-Rate-Limit'), (method_limiter, 'X-Method-Rate-Limit')):
+            if prefix in headers:
+                limiter.update_limits(parse_rate_limits(headers[prefix]))
+            if prefix + '-Count' in headers:
+                limiter.update_counts(parse_rate_limits(headers[prefix + '-Count']), now)
+
+    async def get(self, route: str, path: str, method: str, params: dict = None, raw: bool = False):
+        """
+        Sends a rate limited GET request and returns the decoded JSON body.
+
+        Args:
+        :argument: route (str): Routing value, e.g. 'eun1' for platform or 'europe' for regional endpoints.
+        :argument: path (str): Endpoint path, e.g. '/lol/match/v5/matches/EUN1_123/timeline'.
+        :argument: method (str): Name of the endpoint method the method rate limit is tracked for,
+                   e.g. 'match-v5.timeline'.
+        :argument: params (dict): Query parameters.
+        :argument: raw (bool): Return the undecoded response body.
+
+        Returns:
+        :return: Decoded JSON response, or bytes if raw is True.
+        """
+        app_limiter = self._app_limiter(route)
+        method_limiter = self._method_limiter(route, method)
+        session = self._session(route)
+        url = self.url_template.format(route=route) + path
+        backoff = 1.0
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(app_limiter, method_limiter)
+            self.stats['requests'] += 1
+            count('requests')
+            try:
+                async with session.get(url, params=params) as response:
+                    self._read_headers(response.headers, app_limiter, method_limiter)
+                    body = await response.read()
+                    self.stats['bytes'] += len(body)
+                    count('bytes', len(body))
+                    if response.status == 200:
+                        return body if raw else json.loads(body)
+
+                    if response.status == 429:
+                        self.stats['throttled'] += 1
+                        count('throttled')
+                        retry_after = float(response.headers.get('Retry-After', backoff))
+                        limit_type = response.headers.get('X-Rate-Limit-Type', 'service')
+                        if limit_type == 'method':
+                            method_limiter.block_for(retry_after)
+                        elif limit_type == 'application':
+                            app_limiter.block_for(retry_after)
+                        else:  # Service limits are shared by everyone, only this request waits
+                            count('throttle_sleep_seconds', retry_after)
+                            await asyncio.sleep(retry_after)
+                        backoff *= 2
+                        continue
+
+                    self.stats['errors'] += 1
+                    count('errors')
+                    if response.status < 500 or attempt == self.max_retries:
+                        raise RiotAPIError(response.status, path, body.decode(errors='replace'))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                self.stats['errors'] += 1
+                count('errors')
+                if attempt == self.max_retries:
+                    raise
+            finally:
+                method_limiter.probing = False
+            count('backoff_sleep_seconds', backoff)
+            await asyncio.sleep(backoff)
+            backoff *= 2
+
+        raise RiotAPIError(429, path, 'Rate limit retries exhausted')
@@ -0,0 +1,122 @@
+import asyncio
+import csv
+import os
+
+from collecting_data.get_data import (
+    REGIONAL_ROUTES,
+    _run,
+    extract_puuids_async,
+    fetch_match_ids_async,
+    gather_summoner_ids_async,
+    get_match_data_async,
+)
+from collecting_data.riot_client import RiotClient
+from data_processing.change_format import StreamingDeduplicator
+from instrumentation import instrumented
+
+
+async def _collect_ladder(client: RiotClient, output_dir: str, platform: str, tier: str, min_players: int,
+                          state_file: str, ledger_file: str) -> str:
+    """
+    Collects the match IDs of one ladder (platform and tier).
+
+    Returns:
+    :return: str: Path to the file with the match IDs of the ladder.
+    """
+    prefix = os.path.join(output_dir, f'{platform}_{tier.lower()}')
+    await gather_summoner_ids_async(client, prefix + '_summoner_ids.txt', tier, min_players, state_file,
+                                    platform=platform)
+    await extract_puuids_async(client, prefix + '_summoner_ids.txt', prefix + '_puuids.txt', state_file,
+                               platform=platform)
+    await fetch_match_ids_async(client, prefix + '_puuids.txt', prefix + '_match_ids.txt', state_file, ledger_file,
+                                platform=platform)
+    return prefix + '_match_ids.txt'
+
+
+def _merge_match_ids(ladders: dict, output_file: str) -> int:
+    """
+    Merges the match ID files of all ladders into one de-duplicated CSV tagged with platform and tier.
+    A game played by several ladders is tagged with the first ladder it was found in.
+
+    Args:
+    :argument: ladders (dict): (platform, tier) -> path to the match IDs of the ladder.
+    :argument: output_file (str): Path to the output CSV (matchId, platform, tier).
+
+    Returns:
+    :return: int: Number of unique match IDs.
+    """
+    deduplicator = StreamingDeduplicator()
+    written = 0
+    with open(output_file, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['matchId', 'platform', 'tier'])
+        for (platform, tier), path in ladders.items():
+            with open(path, 'r') as ids:
+                match_ids = [line.strip() for line in ids if line.strip()]
+            for match_id in deduplicator.unseen(match_ids):
+                writer.writerow([match_id, platform, tier])
+                written += 1
+    return written
+
+
+def collect_regions(API_key: str, output_dir: str, platforms: list, tiers: list, min_players: int = 200,
+                    state_file: str = None, match_data_file: str = None) -> None:
+    """
+    Collects match IDs (and optionally match data) from many servers and tiers at the same time.
+
+    Every (platform, tier) ladder runs as its own task. Platforms and regions have independent rate limits in
+    the shared client, so the throughput grows with the number of servers. The match IDs of all ladders are
+    merged into '<output_dir>/match_ids.csv', de-duplicated and tagged with platform and tier, and a plain
+    '<output_dir>/match_ids.txt' that get_match_data reads - it routes every match to its region by the prefix
+    of its ID.
+
+    Args:
+    :argument: API_key (str): API key for Riot Games API.
+    :argument: output_dir (str): Directory for the per-ladder and merged files.
+    :argument: platforms (list): Platform routing values, e.g. ['eun1', 'euw1', 'na1', 'kr'].
+    :argument: tiers (list): Tiers, e.g. ['CHALLENGER', 'GRANDMASTER'].
+    :argument: min_players (int): Minimum number of players gathered per ladder.
+    :argument: state_file (str): Path to the collection state file, see fetch_match_ids and extract_puuids.
+    :argument: match_data_file (str): If given, match data of the merged match IDs is harvested into it.
+
+    Returns:
+    :return: None
+    """
+    unknown = [platform for platform in platforms if platform not in REGIONAL_ROUTES]
+    if unknown:
+        raise ValueError(f'Unknown platforms: {unknown}, expected some of {list(REGIONAL_ROUTES)}')
+    os.makedirs(output_dir, exist_ok=True)
+    ledger_file = match_data_file + '.ledger' if match_data_file is not None else None
+    _run(API_key, collect_regions_async, output_dir, platforms, tiers, min_players, state_file, ledger_file,
+         match_data_file)
+
+
+@instrumented('collect_regions')
+async def collect_regions_async(client: RiotClient, output_dir: str, platforms: list, tiers: list,
+                                min_players: int = 200, state_file: str = None, ledger_file: str = None,
+                                match_data_file: str = None) -> None:
+    """
+    Asynchronous version of collect_regions.
+    """
+    ladders = [(platform, tier) for platform in platforms for tier in tiers]
+    results = await asyncio.gather(*(_collect_ladder(client, output_dir, platform, tier, min_players, state_file,
+                                                     ledger_file) for platform, tier in ladders),
+                                   return_exceptions=True)
+
+    collected = {}
+    for ladder, result in zip(ladders, results):
+        if isinstance(result, Exception):
+            print(f'Collecting {ladder[0]} {ladder[1]} failed: {result!r}')
+        else:
+            collected[ladder] = result
+
+    merged_file = os.path.join(output_dir, 'match_ids.csv')
+    unique = _merge_match_ids(collected, merged_file)
+    with open(merged_file, 'r') as tagged, open(os.path.join(output_dir, 'match_ids.txt'), 'w') as plain:
+        next(tagged)
+        for line in tagged:
+            plain.write(line.split(',', 1)[0] + '\n')
+    print(f'{unique} unique match IDs from {len(collected)} ladders, requests sent: {client.stats["requests"]}')
+
+    if match_data_file is not None:
+        await get_match_data_async(client, os.path.join(output_dir, 'match_ids.txt'), match_data_file)
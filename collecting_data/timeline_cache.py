@@ -0,0 +1,291 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, it only makes decoding payloads faster
+    orjson = None
+
+TIMELINE = 'timeline'
+MATCH = 'match'
+
+
+def decode_payload(raw: bytes):
+    """
+    Decodes a raw cached payload (JSON), with orjson when it is installed.
+    """
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _compress(data: bytes) -> tuple:
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=6).compress(data)
+    return 'gzip', gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('This cache entry is zstd compressed, install the zstandard package to read it.')
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class TimelineCache:
+    def __init__(self, cache_dir: str, shard_size: int = 1000) -> None:
+        """
+        Local content-addressed store of raw API payloads (match timelines and match details) keyed by match ID.
+
+        Payloads are compressed (zstd when the zstandard package is installed, gzip otherwise) and appended to
+        shard files holding `shard_size` payloads each. A SQLite index maps (match ID, kind) to the SHA-256 of the
+        payload and the digest to its position in a shard, so identical payloads are stored once.
+
+        Args:
+        :argument: cache_dir (str): Directory of the cache, created if it does not exist.
+        :argument: shard_size (int): Number of payloads per shard file.
+        """
+        self.cache_dir = cache_dir
+        self.shard_size = shard_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.index = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'))
+        self.index.execute('PRAGMA journal_mode=WAL')
+        self.index.execute('PRAGMA synchronous=NORMAL')
+        self.index.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS payloads (
+                match_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                digest TEXT NOT NULL REFERENCES blobs (digest),
+                PRIMARY KEY (match_id, kind)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS blobs_shard ON blobs (shard, offset);
+        """)
+        self.index.commit()
+
+        self._shard = None  # (number, file, payloads in it) of the shard being appended to
+
+    def __enter__(self) -> 'TimelineCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._close_shard()
+        self.index.commit()
+        self.index.close()
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.cache_dir, f'shard_{shard:06d}.bin')
+
+    def _close_shard(self) -> None:
+        if self._shard is not None:
+            self._shard[1].close()
+            self._shard = None
+
+    def _writable_shard(self) -> tuple:
+        if self._shard is None or self._shard[2] >= self.shard_size:
+            self._close_shard()
+            row = self.index.execute('SELECT shard, COUNT(*) FROM blobs GROUP BY shard '
+                                     'ORDER BY shard DESC LIMIT 1').fetchone()
+            if row is None:
+                shard, count = 0, 0
+            elif row[1] >= self.shard_size:
+                shard, count = row[0] + 1, 0
+            else:
+                shard, count = row
+            self._shard = [shard, open(self.shard_path(shard), 'ab'), count]
+        return self._shard
+
+    def put(self, match_id: str, kind: str, payload: bytes) -> None:
+        """
+        Stores a raw payload.
+
+        Args:
+        :argument: match_id (str): Match ID the payload belongs to.
+        :argument: kind (str): Payload kind, TIMELINE or MATCH.
+        :argument: payload (bytes): Response body exactly as returned by the API.
+        """
+        digest = hashlib.sha256(payload).hexdigest()
+        if self.index.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone() is None:
+            codec, compressed = _compress(payload)
+            shard = self._writable_shard()
+            offset = shard[1].tell()
+            shard[1].write(compressed)
+            shard[1].flush()  # Blob has to be on disk before the index points at it
+            shard[2] += 1
+            self.index.execute('INSERT INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (digest, shard[0], offset, len(compressed), len(payload), codec, time.time()))
+        self.index.execute('INSERT OR REPLACE INTO payloads VALUES (?, ?, ?)', (match_id, kind, digest))
+        self.index.commit()
+
+    def get_raw(self, match_id: str, kind: str) -> bytes:
+        """
+        Returns the raw payload, or None if it is not cached.
+        """
+        row = self.index.execute('SELECT shard, offset, length, codec FROM payloads JOIN blobs USING (digest) '
+                                 'WHERE match_id = ? AND kind = ?', (match_id, kind)).fetchone()
+        if row is None:
+            return None
+        shard, offset, length, codec = row
+        with open(self.shard_path(shard), 'rb') as f:
+            f.seek(offset)
+            return _decompress(codec, f.read(length))
+
+    def get(self, match_id: str, kind: str):
+        """
+        Returns the decoded payload, or None if it is not cached.
+        """
+        raw = self.get_raw(match_id, kind)
+        return None if raw is None else decode_payload(raw)
+
+    def contains(self, match_id: str, kind: str) -> bool:
+        return self.index.execute('SELECT 1 FROM payloads WHERE match_id = ? AND kind = ?',
+                                  (match_id, kind)).fetchone() is not None
+
+    def match_ids(self, kind: str = TIMELINE) -> list:
+        return [row[0] for row in self.index.execute('SELECT match_id FROM payloads WHERE kind = ?', (kind,))]
+
+    def shards(self) -> list:
+        return [row[0] for row in self.index.execute('SELECT DISTINCT shard FROM blobs ORDER BY shard')]
+
+    def shard_entries(self, shard: int, kind: str = TIMELINE) -> list:
+        """
+        Returns the (match ID, offset, length, codec) entries of a shard in file order, see read_shard.
+        """
+        return self.index.execute('SELECT match_id, offset, length, codec FROM payloads JOIN blobs USING (digest) '
+                                  'WHERE shard = ? AND kind = ? ORDER BY offset', (shard, kind)).fetchall()
+
+    def detail_entries(self, shard: int) -> list:
+        """
+        Returns the (match ID, shard path, offset, length, codec) entries of the match details of the matches whose
+        timelines are in the given shard, wherever the details are stored, see read_payloads.
+        """
+        rows = self.index.execute(
+            'SELECT timelines.match_id, detail_blobs.shard, detail_blobs.offset, detail_blobs.length, '
+            'detail_blobs.codec FROM payloads AS timelines '
+            'JOIN blobs AS timeline_blobs ON timeline_blobs.digest = timelines.digest '
+            'JOIN payloads AS details ON details.match_id = timelines.match_id AND details.kind = ? '
+            'JOIN blobs AS detail_blobs ON detail_blobs.digest = details.digest '
+            'WHERE timeline_blobs.shard = ? AND timelines.kind = ? ORDER BY detail_blobs.shard, detail_blobs.offset',
+            (MATCH, shard, TIMELINE)).fetchall()
+        return [(match_id, self.shard_path(detail_shard), offset, length, codec)
+                for match_id, detail_shard, offset, length, codec in rows]
+
+    def iter_shard(self, shard: int, kind: str = TIMELINE):
+        """
+        Reads a whole shard sequentially.
+
+        Args:
+        :argument: shard (int): Shard number, see shards().
+        :argument: kind (str): Payload kind to read.
+
+        Returns:
+        :return: Generator of (match ID, raw payload) pairs.
+        """
+        return read_shard(self.shard_path(shard), self.shard_entries(shard, kind))
+
+    def stats(self) -> dict:
+        """
+        Returns the size accounting of the cache.
+        """
+        payloads, = self.index.execute('SELECT COUNT(*) FROM payloads').fetchone()
+        blobs, size, stored, shards = self.index.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0), COUNT(DISTINCT shard) '
+            'FROM blobs').fetchone()
+        on_disk = sum(os.path.getsize(self.shard_path(shard)) for shard in self.shards()
+                      if os.path.exists(self.shard_path(shard)))
+        return {'payloads': payloads, 'blobs': blobs, 'shards': shards, 'raw_bytes': size,
+                'stored_bytes': stored, 'disk_bytes': on_disk,
+                'compression_ratio': round(size / stored, 2) if stored else 0.0}
+
+    def prune(self, max_bytes: int = None, older_than: float = None) -> int:
+        """
+        Evicts whole shards, oldest first.
+
+        Args:
+        :argument: max_bytes (int): Evict shards until the compressed size of the cache fits in max_bytes.
+        :argument: older_than (float): Evict shards whose newest payload is older than this many seconds.
+
+        Returns:
+        :return: int: Number of evicted shards.
+        """
+        self._close_shard()
+        shards = self.index.execute('SELECT shard, SUM(length), MAX(stored_at) FROM blobs '
+                                    'GROUP BY shard ORDER BY shard').fetchall()
+        total = sum(row[1] for row in shards)
+        evicted = 0
+        for shard, length, newest in shards:
+            too_big = max_bytes is not None and total > max_bytes
+            too_old = older_than is not None and newest < time.time() - older_than
+            if not (too_big or too_old):
+                continue
+            self.index.execute('DELETE FROM payloads WHERE digest IN (SELECT digest FROM blobs WHERE shard = ?)',
+                               (shard,))
+            self.index.execute('DELETE FROM blobs WHERE shard = ?', (shard,))
+            self.index.commit()
+            if os.path.exists(self.shard_path(shard)):
+                os.remove(self.shard_path(shard))
+            total -= length
+            evicted += 1
+        return evicted
+
+
+def read_shard(path: str, entries: list):
+    """
+    Reads payloads from a shard file without touching the index, so worker processes can read shards
+    while the cache stays open elsewhere.
+
+    Args:
+    :argument: path (str): Path to the shard file.
+    :argument: entries (list): (match ID, offset, length, codec) entries, see TimelineCache.shard_entries.
+
+    Returns:
+    :return: Generator of (match ID, raw payload) pairs.
+    """
+    with open(path, 'rb') as f:
+        for match_id, offset, length, codec in entries:
+            f.seek(offset)
+            yield match_id, _decompress(codec, f.read(length))
+
+
+def read_payloads(entries: list):
+    """
+    Reads payloads spread over several shard files without touching the index, see TimelineCache.detail_entries.
+
+    Args:
+    :argument: entries (list): (match ID, shard path, offset, length, codec) entries.
+
+    Returns:
+    :return: Generator of (match ID, raw payload) pairs.
+    """
+    f = None
+    try:
+        for match_id, path, offset, length, codec in entries:
+            if f is None or f.name != path:
+                if f is not None:
+                    f.close()
+                f = open(path, 'rb')
+            f.seek(offset)
+            yield match_id, _decompress(codec, f.read(length))
+    finally:
+        if f is not None:
+            f.close()
@@ -0,0 +1,128 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pyarrow as pa
+
+from collecting_data.timeline_cache import TIMELINE, TimelineCache, decode_payload, read_payloads, read_shard
+from data_processing.match_store import PARTITION_COLUMNS, is_dataset, match_partition, write_dataset
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS, MATCH_ID_COLUMN, MINUTE_COLUMN, TimelineExtractor
+from instrumentation import count, instrumented
+
+FLOAT_COLUMNS = {column for column in MATCH_DATA_COLUMNS
+                 if column.endswith(('PerMinute', 'WardsPlaced', 'WardsDestroyed', 'AvgLevel'))
+                 or column == 'gameDuration'}
+MATCH_DATA_SCHEMA = pa.schema([(column, pa.float64() if column in FLOAT_COLUMNS else pa.int64())
+                               for column in MATCH_DATA_COLUMNS]
+                              + [(column, pa.string()) for column in [MATCH_ID_COLUMN] + PARTITION_COLUMNS]
+                              )  # Types csv_to_feather ends up with, then the key and the partition of the match
+SNAPSHOT_SCHEMA = MATCH_DATA_SCHEMA.append(pa.field(MINUTE_COLUMN, pa.int64()))  # Long format, a row per minute mark
+
+
+def _extract_shard(path: str, entries: list, detail_entries: list, cutoff_minute: int, minutes: list = None) -> tuple:
+    """
+    Worker of extract_bulk, turns one cache shard into an Arrow record batch.
+
+    Args:
+    :argument: path (str): Path to the shard file.
+    :argument: entries (list): Index entries of the shard, see TimelineCache.shard_entries.
+    :argument: detail_entries (list): Entries of the cached match details of its matches, see
+                                      TimelineCache.detail_entries.
+    :argument: cutoff_minute (int): Minute mark the features describe.
+    :argument: minutes (list): Minute marks of snapshots, one row per match and minute (see SNAPSHOT_SCHEMA)
+                               instead of one row per match at cutoff_minute.
+
+    Returns:
+    :return: tuple: The record batch and the number of timelines that could not be extracted.
+    """
+    extractor = TimelineExtractor(cutoff_minute)
+    schema = MATCH_DATA_SCHEMA if minutes is None else SNAPSHOT_SCHEMA
+    details = {match_id: payload for match_id, payload in read_payloads(detail_entries)}
+    columns = [[] for _ in schema]
+    failed = 0
+    for match_id, payload in read_shard(path, entries):
+        try:
+            timeline = decode_payload(payload)
+            match = [match_id] + match_partition(match_id, timeline, decode_payload(details[match_id])
+                                                 if match_id in details else None)
+            if minutes is None:
+                rows = [extractor.extract_row(timeline) + match]
+            else:
+                rows = [[record[column] for column in extractor.columns] + match + [minute]
+                        for minute, record in zip(minutes, extractor.extract_snapshots(timeline, minutes))]
+        except (KeyError, IndexError, TypeError, ValueError):
+            failed += 1
+            continue
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+    batch = pa.RecordBatch.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                       schema=schema)
+    return batch, failed
+
+
+@instrumented()
+def extract_bulk(cache_dir: str, output_file: str, cutoff_minute: int = 15, workers: int = None,
+                 minutes: list = None) -> int:
+    """
+    Extracts the match data of every cached timeline straight into a Feather file or a partitioned dataset.
+
+    Shards of the timeline cache are spread over a process pool, each worker parses its timelines (with orjson
+    when it is installed) and sends back an Arrow record batch which is appended to the output file as soon as
+    it arrives. This replaces get_match_data's CSV + csv_to_feather when the timelines are already cached.
+    Every row also gets the ID of its match, so prepare_data can tell the matches it has already prepared, and its
+    region, patch and date (see match_store.match_partition, the patch comes from match details cached by
+    get_match_data(..., details=True)). When output_file is a dataset directory (a path without an extension) the
+    batches are written partitioned by these columns, see match_store.
+
+    With minutes, every timeline is walked once for snapshots at all of them (see
+    TimelineExtractor.extract_snapshots) and the output is in long format: a row per match and minute mark with
+    the minute in a 'minute' column, for training a model per horizon.
+
+    Args:
+    :argument: cache_dir (str): Directory of the raw timeline cache.
+    :argument: output_file (str): Path to the output Feather file or dataset directory.
+    :argument: cutoff_minute (int): Minute mark the features describe. Defaults to 15.
+    :argument: workers (int): Number of worker processes. Defaults to the number of CPUs.
+    :argument: minutes (list): Minute marks of snapshots, e.g. [5, 10, 15, 20]. cutoff_minute is ignored then.
+
+    Returns:
+    :return: int: Number of rows written.
+    """
+    with TimelineCache(cache_dir) as cache:
+        jobs = [(cache.shard_path(shard), cache.shard_entries(shard, TIMELINE), cache.detail_entries(shard))
+                for shard in cache.shards()]
+
+    schema = MATCH_DATA_SCHEMA if minutes is None else SNAPSHOT_SCHEMA
+    rows = 0
+    failed = 0
+    waited = 0.0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_extract_shard, path, entries, detail_entries, cutoff_minute, minutes)
+                   for path, entries, detail_entries in jobs if entries]
+
+        def batches():
+            nonlocal rows, failed, waited
+            for future in futures:
+                started = time.perf_counter()  # The workers parse and extract, the parent waits for them
+                batch, shard_failed = future.result()
+                waited += time.perf_counter() - started
+                rows += batch.num_rows
+                failed += shard_failed
+                yield batch
+
+        started = time.perf_counter()
+        if is_dataset(output_file):
+            write_dataset(batches(), output_file, schema)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression='lz4')
+            with pa.ipc.new_file(output_file, schema, options=options) as writer:
+                for batch in batches():
+                    writer.write_batch(batch)
+        count('worker_wait_seconds', waited)
+        count('write_seconds', time.perf_counter() - started - waited)
+
+    count('rows', rows)
+    count('failed', failed)
+    print(f'Extracted {rows} rows from {len(jobs)} shards, {failed} timelines could not be extracted')
+    return rows
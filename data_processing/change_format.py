@@ -1,6 +1,13 @@
+import os
+
+import numpy as np
 import pandas as pd
 
+from data_processing.key_set import SortedKeySet
+from instrumentation import count, instrumented
+
 
+@instrumented()
 def csv_to_feather(input_file: str, output_file: str) -> None:
     """
     Converts a CSV file to the Feather format.
@@ -15,6 +22,7 @@ def csv_to_feather(input_file: str, output_file: str) -> None:
     """
     df = pd.read_csv(input_file)
     df.to_feather(output_file)
+    count('rows', len(df))
 
 
 def feather_to_csv(input_file: str, output_file: str) -> None:
@@ -33,26 +41,106 @@ def feather_to_csv(input_file: str, output_file: str) -> None:
     df.to_csv(output_file)
 
 
-def remove_duplicates(input_file: str, output_file: str) -> None:
+class StreamingDeduplicator:
+    def __init__(self) -> None:
+        """
+        Remembers seen lines compactly. Match IDs (platform prefix + game number, e.g. EUN1_3600000000)
+        are packed into a 64-bit key - 7 bits for the prefix, 56 bits for the number - any other line is
+        remembered as it is.
+        """
+        self.prefixes = {}
+        self.keys = SortedKeySet()
+        self.other = set()
+
+    def _key(self, line: str) -> int:
+        prefix, separator, number = line.partition('_')
+        if not separator or not number.isdigit() or int(number) >= 1 << 56:
+            return -1
+        if prefix not in self.prefixes:
+            if len(self.prefixes) == 127:
+                return -1
+            self.prefixes[prefix] = len(self.prefixes) + 1
+        return self.prefixes[prefix] << 56 | int(number)
+
+    def unseen(self, lines: list) -> list:
+        """
+        Returns the lines of the chunk that were not seen before, in their original order, and remembers them.
+        """
+        keep = np.zeros(len(lines), dtype=bool)
+        keys = np.array([self._key(line) for line in lines], dtype=np.int64)
+
+        packed = np.flatnonzero(keys >= 0)
+        unique_keys, first = np.unique(keys[packed], return_index=True)  # First occurrence within the chunk
+        new = ~self.keys.contains(unique_keys)
+        self.keys.add(unique_keys[new])
+        keep[packed[first[new]]] = True
+
+        for position in np.flatnonzero(keys < 0):
+            if lines[position] not in self.other:
+                self.other.add(lines[position])
+                keep[position] = True
+
+        return [line for line, kept in zip(lines, keep) if kept]
+
+
+def _read_chunks(input_file: str, chunk_size: int):
+    with open(input_file, 'r') as f:
+        chunk = []
+        for line in f:
+            line = line.strip()
+            if line:
+                chunk.append(line)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+@instrumented()
+def remove_duplicates(input_file: str, output_file: str, exclude_files: list = None, parts: int = 1,
+                      chunk_size: int = 1_000_000) -> int:
     """
     Remove duplicates from a text file.
 
+    The file is streamed in chunks and lines are written in the order they were first seen. Match IDs are
+    remembered as packed 64-bit integers, so tens of millions of them fit in a few hundred megabytes.
+
     Args:
     input_file (str): Path to the input file containing lines of code.
-    output_file (str): Path to the output file to write unique lines.
+    output_file (str): Path to the output file to write unique lines. With parts > 1, 'ids.txt' is
+                       written as 'ids_part_1.txt' ... 'ids_part_N.txt'.
+    exclude_files (list): Files with lines harvested before (e.g. earlier unique_match_ids parts),
+                          lines found in them are left out of the output.
+    parts (int): Number of balanced output files to split the unique lines into, for parallel harvesting.
+    chunk_size (int): Number of lines processed at once.
 
     Returns:
-    None
+    int: Number of unique lines written.
     """
-    unique_lines = set()
-
-    with open(input_file, 'r') as f:
-        for line in f:
-            unique_lines.add(line.strip())
-
-    with open(output_file, 'w') as f:
-        for line in unique_lines:
-            f.write(line + '\n')
+    deduplicator = StreamingDeduplicator()
+    for exclude_file in exclude_files or []:
+        for chunk in _read_chunks(exclude_file, chunk_size):
+            deduplicator.unseen(chunk)
+
+    if parts > 1:
+        stem, extension = os.path.splitext(output_file)
+        outputs = [open(f'{stem}_part_{part}{extension}', 'w') for part in range(1, parts + 1)]
+    else:
+        outputs = [open(output_file, 'w')]
+
+    written = 0
+    try:
+        for chunk in _read_chunks(input_file, chunk_size):
+            count('rows', len(chunk))
+            for line in deduplicator.unseen(chunk):
+                outputs[written % len(outputs)].write(line + '\n')  # Round robin keeps the parts balanced
+                written += 1
+    finally:
+        for f in outputs:
+            f.close()
+    count('unique_rows', written)
+    return written
 
 
 def remove_column_names(input_file: str) -> None:
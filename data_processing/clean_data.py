@@ -1,24 +1,110 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
+from data_processing.key_set import SortedKeySet
+from data_processing.match_store import is_dataset, open_dataset, write_dataset
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS, MATCH_ID_COLUMN, MINUTE_COLUMN
+from instrumentation import count, instrumented
 
-def data_to_final(input_file: str, output_file: str) -> None:
+CHUNK_ROWS = 65_536  # Rows cleaned at once, the memory needed does not grow with the data
+VALID_MATCH = ((pc.field('blueTeamWin') != 2)  # Removing data containing incorrect values
+               & (pc.field('gameDuration') < 6000)  # Getting rid of all games longer than 100 minutes
+               & (pc.field('blueTeamGoldPerMinute') != 0)  # Removing data containing incorrect values
+               & (pc.field('redTeamGoldPerMinute') != 0))  # Removing data containing incorrect values
+
+
+def match_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    Stable 64-bit keys of matches: the hash of the match ID, or of the values of the match data columns for data
+    collected before the match ID was stored with it. The same match always gets the same key. Rows of snapshots
+    (see bulk_extract.SNAPSHOT_SCHEMA) are keyed by the match ID and the minute.
+
+    Args:
+    :argument: df (pd.DataFrame): Match data.
+
+    Returns:
+    :return: np.ndarray: uint64 key of every row.
+    """
+    if MATCH_ID_COLUMN in df and MINUTE_COLUMN in df:
+        return pd.util.hash_pandas_object(df[[MATCH_ID_COLUMN, MINUTE_COLUMN]].astype({MATCH_ID_COLUMN: str}),
+                                          index=False).to_numpy()
+    if MATCH_ID_COLUMN in df:
+        return pd.util.hash_pandas_object(df[MATCH_ID_COLUMN].astype(str), index=False).to_numpy()
+    return pd.util.hash_pandas_object(df[MATCH_DATA_COLUMNS].astype(np.float64), index=False).to_numpy()
+
+
+def key_columns(schema: pa.Schema) -> list:
+    """
+    Columns match_keys reads from a match data file with the given schema.
     """
-    Cleans and processes the input data stored in Feather format and saves the cleaned data to a new Feather file.
+    if MATCH_ID_COLUMN not in schema.names:
+        return MATCH_DATA_COLUMNS
+    return [MATCH_ID_COLUMN] + ([MINUTE_COLUMN] if MINUTE_COLUMN in schema.names else [])
+
+
+def _valid_chunks(input_file: str, chunk_rows: int):
+    """
+    Yields the rows of the input passing VALID_MATCH, in chunks of at most chunk_rows rows.
+    """
+    if is_dataset(input_file):  # Parquet is read one row group at a time, skipping those that cannot match
+        yield from open_dataset(input_file).to_batches(batch_size=chunk_rows, filter=VALID_MATCH, batch_readahead=1,
+                                                       fragment_readahead=1)
+        return
+    with pa.OSFile(input_file) as source:  # The dataset reader would load the whole Feather file at once
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            for offset in range(0, batch.num_rows, chunk_rows):
+                yield batch.slice(offset, chunk_rows).filter(VALID_MATCH)
+
+
+@instrumented()
+def data_to_final(input_file: str, output_file: str, chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    Cleans and processes the input data stored in Feather format (or a dataset, see match_store) and saves the
+    cleaned data to a new Feather file (or dataset).
+
+    The data is streamed in chunks of CHUNK_ROWS rows. Every chunk is filtered with VALID_MATCH in one pass (the
+    filter is pushed down to the reader of a dataset, which skips row groups that cannot match), then the rows of
+    matches already written are dropped and the rest is appended to the output. Matches are told apart by their
+    keys (see match_keys), kept in a sorted set of 8 bytes per match, so the memory needed stays flat however
+    large the data gets.
 
     Args:
-    :argument: input_file (str): The path to the input Feather file containing the raw data.
-    :argument: output_file (str): The path to save the cleaned data as a new Feather file.
+    :argument: input_file (str): The path to the input Feather file or dataset directory containing the raw data.
+    :argument: output_file (str): The path to save the cleaned data as a new Feather file or dataset directory.
+    :argument: chunk_rows (int): Number of rows cleaned at once.
 
     Returns:
-    :return: None: This function does not return anything. It reads the input data from the specified Feather file,
-              performs data cleaning operations (removing incorrect values, duplicates, and outliers),
-              and saves the cleaned data to the specified location.
-    """
-    df = pd.read_feather(input_file)
-    df = df[df.blueTeamWin != 2]  # Removing data containing incorrect values
-    df = df.drop_duplicates()  # Removing duplicates in case there still are some
-    df = df[df.gameDuration < 6000]  # Getting rid of all games longer than 100 minutes
-    df = df[df.blueTeamGoldPerMinute != 0]  # Removing data containing incorrect values
-    df = df[df.redTeamGoldPerMinute != 0]  # Removing data containing incorrect values
-    df = df.reset_index(drop=True)  # Resets index, argument is to prevent pandas to create another index column
-    df.to_feather(output_file)  # Ended up with 41 282 correct match data
+    :return: int: Number of rows written. The input data is read from the specified Feather file,
+              cleaned (removing incorrect values, duplicates, and outliers) and saved to the specified location.
+    """
+    dataset = open_dataset(input_file)
+    schema = dataset.schema.remove_metadata()  # The pandas index of the input does not fit the output
+    keys_of = key_columns(schema)
+    seen = SortedKeySet()
+    clean_rows = 0
+
+    def cleaned():
+        nonlocal clean_rows
+        for chunk in _valid_chunks(input_file, chunk_rows):
+            keys = match_keys(chunk.select(keys_of).to_pandas())
+            unique_keys, first = np.unique(keys, return_index=True)  # First row of a match in the chunk
+            new = ~seen.contains(unique_keys)
+            seen.add(unique_keys[new])
+            chunk = chunk.take(pa.array(np.sort(first[new])))  # Removing duplicates, keeping the order
+            clean_rows += chunk.num_rows
+            yield pa.RecordBatch.from_arrays(chunk.columns, schema=schema)
+
+    if is_dataset(output_file):
+        write_dataset(cleaned(), output_file, schema)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression='lz4')
+        with pa.ipc.new_file(output_file, schema, options=options) as writer:
+            for batch in cleaned():
+                writer.write_batch(batch)
+    count('rows', dataset.count_rows())
+    count('clean_rows', clean_rows)  # Ended up with 41 282 correct match data
+    return clean_rows
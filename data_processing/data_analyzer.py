@@ -1,42 +1,262 @@
+import hashlib
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import seaborn as sns
 
+from data_processing.match_store import open_dataset, read_table
+
+
+def _show(output_file: str = None) -> None:
+    """
+    Shows the current figure, or saves it to output_file and closes it (e.g. on machines without a display).
+    """
+    if output_file is None:
+        plt.show()
+    else:
+        plt.savefig(output_file, bbox_inches='tight')
+        plt.close()
+
+
+def wilson_interval(wins: np.ndarray, games: np.ndarray, z: float = 1.96) -> tuple:
+    """
+    Wilson score interval of win rates, well behaved for small groups and rates close to 0 or 1.
+
+    :param wins: Number of wins of every group.
+    :param games: Number of games of every group.
+    :param z: Quantile of the standard normal distribution, 1.96 for a 95% interval.
+    :return: Lower and upper bounds of every group.
+    """
+    games = np.maximum(games, 1)
+    rate = wins / games
+    denominator = 1 + z ** 2 / games
+    centre = (rate + z ** 2 / (2 * games)) / denominator
+    margin = z * np.sqrt(rate * (1 - rate) / games + z ** 2 / (4 * games ** 2)) / denominator
+    return centre - margin, centre + margin
+
+
+def _bucket(values: np.ndarray, bins) -> tuple:
+    """
+    Assigns every value to a bucket.
+
+    :param values: Values of one feature.
+    :param bins: None for one bucket per distinct value, an int for that many quantile buckets (10 for deciles)
+                 or a sequence of bucket edges. Quantiles of more than a million values are estimated from an
+                 evenly spaced subset of them. Buckets are closed on the left, the last quantile bucket ends just
+                 above the maximum so it holds it, and values beyond given edges fall into the outer buckets.
+    :return: Bucket code of every value and the labels of the buckets.
+    """
+    if bins is None:
+        if values.dtype.kind in 'iub' and len(values):
+            low = int(values.min())
+            if int(values.max()) - low < 65536:  # Small integer ranges need no sorting
+                codes = (values - low).astype(np.intp)
+                present = np.flatnonzero(np.bincount(codes))
+                remap = np.zeros(len(present) and present[-1] + 1, dtype=np.intp)
+                remap[present] = np.arange(len(present))
+                return remap[codes], present + low
+        labels, codes = np.unique(values, return_inverse=True)
+        return codes, labels
+    if np.ndim(bins) == 0:
+        subset = values[::max(1, len(values) // 1_000_000)]
+        edges = np.quantile(subset, np.linspace(0, 1, int(bins) + 1))
+        edges[0], edges[-1] = values.min(), values.max()
+        edges = np.unique(edges)
+        if len(edges) < 2:  # A constant feature, one bucket holds all of it
+            return np.zeros(len(values), dtype=np.uint8), pd.IntervalIndex.from_arrays(edges, edges, closed='both')
+        edges[-1] = np.nextafter(edges[-1], np.inf)  # [q, max) would leave out the maximum it holds
+    else:
+        edges = np.asarray(bins, dtype=np.float64)
+        if len(edges) < 2:
+            raise ValueError(f'Bucket edges need at least two values, got {bins}')
+    if len(edges) <= 64:  # A few comparison passes beat a binary search per value
+        codes = np.zeros(len(values), dtype=np.uint8)
+        for edge in edges[1:-1]:
+            codes += values >= edge
+    else:
+        codes = np.searchsorted(edges[1:-1], values, side='right')
+    return codes, pd.IntervalIndex.from_breaks(edges, closed='left')
+
 
 class DataAnalyzer:
-    def __init__(self, file_path: str):
+    FIGURES = ('winrate', 'winrate_per_first_blood', 'gold_and_cs', 'heatmap', 'multicollinearity')
+    FIGURE_COLUMNS = {
+        'winrate': ['blueTeamWin', 'redTeamWin'],
+        'winrate_per_first_blood': ['blueTeamFirstBlood', 'redTeamFirstBlood'],
+        'gold_and_cs': ['blueTeamWin', 'gameDuration', 'blueTeamGoldPerMinute', 'blueTeamCsPerMinute'],
+        'multicollinearity': ['blueTeamWin', 'blueTeamFirstBlood', 'blueTeamGoldPerMinute',
+                              'blueTeamTotalMinionsKilled'],
+    }  # The heatmap uses the first 17 columns (the blue team)
+
+    def __init__(self, file_path: str, sample_rows: int = None, random_state: int = 777, filter=None):
         """
-        Initializes the DataAnalyzer object by loading data from a .feather file.
+        Initializes the DataAnalyzer object for a .feather file or a dataset directory (see match_store).
+
+        Nothing is loaded up front. Every analysis reads only the columns it needs from the memory-mapped file
+        (or from the partitions of the dataset the filter selects), loaded columns and computed aggregates are
+        cached between calls and the frames handed to the plots are built from read-only arrays, so one analysis
+        can never change the data another one sees.
 
-        :param file_path: Path to the .feather file containing the data.
+        :param file_path: Path to the .feather file or dataset directory containing the data.
+        :param sample_rows: If given, analyse a uniform random sample of at most this many rows instead of all of them.
+        :param random_state: Seed of the sample.
+        :param filter: Analyse only the matches it selects, e.g. match_store.match_filter(patch='14.19').
         """
-        self.df = pd.read_feather(file_path)
+        self.file_path = file_path
+        self.sample_rows = sample_rows
+        self.random_state = random_state
+        self.filter = filter
+        self.columns = open_dataset(file_path).schema.names
+        self._arrays = {}
+        self._rows = None  # Indices of the sampled rows, None when the whole file is analysed
+        self._aggregates = {}
+        self._digests = {}
+
+    def _column(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            column = read_table(self.file_path, columns=[name], filter=self.filter).column(0)
+            if self.sample_rows is not None and self.sample_rows < len(column):
+                if self._rows is None:
+                    rng = np.random.default_rng(self.random_state)
+                    self._rows = np.sort(rng.choice(len(column), self.sample_rows, replace=False))
+                column = column.take(self._rows)  # Only the pages of the sampled rows are read from the file
+            array = column.to_numpy()
+            array.flags.writeable = False
+            self._arrays[name] = array
+        return self._arrays[name]
 
-    def winrate(self) -> None:
+    def frame(self, columns: list = None) -> pd.DataFrame:
+        """
+        Returns a new DataFrame holding the given columns (all of them by default). Changing it does not affect
+        the analyzer.
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self._column(name) for name in columns})
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.frame()
+
+    def values(self, name: str) -> np.ndarray:
+        """
+        Returns the values of a column, or of a derived '<stat>Diff' column (blue minus red team), e.g.
+        'GoldPerMinuteDiff' or 'blueTeamDragonsKilledDiff'.
+        """
+        if name in self.columns or not name.endswith('Diff'):
+            return self._column(name)
+        stat = name[:-len('Diff')]
+        stat = stat[len('blueTeam'):] if stat.startswith('blueTeam') else stat
+        return self._aggregate(('diff', stat), lambda: self._column(f'blueTeam{stat}') - self._column(f'redTeam{stat}'))
+
+    def figure_columns(self, figure: str) -> list:
+        """
+        Returns the columns the given figure is computed from.
+        """
+        return list(self.columns[:17]) if figure == 'heatmap' else self.FIGURE_COLUMNS[figure]
+
+    def data_hash(self, columns: list) -> str:
+        """
+        Returns a digest of the values (of the analysed rows) in the given columns.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for name in columns:
+            if name not in self._digests:
+                self._digests[name] = hashlib.blake2b(np.ascontiguousarray(self._column(name)).tobytes(),
+                                                      digest_size=16).hexdigest()
+            digest.update(f'{name}={self._digests[name]};'.encode())
+        return digest.hexdigest()
+
+    def _aggregate(self, key, compute):
+        if key not in self._aggregates:
+            self._aggregates[key] = compute()
+        return self._aggregates[key]
+
+    def winrate_stats(self) -> tuple:
+        """
+        Returns the number of games won by the blue team and by the red team.
+        """
+        return self._aggregate('winrate', lambda: (int(np.count_nonzero(self._column('blueTeamWin') == 1)),
+                                                   int(np.count_nonzero(self._column('redTeamWin') == 1))))
+
+    def first_blood_stats(self) -> tuple:
+        """
+        Returns the percentages plotted by winrate_per_first_blood: ((blue, red) with first blood,
+        (blue, red) without first blood).
+        """
+        def compute():
+            blue, red = self._column('blueTeamFirstBlood'), self._column('redTeamFirstBlood')
+            percent = len(blue) / 100  # Number of games in one percent
+            return ((np.count_nonzero(blue == 1) / percent, np.count_nonzero(red == 1) / percent),
+                    (np.count_nonzero(blue == 0) / percent, np.count_nonzero(red == 0) / percent))
+        return self._aggregate('first_blood', compute)
+
+    def winrate_by(self, features: list, bins=None, target: str = 'blueTeamWin', z: float = 1.96) -> pd.DataFrame:
+        """
+        Computes the win rate of every combination of feature buckets in one vectorised pass.
+
+        For example analyzer.winrate_by(['GoldPerMinuteDiff', 'DragonsKilledDiff'], bins={'GoldPerMinuteDiff': 10})
+        gives the blue team win rate by gold difference decile and dragon difference. Results are cached.
+
+        :param features: Columns (or derived '<stat>Diff' columns, see values) to group by.
+        :param bins: Bucketing of the features, one spec for all of them or a dict feature -> spec. None makes one
+                     bucket per distinct value, an int that many quantile buckets, a sequence gives the bucket edges.
+        :param target: Column with 1 for a win.
+        :param z: Quantile of the standard normal distribution of the confidence interval, 1.96 for 95%.
+        :return: DataFrame with one row per non-empty group: the bucket of every feature, games, wins, winrate and
+                 the bounds of its Wilson confidence interval.
+        """
+        features = list(features)
+        if not features:
+            raise ValueError('winrate_by needs at least one feature to group by')
+        specs = [bins.get(feature) if isinstance(bins, dict) else bins for feature in features]
+        key = ('winrate_by', tuple(features), tuple(spec if np.ndim(spec) == 0 else tuple(spec) for spec in specs),
+               target, z)
+
+        def compute():
+            buckets = [self._aggregate(('bucket', feature, spec_key), lambda: _bucket(self.values(feature), spec))
+                       for feature, spec, spec_key in zip(features, specs, key[2])]
+            shape = tuple(len(labels) for _, labels in buckets)
+            groups = np.zeros(len(buckets[0][0]), dtype=np.intp)
+            for codes, labels in buckets:
+                groups *= len(labels)
+                groups += codes
+            size = int(np.prod(shape))
+            games = np.bincount(groups, minlength=size)
+            wins = np.bincount(groups, weights=self._column(target), minlength=size)
+            present = np.flatnonzero(games)
+            low, high = wilson_interval(wins[present], games[present], z)
+            result = {feature: np.asarray(labels)[index] for feature, (_, labels), index
+                      in zip(features, buckets, np.unravel_index(present, shape))}
+            result.update({'games': games[present], 'wins': wins[present].astype(np.int64),
+                           'winrate': wins[present] / games[present], 'ci_low': low, 'ci_high': high})
+            return pd.DataFrame(result)
+
+        return self._aggregate(key, compute).copy()
+
+    def winrate(self, output_file: str = None) -> None:
         """
         Displays a pie chart showing the win rate of the blue team and the red team.
+
+        :param output_file: Save the figure to this file instead of showing it.
         """
-        sizes = [self.df.blueTeamWin[self.df['blueTeamWin'] == 1].count(),
-                 self.df.redTeamWin[self.df['redTeamWin'] == 1].count()]
+        sizes = list(self.winrate_stats())
         fig, ax = plt.subplots(figsize=(7, 7))
         fig.canvas.manager.set_window_title('Winrate')
         ax.pie(sizes, labels=['Blue team wins', 'Red team wins'], autopct='%1.1f%%', startangle=270,
                colors=['#1260CC', '#ff2C2C'])
         ax.axis('equal')
         plt.title("Winrate", size=15)
-        plt.show()
+        _show(output_file)
 
-    def winrate_per_first_blood(self) -> None:
+    def winrate_per_first_blood(self, output_file: str = None) -> None:
         """
         Displays a bar chart showing the win rate of the blue team and the red team
         based on whether they achieved the first blood or not.
+
+        :param output_file: Save the figure to this file instead of showing it.
         """
-        winsWithFirstBlood = ((self.df.blueTeamWin[self.df['blueTeamFirstBlood'] == 1].count() / (len(self.df) / 100)),
-                              (self.df.redTeamWin[self.df['redTeamFirstBlood'] == 1].count()) / (len(self.df) / 100))
-        winsWithoutFirstBlood = (
-            (self.df.blueTeamWin[self.df['blueTeamFirstBlood'] == 0].count() / (len(self.df) / 100)),
-            (self.df.redTeamWin[self.df['redTeamFirstBlood'] == 0].count()) / (len(self.df) / 100))
+        winsWithFirstBlood, winsWithoutFirstBlood = self.first_blood_stats()
         print(winsWithFirstBlood, winsWithoutFirstBlood)
         ind = np.arange(2)
         plt.figure(figsize=(7, 5)).canvas.manager.set_window_title('WinrateAndFirstBloods')
@@ -50,14 +270,17 @@ class DataAnalyzer:
         plt.title('Winrate depending on first blood')
         plt.xticks(ind + width / 2, ('Blue', 'Red'))
         plt.legend(loc='best')
-        plt.show()
+        _show(output_file)
 
-    def gold_and_cs(self) -> None:
+    def gold_and_cs(self, output_file: str = None) -> None:
         """
         Displays a stack plot showing the correlation between gold per minute (GPM)
         and creep score per minute (CsPM) for the blue team in games that lasted more than 2500 seconds.
+
+        :param output_file: Save the figure to this file instead of showing it.
         """
-        df2 = self.df.loc[(self.df['blueTeamWin'] == 1) & (self.df['gameDuration'] > 2500)]
+        df = self.frame(self.figure_columns('gold_and_cs'))
+        df2 = df.loc[(df['blueTeamWin'] == 1) & (df['gameDuration'] > 2500)]
         goldPerMinute = [x / 10 for x in list(df2.blueTeamGoldPerMinute)]
         csPerMinute = list(df2.blueTeamCsPerMinute)
         xAxis = [x for x in range(len(goldPerMinute))]
@@ -68,22 +291,32 @@ class DataAnalyzer:
         ax.legend(loc='upper left')
         ax.set_title('CSPM & GPM correlation')
         plt.axis('off')
-        plt.show()
+        _show(output_file)
 
-    def heatmap(self) -> None:
+    def heatmap(self, output_file: str = None) -> None:
         """
         Displays a heatmap showing the correlation matrix of the dataset,
         excluding columns 17 to 35. (Just for one team.)
+
+        :param output_file: Save the figure to this file instead of showing it.
         """
-        self.df.drop(self.df.iloc[:, 17:35], axis=1, inplace=True)
+        columns = tuple(self.figure_columns('heatmap'))
+        correlation = self._aggregate(('corr', columns), lambda: self.frame(list(columns)).corr())
         plt.figure(figsize=(30, 15)).canvas.manager.set_window_title('Heatmap')
-        heatMap = sns.heatmap(self.df.loc[:].corr(), annot=True, cmap='jet')
+        heatMap = sns.heatmap(correlation, annot=True, cmap='jet')
         heatMap.set_xticklabels(heatMap.get_xticklabels(), rotation=45, fontsize=7)
         heatMap.set_yticklabels(heatMap.get_yticklabels(), rotation=0, fontsize=7)
-        plt.show()
+        _show(output_file)
+
+    def multicollinearity(self, output_file: str = None) -> None:
+        """
+        Displays a line plot of gold per minute and total minions killed for a small sample of games
+        won by the blue team after taking first blood.
 
-    def multicollinearity(self) -> None:
-        df = self.df.sample(frac=0.01, random_state=777)
+        :param output_file: Save the figure to this file instead of showing it.
+        """
+        df = self.frame(self.figure_columns('multicollinearity'))
+        df = df.sample(frac=0.01, random_state=777)
         df = df.sample(frac=0.1, random_state=777)
         df = df.loc[(df['blueTeamWin'] == 1)]
         df = df[df['blueTeamFirstBlood'] == 1]
@@ -97,4 +330,4 @@ class DataAnalyzer:
         plt.plot(yAxis, totalMinionsKilled, label='Total minions killed', color='#ff2C2C')
 
         plt.legend()
-        plt.show()
+        _show(output_file)
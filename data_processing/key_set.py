@@ -0,0 +1,31 @@
+import numpy as np
+
+
+class SortedKeySet:
+    def __init__(self) -> None:
+        """
+        Set of 64-bit keys kept as a few sorted numpy arrays (runs), 8 bytes per key.
+        Runs of similar size are merged, so there are at most log2(n) runs to search.
+        """
+        self.runs = []
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Tells for every key whether it is in the set.
+        """
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[positions] == keys
+        return found
+
+    def add(self, keys: np.ndarray) -> None:
+        """
+        Adds sorted keys that are not in the set yet.
+        """
+        if not len(keys):  # An empty run would break the searches of contains
+            return
+        self.runs.append(keys)
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            last = self.runs.pop()
+            self.runs[-1] = np.sort(np.concatenate((self.runs[-1], last)), kind='stable')
@@ -0,0 +1,123 @@
+"""
+Match data as a partitioned Parquet dataset, so a patch, a region or a range of days is read without the rest.
+
+A dataset is a directory of Parquet files partitioned Hive-style by region, patch and date
+(Data/final_data/region=EUN1/patch=14.19/date=2024-10-02/part-0.parquet), every row keyed by its matchId. Readers
+pass a filter built with match_filter, partitions it rules out are never opened and the row group statistics of the
+files skip the rest:
+
+    table = read_table('Data/final_data', filter=match_filter(patch='14.19', since='2024-10-01'))
+
+Single Feather files are read through the same functions, so every stage takes either.
+"""
+import datetime
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
+
+PARTITION_COLUMNS = ['region', 'patch', 'date']
+PARTITION_SCHEMA = pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+UNKNOWN = 'unknown'  # Patch or date of matches collected without match details or timestamps
+ROW_GROUP_ROWS = 65_536  # Rows per Parquet row group, the unit statistics are kept for
+
+
+def is_dataset(path: str) -> bool:
+    """
+    Tells a dataset directory from a single file: a path without a file extension is a dataset.
+    """
+    return os.path.isdir(path) or not os.path.splitext(path)[1]
+
+
+def match_partition(match_id: str, timeline: dict, details: dict = None) -> list:
+    """
+    Returns the region, patch and date of a match.
+
+    The region is the platform of the match ID. The patch (e.g. '14.19') is only known from the match details, the
+    date (UTC, e.g. '2024-10-02') is the start of the game from the details, or the end of the game from the
+    timeline when there are no details.
+
+    Args:
+    :argument: match_id (str): Match ID, e.g. 'EUN1_3600000000'.
+    :argument: timeline (dict): Decoded match-v5 timeline.
+    :argument: details (dict): Decoded match-v5 match details, None if they were not collected.
+
+    Returns:
+    :return: list: Values of PARTITION_COLUMNS.
+    """
+    info = (details or {}).get('info', {})
+    version = info.get('gameVersion')
+    timestamp = info.get('gameStartTimestamp') or info.get('gameCreation')
+    if timestamp is None:
+        timestamp = timeline['info']['frames'][-1]['events'][-1].get('realTimestamp')
+    date = UNKNOWN if timestamp is None else \
+        datetime.datetime.fromtimestamp(timestamp / 1000, datetime.timezone.utc).date().isoformat()
+    return [match_id.partition('_')[0].upper(), '.'.join(version.split('.')[:2]) if version else UNKNOWN, date]
+
+
+def match_filter(region=None, patch=None, since: str = None, until: str = None):
+    """
+    Builds a filter selecting matches by their partition.
+
+    Args:
+    :argument: region (str | list): Region or regions, e.g. 'EUN1'.
+    :argument: patch (str | list): Patch or patches, e.g. '14.19'.
+    :argument: since (str): First date, e.g. '2024-10-01'.
+    :argument: until (str): Last date, included.
+
+    Returns:
+    :return: pyarrow.compute.Expression: The filter, None when every match is selected.
+    """
+    conditions = []
+    for column, values in (('region', region), ('patch', patch)):
+        if values is not None:
+            values = [values] if isinstance(values, str) else list(values)
+            conditions.append(ds.field(column).isin(values))
+    if since is not None:
+        conditions.append(ds.field('date') >= since)  # ISO dates sort like the days they name
+    if until is not None:
+        conditions.append(ds.field('date') <= until)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def open_dataset(path: str) -> ds.Dataset:
+    """
+    Opens a dataset directory or a Feather file for scanning.
+    """
+    if is_dataset(path):
+        return ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+    return ds.dataset(path, format='feather')
+
+
+def read_table(path: str, columns: list = None, filter=None) -> pa.Table:
+    """
+    Reads the given columns (all of them by default) of the matches selected by the filter (see match_filter).
+    Feather files read without a filter are memory-mapped.
+    """
+    if filter is None and not is_dataset(path):
+        return feather.read_table(path, columns=columns, memory_map=True)
+    return open_dataset(path).to_table(columns=columns, filter=filter)
+
+
+def write_dataset(batches, output_dir: str, schema: pa.Schema) -> None:
+    """
+    Writes record batches to a dataset directory, partitioned by PARTITION_COLUMNS. Partitions already in the
+    directory are replaced when the batches have rows for them.
+
+    Args:
+    :argument: batches: Iterable of record batches with the given schema, consumed as a stream.
+    :argument: output_dir (str): Dataset directory, created if it does not exist.
+    :argument: schema (pa.Schema): Schema of the batches, including PARTITION_COLUMNS.
+
+    Returns:
+    :return: None
+    """
+    ds.write_dataset(batches, output_dir, schema=schema, format='parquet', partitioning=PARTITIONING,
+                     basename_template='part-{i}.parquet', existing_data_behavior='delete_matching',
+                     max_rows_per_group=ROW_GROUP_ROWS, min_rows_per_group=ROW_GROUP_ROWS // 4,
+                     file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'))
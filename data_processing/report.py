@@ -0,0 +1,117 @@
+import hashlib
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_processing.data_analyzer import DataAnalyzer
+from instrumentation import count, instrumented
+
+REPORT_VERSION = 1  # Bump when the figures change, so every figure of existing reports is rendered again
+ROC = 'roc_curve'
+TITLES = {
+    'winrate': 'Winrate',
+    'winrate_per_first_blood': 'Winrate depending on first blood',
+    'gold_and_cs': 'CSPM & GPM correlation',
+    'heatmap': 'Heatmap (blue team)',
+    'multicollinearity': 'Multicollinearity',
+    ROC: 'ROC Curve',
+}
+
+
+def _render(data_file: str, figure: str, output_file: str, sample_rows: int, predictions_file: str,
+            filter=None) -> str:
+    """
+    Worker of generate_report, renders one figure with the Agg backend.
+
+    Returns:
+    :return: str: Name of the rendered figure.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+    if figure == ROC:
+        from model.evaluation import plot_roc_curve
+        predictions = np.load(predictions_file)
+        plot_roc_curve(predictions['y_true'], predictions['y_pred'], output_file)
+    else:
+        getattr(DataAnalyzer(data_file, sample_rows, filter=filter), figure)(output_file)
+    return figure
+
+
+def _write_index(output_dir: str, figures: dict, data_file: str) -> None:
+    items = '\n'.join(f'<figure><figcaption>{html.escape(TITLES[figure])}</figcaption>'
+                      f'<img src="{html.escape(entry["file"])}" alt="{html.escape(figure)}"></figure>'
+                      for figure, entry in figures.items())
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write(f'<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>Match data report</title>\n'
+                f'<style>body {{font-family: sans-serif}} img {{max-width: 100%}}</style></head>\n'
+                f'<body>\n<h1>Match data report</h1>\n<p>{html.escape(data_file)}</p>\n{items}\n</body>\n</html>\n')
+
+
+@instrumented()
+def generate_report(data_file: str, output_dir: str, predictions_file: str = None, image_format: str = 'png',
+                    sample_rows: int = None, workers: int = None, force: bool = False, filter=None) -> list:
+    """
+    Renders every DataAnalyzer figure (and the ROC curve) to image files without a display and writes
+    an index.html showing them.
+
+    Figures are rendered in parallel worker processes with the Agg backend. The digest of the data each figure
+    is computed from is kept in '<output_dir>/manifest.json', a figure whose data did not change since the last
+    run is not rendered again.
+
+    Args:
+    :argument: data_file (str): Path to the Feather file or dataset directory with the final data.
+    :argument: output_dir (str): Directory of the report, created if it does not exist.
+    :argument: predictions_file (str): .npz file with the 'y_true' and 'y_pred' arrays of the test set.
+                                       The ROC curve is left out without it.
+    :argument: image_format (str): 'png' or 'svg'.
+    :argument: sample_rows (int): Analyse a random sample of this many rows, see DataAnalyzer.
+    :argument: workers (int): Number of worker processes. Defaults to the number of CPUs.
+    :argument: force (bool): Render every figure, even the unchanged ones.
+    :argument: filter (pyarrow.compute.Expression): Analyse only the matches it selects, see DataAnalyzer.
+
+    Returns:
+    :return: list: Names of the figures that were rendered.
+    """
+    if image_format not in ('png', 'svg'):
+        raise ValueError(f'Unsupported image format: {image_format}, expected png or svg')
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_file) and not force:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+
+    analyzer = DataAnalyzer(data_file, sample_rows, filter=filter)
+    digests = {figure: analyzer.data_hash(analyzer.figure_columns(figure)) for figure in DataAnalyzer.FIGURES}
+    if predictions_file is not None:
+        with open(predictions_file, 'rb') as f:
+            digests[ROC] = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+    figures = {}
+    jobs = []
+    for figure, digest in digests.items():
+        digest = f'{REPORT_VERSION}:{sample_rows}:{digest}'
+        entry = {'file': f'{figure}.{image_format}', 'digest': digest}
+        figures[figure] = entry
+        if manifest.get(figure) != entry or not os.path.exists(os.path.join(output_dir, entry['file'])):
+            jobs.append((figure, os.path.join(output_dir, entry['file'])))
+
+    rendered = []
+    if jobs:
+        with ProcessPoolExecutor(max_workers=min(len(jobs), workers or os.cpu_count())) as executor:
+            futures = [executor.submit(_render, data_file, figure, output_file, sample_rows, predictions_file, filter)
+                       for figure, output_file in jobs]
+            for future in futures:
+                rendered.append(future.result())
+
+    count('figures', len(figures))
+    count('rendered', len(rendered))
+    with open(manifest_file, 'w') as f:
+        json.dump(figures, f, indent=4)
+    _write_index(output_dir, figures, data_file)
+    print(f'Rendered {len(rendered)} of {len(figures)} figures to {output_dir}')
+    return rendered
@@ -0,0 +1,317 @@
+import operator
+
+import numpy as np
+
+MATCH_DATA_COLUMNS = [
+    'blueTeamTotalJungleMonstersKilled', 'blueTeamTotalMinionsKilled', 'blueTeamTowersDestroyed',
+    'blueTeamVoidGrubsKilled', 'blueTeamWardsDestroyed', 'blueTeamDragonsKilled', 'blueTeamHeraldsKilled',
+    'blueTeamGoldPerMinute', 'blueTeamWardsPlaced', 'blueTeamCsPerMinute', 'blueTeamFirstBlood',
+    'blueTeamTotalGold', 'blueTeamAvgLevel', 'blueTeamAssists', 'blueTeamDeaths', 'blueTeamKills', 'blueTeamWin',
+    'redTeamTotalJungleMonstersKilled', 'redTeamTotalMinionsKilled', 'redTeamTowersDestroyed',
+    'redTeamVoidGrubsKilled', 'redTeamWardsDestroyed', 'redTeamDragonsKilled', 'redTeamHeraldsKilled',
+    'redTeamGoldPerMinute', 'redTeamWardsPlaced', 'redTeamCsPerMinute', 'redTeamFirstBlood',
+    'redTeamTotalGold', 'redTeamAvgLevel', 'redTeamAssists', 'redTeamDeaths', 'redTeamKills', 'redTeamWin',
+    'gameDuration',
+]  # Columns of the match data file, in order
+MATCH_ID_COLUMN = 'matchId'  # Written after them by extract_bulk, keys the matches in prepare_data
+MINUTE_COLUMN = 'minute'  # Minute mark of a row of snapshots, see TimelineExtractor.extract_snapshots
+
+BLUE = 'blueTeam'
+RED = 'redTeam'
+TEAM_OF_PARTICIPANT = {participant: BLUE if participant <= 5 else RED for participant in range(1, 11)}
+ENEMY = {BLUE: RED, RED: BLUE}
+
+
+def _team_column(suffix: str, enemy: bool = False) -> dict:
+    """
+    Maps participant IDs to the column of their team (or of the enemy team), so handlers do no string work.
+    """
+    return {participant: (ENEMY[team] if enemy else team) + suffix
+            for participant, team in TEAM_OF_PARTICIPANT.items()}
+
+
+WARDS_PLACED = _team_column('WardsPlaced')
+WARDS_DESTROYED = _team_column('WardsDestroyed')
+TOWERS_DESTROYED = _team_column('TowersDestroyed')
+MONSTERS_KILLED = {'DRAGON': _team_column('DragonsKilled'), 'RIFTHERALD': _team_column('HeraldsKilled'),
+                   'HORDE': _team_column('VoidGrubsKilled')}
+KILLS = _team_column('Kills')
+DEATHS = _team_column('Deaths', enemy=True)
+ASSISTS = _team_column('Assists')
+FIRST_BLOOD = _team_column('FirstBlood')
+ENEMY_FIRST_BLOOD = _team_column('FirstBlood', enemy=True)
+
+# Participant frame stats summed per team at the cutoff minute, keyed by the participant ID as found in the JSON
+FRAME_COLUMNS = {str(participant): [(stat, team + counter) for stat, counter in (
+    ('totalGold', 'TotalGold'), ('level', 'AvgLevel'), ('minionsKilled', 'TotalMinionsKilled'),
+    ('jungleMinionsKilled', 'TotalJungleMonstersKilled'))] for participant, team in TEAM_OF_PARTICIPANT.items()}
+
+# Columns counted by the standard event handlers and the participant frame stats, see extract_frames
+EVENT_COLUMNS = [column for column in MATCH_DATA_COLUMNS if column in {
+    *WARDS_PLACED.values(), *WARDS_DESTROYED.values(), *TOWERS_DESTROYED.values(), *KILLS.values(),
+    *DEATHS.values(), *ASSISTS.values(),
+    *(column for columns in MONSTERS_KILLED.values() for column in columns.values())}]
+STAT_COLUMNS = list(dict.fromkeys(column for stats in FRAME_COLUMNS.values() for _, column in stats))
+
+
+def _ward_placed(event: dict, record: dict) -> None:
+    column = WARDS_PLACED.get(event['creatorId'])
+    if column:
+        record[column] += 1
+
+
+def _ward_kill(event: dict, record: dict) -> None:
+    column = WARDS_DESTROYED.get(event['killerId'])
+    if column:
+        record[column] += 1
+
+
+def _building_kill(event: dict, record: dict) -> None:
+    if event['buildingType'] == 'TOWER_BUILDING':
+        column = TOWERS_DESTROYED.get(event['killerId'])
+        if column:
+            record[column] += 1
+
+
+def _elite_monster_kill(event: dict, record: dict) -> None:
+    columns = MONSTERS_KILLED.get(event['monsterType'])
+    if columns:
+        column = columns.get(event['killerId'])
+        if column:
+            record[column] += 1
+
+
+def _champion_kill(event: dict, record: dict) -> None:
+    killer = event['killerId']
+    if killer in KILLS:
+        record[KILLS[killer]] += 1
+        record[DEATHS[killer]] += 1
+        if 'assistingParticipantIds' in event:
+            record[ASSISTS[killer]] += len(event['assistingParticipantIds'])
+
+
+def _champion_special_kill(event: dict, record: dict) -> None:
+    killer = event['killerId']
+    if killer in FIRST_BLOOD and event.get('killType') == 'KILL_FIRST_BLOOD':
+        record[FIRST_BLOOD[killer]] = 1
+        record[ENEMY_FIRST_BLOOD[killer]] = 0
+
+
+EVENT_HANDLERS = {
+    'WARD_PLACED': _ward_placed,
+    'WARD_KILL': _ward_kill,
+    'BUILDING_KILL': _building_kill,
+    'ELITE_MONSTER_KILL': _elite_monster_kill,
+    'CHAMPION_KILL': _champion_kill,
+    'CHAMPION_SPECIAL_KILL': _champion_special_kill,
+}
+
+
+class TimelineExtractor:
+    def __init__(self, cutoff_minute: int = 15) -> None:
+        """
+        Turns a match-v5 timeline into one row of match data, independently of how the timeline was obtained.
+
+        Events of frames 0..cutoff_minute are walked once and dispatched to a handler per event type, the
+        participant frames are summed at the cutoff minute. Further event handlers and whole-timeline features
+        can be registered, registered features are appended after the standard columns.
+
+        Args:
+        :argument: cutoff_minute (int): Minute mark the features describe. Defaults to 15.
+        """
+        self.cutoff_minute = cutoff_minute
+        self.event_handlers = dict(EVENT_HANDLERS)
+        self.features = {}
+
+    @property
+    def columns(self) -> list:
+        return MATCH_DATA_COLUMNS + list(self.features)
+
+    def register_event_handler(self, event_type: str, handler) -> None:
+        """
+        Registers a handler called with (event, record) for every event of the given type before the cutoff.
+        A handler added for an already handled type replaces the standard one. Counters a handler needs have
+        to be initialized by a registered feature, see register_feature.
+        """
+        self.event_handlers[event_type] = handler
+
+    def register_feature(self, name: str, function, initial=0) -> None:
+        """
+        Registers an extra column.
+
+        Args:
+        :argument: name (str): Column name.
+        :argument: function: Called with (timeline, record, cutoff_minute) after all events were handled,
+                   returns the value of the column. None keeps the value left in the record by event handlers.
+        :argument: initial: Value the column starts with, for features counted by event handlers.
+        """
+        self.features[name] = (function, initial)
+
+    def extract(self, timeline: dict) -> dict:
+        """
+        Extracts the features of a single match.
+
+        Args:
+        :argument: timeline (dict): Decoded match-v5 timeline.
+
+        Returns:
+        :return: dict: Record with a value for every column. Win columns are 2 when the game is too short or
+                 the winner is unknown and first blood columns are 2 when there was no first blood before the
+                 cutoff, so these rows can be sorted out later.
+        """
+        return self.extract_snapshots(timeline, [self.cutoff_minute])[0]
+
+    def _empty_record(self) -> dict:
+        record = dict.fromkeys(MATCH_DATA_COLUMNS, 0)
+        for team in (BLUE, RED):
+            record[team + 'FirstBlood'] = 2
+            record[team + 'Win'] = 2
+        for name, (function, initial) in self.features.items():
+            record[name] = initial
+        return record
+
+    def _finish(self, timeline: dict, record: dict, minute: int) -> dict:
+        """
+        Turns the totals of a snapshot into the columns describing the game at the given minute.
+        """
+        for team in (BLUE, RED):
+            record[team + 'AvgLevel'] = round(record[team + 'AvgLevel'] / 5, 2)
+            record[team + 'CsPerMinute'] = round(
+                (record[team + 'TotalMinionsKilled'] + record[team + 'TotalJungleMonstersKilled']) / minute, 2)
+            record[team + 'GoldPerMinute'] = round(record[team + 'TotalGold'] / minute, 2)
+            record[team + 'WardsPlaced'] = round(record[team + 'WardsPlaced'] / 5, 2)
+            record[team + 'WardsDestroyed'] = round(record[team + 'WardsDestroyed'] / 5, 2)
+
+        for name, (function, initial) in self.features.items():
+            if function is not None:
+                record[name] = function(timeline, record, minute)
+        return record
+
+    def extract_snapshots(self, timeline: dict, minutes: list) -> list:
+        """
+        Extracts the features of a single match at several minute marks in one pass over the frames.
+
+        The event counters are accumulated once from the first frame on, and a copy of them is taken (with the
+        participant frames of that minute summed in) every time the walk reaches one of the minutes, so
+        snapshots at 5, 10, 15 and 20 minutes cost about as much as the one at 20 minutes.
+
+        Args:
+        :argument: timeline (dict): Decoded match-v5 timeline.
+        :argument: minutes (list): Minute marks, e.g. [5, 10, 15, 20].
+
+        Returns:
+        :return: list: A record like extract returns for every minute mark, in the order of minutes. Games that
+                 ended before a minute mark get a record with win columns of 2 for it.
+        """
+        frames = timeline['info']['frames']
+        lastEvent = frames[-1]['events'][-1]
+        # A snapshot needs a game longer than its minute minus 30 seconds (early surrenders or buggy return values)
+        played = sorted({minute for minute in minutes if lastEvent['timestamp'] > minute * 60000 - 30000})
+        snapshots = {}
+
+        if played:
+            record = self._empty_record()
+            winningTeam = lastEvent.get('winningTeam')
+            if winningTeam == 100:
+                record[BLUE + 'Win'], record[RED + 'Win'] = 1, 0
+            elif winningTeam == 200:
+                record[BLUE + 'Win'], record[RED + 'Win'] = 0, 1
+
+            # Game duration, will be saved in seconds
+            record['gameDuration'] = lastEvent['timestamp'] / 1000
+
+            handlers = self.event_handlers
+            stats_frames = {}  # Minute -> frame whose participant stats describe it
+            for index, frame in enumerate(frames[:played[-1] + 1]):
+                for event in frame['events']:
+                    handler = handlers.get(event['type'])
+                    if handler is not None:
+                        handler(event, record)
+
+                minute, offset = divmod(frame['timestamp'], 60000)
+                if 0 < offset < 1000:  # See readme for range explanation
+                    stats_frames[minute] = frame
+
+                if index in played:
+                    snapshot = dict(record)
+                    if index in stats_frames:
+                        for participant, stats in stats_frames[index]['participantFrames'].items():
+                            for stat, column in FRAME_COLUMNS[participant]:
+                                snapshot[column] += stats[stat]
+                    snapshots[index] = self._finish(timeline, snapshot, index)
+
+        return [snapshots[minute] if minute in snapshots else self._finish(timeline, self._empty_record(), minute)
+                for minute in minutes]
+
+    def extract_frames(self, timeline: dict) -> dict:
+        """
+        Extracts the match data columns at every frame of a match, for scoring the whole game.
+
+        The events of every frame are counted on their own and the counts are summed up frame by frame
+        (np.cumsum), so frame m is described like extract describes minute m, without a pass per minute. The
+        participant stats are those of the frame itself and per-minute columns are divided by its time. First
+        blood, win, game duration and registered features are left out, the model does not use them.
+
+        Args:
+        :argument: timeline (dict): Decoded match-v5 timeline.
+
+        Returns:
+        :return: dict: EVENT_COLUMNS, STAT_COLUMNS, the per-minute columns and MINUTE_COLUMN (minutes since the
+                 start, not rounded) -> np.ndarray with a value per frame from the first minute on.
+        """
+        frames = timeline['info']['frames']
+        handlers = self.event_handlers
+        empty = self._empty_record()
+        events = operator.itemgetter(*EVENT_COLUMNS)
+        counts = []
+        stats = []
+        for frame in frames:
+            record = dict(empty)
+            for event in frame['events']:
+                handler = handlers.get(event['type'])
+                if handler is not None:
+                    handler(event, record)
+            counts.append(events(record))
+
+            totals = dict.fromkeys(STAT_COLUMNS, 0)
+            for participant, participant_stats in frame['participantFrames'].items():
+                for stat, column in FRAME_COLUMNS[participant]:
+                    totals[column] += participant_stats[stat]
+            stats.append(list(totals.values()))
+
+        # Frame 0 is the start of the game, nothing to score yet
+        columns = dict(zip(EVENT_COLUMNS, np.cumsum(np.array(counts, dtype=np.float64), axis=0)[1:].T))
+        columns.update(zip(STAT_COLUMNS, np.array(stats, dtype=np.float64).reshape(-1, len(STAT_COLUMNS))[1:].T))
+        minutes = np.array([frame['timestamp'] for frame in frames[1:]], dtype=np.float64) / 60000
+        for team in (BLUE, RED):
+            columns[team + 'AvgLevel'] = np.round(columns[team + 'AvgLevel'] / 5, 2)
+            columns[team + 'CsPerMinute'] = np.round(
+                (columns[team + 'TotalMinionsKilled'] + columns[team + 'TotalJungleMonstersKilled']) / minutes, 2)
+            columns[team + 'GoldPerMinute'] = np.round(columns[team + 'TotalGold'] / minutes, 2)
+            columns[team + 'WardsPlaced'] = np.round(columns[team + 'WardsPlaced'] / 5, 2)
+            columns[team + 'WardsDestroyed'] = np.round(columns[team + 'WardsDestroyed'] / 5, 2)
+        columns[MINUTE_COLUMN] = minutes
+        return columns
+
+    def extract_row(self, timeline: dict) -> list:
+        """
+        Extracts the features of a single match as a row ordered like self.columns.
+        """
+        record = self.extract(timeline)
+        return [record[column] for column in self.columns]
+
+
+_default_extractor = TimelineExtractor()
+
+
+def extract_match_row(timeline: dict) -> list:
+    """
+    Extracts the row written to the match data file from a timeline, using the standard 15 minutes cutoff.
+
+    Args:
+    :argument: timeline (dict): Decoded match-v5 timeline.
+
+    Returns:
+    :return: list: Row of the match data file, ordered like MATCH_DATA_COLUMNS.
+    """
+    return _default_extractor.extract_row(timeline)
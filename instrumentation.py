@@ -0,0 +1,302 @@
+"""
+Spans and counters showing where the time of a run goes, written as a machine-readable trace.
+
+Stages of the pipeline open spans, and the code inside them adds to counters of the innermost open span:
+
+    with span('prepare_data') as stage:
+        ...
+        stage.count('rows', len(df))
+
+    count('requests')                       # From anywhere below an open span
+    with timed('parse_seconds'):            # Adds the elapsed seconds to a counter
+        payload = json.loads(raw)
+
+Whole functions are wrapped in a span with the instrumented decorator. A span records its wall time, CPU time
+(the rest of the wall time was spent waiting: sleeping, on the network or the disk), the RSS at its end and how
+much it grew during the span, the peak RSS of the process so far (and whether the span raised it, only then is it
+the peak of the span) and its counters. Nothing is recorded until enable() is called, so instrumented code costs
+almost nothing in normal runs:
+
+    enable('trace.json', trace_format='chrome', profile=['train'], profiler='cprofile')
+
+writes the spans to trace.json when the run ends, as JSON lines (one span per line) or in the Chrome trace event
+format (open it in chrome://tracing or https://ui.perfetto.dev), and runs the 'train' span under cProfile
+(trace.train.1.prof, read it with pstats or snakeviz) or under a sampling profiler (trace.train.1.folded, collapsed
+stacks for flamegraph.pl or speedscope). Profiles are numbered in the order the spans end, so a stage run several
+times (every horizon, every file) gets a profile per run.
+"""
+import asyncio
+import atexit
+import contextvars
+import functools
+import itertools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter
+
+TRACE_FORMATS = ('jsonl', 'chrome')
+PROFILERS = ('cprofile', 'sample')
+SAMPLE_INTERVAL = 0.005  # Seconds between two stacks of the sampling profiler
+
+_tracer = None
+_current = contextvars.ContextVar('span', default=None)  # Innermost open span of the thread or asyncio task
+
+
+def _rss() -> tuple:
+    """
+    Current resident set size of the process and the highest one so far in bytes. The current one is None
+    where /proc is missing.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            sizes = {line.split(':')[0]: int(line.split()[1]) * 1024 for line in f
+                     if line.startswith(('VmRSS:', 'VmHWM:'))}
+        return sizes['VmRSS'], sizes['VmHWM']
+    except (OSError, KeyError):
+        return None, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class _SamplingProfiler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        """
+        Records the stack of the profiled thread every interval seconds from a background thread, as counts
+        of collapsed stacks ('module:function;module:function ...').
+        """
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self) -> None:
+        self._sampler.start()
+
+    def disable(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+
+    def dump_stats(self, output_file: str) -> None:
+        with open(output_file, 'w') as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f'{stack} {samples}\n')
+
+
+class Span:
+    def __init__(self, name: str, attributes: dict) -> None:
+        """
+        A timed stage of a run, see span.
+        """
+        self.name = name
+        self.attributes = attributes
+        self.counters = Counter()
+        self.parent = None
+        self.start = None
+        self.wall = None
+        self.cpu = None
+        self.rss = None
+        self.rss_start = None
+        self.peak_rss = None
+        self.peak_rss_start = None
+        self._profiler = None
+        self._token = None
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Adds value to the counter of the span.
+        """
+        self.counters[name] += value
+
+    def __enter__(self) -> 'Span':
+        self.parent = _current.get()
+        self._token = _current.set(self)
+        if self.name in _tracer.profile:
+            if _tracer.profiler == 'cprofile':
+                import cProfile
+                self._profiler = cProfile.Profile()
+            else:
+                self._profiler = _SamplingProfiler()
+            self._profiler.enable()
+        self.rss_start, self.peak_rss_start = _rss()
+        self._cpu_start = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self._cpu_start
+        self.rss, self.peak_rss = _rss()
+        if self._profiler is not None:
+            self._profiler.disable()
+            stem = os.path.splitext(_tracer.output_file)[0]
+            extension = 'prof' if _tracer.profiler == 'cprofile' else 'folded'
+            self._profiler.dump_stats(f'{stem}.{self.name}.{next(_tracer.profiles)}.{extension}')
+        _current.reset(self._token)
+        _tracer.record(self, exc_info[0])
+
+    def to_dict(self) -> dict:
+        record = {'name': self.name, 'parent': self.parent.name if self.parent is not None else None,
+                  'start': self.start - _tracer.started, 'wall_seconds': self.wall, 'cpu_seconds': self.cpu,
+                  'rss_mb': None if self.rss is None else self.rss / 2 ** 20,
+                  'rss_growth_mb': None if self.rss is None else (self.rss - self.rss_start) / 2 ** 20,
+                  'process_peak_rss_mb': self.peak_rss / 2 ** 20, 'raised_peak': self.peak_rss > self.peak_rss_start,
+                  'counters': dict(self.counters), **self.attributes}
+        if self.counters.get('rows') and self.wall:
+            record['rows_per_second'] = self.counters['rows'] / self.wall
+        return record
+
+
+class _NullSpan:
+    """
+    Span returned while instrumentation is disabled.
+    """
+    def count(self, name: str, value: float = 1) -> None:
+        pass
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Tracer:
+    def __init__(self, output_file: str, trace_format: str, profile: list, profiler: str) -> None:
+        self.output_file = output_file
+        self.trace_format = trace_format
+        self.profile = set(profile or [])
+        self.profiler = profiler
+        self.started = time.perf_counter()
+        self.spans = []
+        self.profiles = itertools.count(1)  # Sequence number of the next profile file
+        self._lock = threading.Lock()
+
+    def record(self, span: Span, error: type) -> None:
+        record = span.to_dict()
+        record['thread'] = threading.get_ident()
+        if error is not None:
+            record['error'] = error.__name__
+        with self._lock:
+            self.spans.append(record)
+
+    def write(self) -> None:
+        with self._lock:
+            spans = list(self.spans)
+        os.makedirs(os.path.dirname(self.output_file) or '.', exist_ok=True)
+        with open(self.output_file, 'w') as f:
+            if self.trace_format == 'jsonl':
+                for record in spans:
+                    f.write(json.dumps(record) + '\n')
+            else:
+                pid = os.getpid()
+                events = [{'name': record['name'], 'ph': 'X', 'pid': pid, 'tid': record['thread'],
+                           'ts': record['start'] * 1e6, 'dur': record['wall_seconds'] * 1e6,
+                           'args': {key: value for key, value in record.items()
+                                    if key not in ('name', 'start', 'wall_seconds', 'thread')}}
+                          for record in spans]
+                json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def enable(output_file: str, trace_format: str = 'jsonl', profile: list = None, profiler: str = 'cprofile') -> None:
+    """
+    Starts recording spans, they are written to output_file when the process exits (or on flush).
+
+    Args:
+    :argument: output_file (str): Path of the trace.
+    :argument: trace_format (str): 'jsonl' (one span per line) or 'chrome' (Chrome trace event format).
+    :argument: profile (list): Names of the spans to profile, the profiles are written next to the trace.
+    :argument: profiler (str): 'cprofile' (deterministic, every call) or 'sample' (stacks sampled every
+                               SAMPLE_INTERVAL seconds, lower overhead).
+
+    Returns:
+    :return: None
+    """
+    global _tracer
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f'Unsupported trace format: {trace_format}, expected one of {TRACE_FORMATS}')
+    if profiler not in PROFILERS:
+        raise ValueError(f'Unsupported profiler: {profiler}, expected one of {PROFILERS}')
+    if _tracer is None:
+        atexit.register(flush)
+    _tracer = _Tracer(output_file, trace_format, profile, profiler)
+
+
+def flush() -> None:
+    """
+    Writes the spans recorded so far to the trace file.
+    """
+    if _tracer is not None:
+        _tracer.write()
+
+
+def span(name: str, **attributes):
+    """
+    Opens a span, use it as a context manager. Attributes (e.g. a file name) are written with the span.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def instrumented(name: str = None):
+    """
+    Decorator running every call of a function (or coroutine function) in a span named after it.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await function(*args, **kwargs)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(span_name):
+                    return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, value: float = 1) -> None:
+    """
+    Adds value to a counter of the innermost open span, does nothing outside of spans.
+    """
+    current = _current.get()
+    if current is not None:
+        current.counters[name] += value
+
+
+class timed:
+    def __init__(self, counter: str) -> None:
+        """
+        Context manager adding the seconds spent in it to a counter of the innermost open span, for work done
+        many times inside a stage (parsing every payload, writing every row) that is too small for a span.
+        """
+        self.counter = counter
+
+    def __enter__(self) -> 'timed':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        current = _current.get()
+        if current is not None:
+            current.counters[self.counter] += time.perf_counter() - self.start
@@ -1,26 +1,304 @@
-from model.building_the_model import *
+import argparse
+import os
+import time
+
+import numpy as np
+
+import instrumentation
+from collecting_data.timeline_cache import TimelineCache
+
+# Keras, seaborn, pandas, pyarrow and aiohttp take up to seconds to import, modules needing them are imported by
+# the commands that use them, so e.g. 'cache stats' starts at once
+
+TIMELINE_CACHE_DIR = 'Data_initial/timeline_cache'
+PREDICTIONS_FILE = 'predictions.npz'  # Test set predictions, next to the prepared data of a subset or horizon
+MODEL_DIR = 'Data/model'
+CURVES_FILE = 'Data/win_curves.npz'  # Win probability at every minute of the cached games, see model.win_curves
+# Partitioned by region, patch and date once the pipeline wrote it as a dataset (see match_store), else one file
+FINAL_DATA = 'Data/final_data' if os.path.isdir('Data/final_data') else 'Data/final_data.feather'
+SNAPSHOT_DATA = 'Data/snapshots'  # Cleaned snapshots at several minute marks, see extract-bulk --minutes
+HORIZONS = [5, 10, 15, 20]
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description='Predicting League of Legends games at the 15 minutes mark.')
+    parser.add_argument('--retrain', action='store_true', help='Train the model even if a current one is saved.')
+    parser.add_argument('--trace', help='Write the time, CPU time, memory and counters of every stage to this file.')
+    parser.add_argument('--trace-format', choices=instrumentation.TRACE_FORMATS, default='jsonl',
+                        help='JSON lines, or Chrome trace events for chrome://tracing and Perfetto.')
+    parser.add_argument('--profile', nargs='+', default=[],
+                        help='Stages to profile (e.g. get_match_data train), the profiles are written next to the '
+                             'trace.')
+    parser.add_argument('--profiler', choices=instrumentation.PROFILERS, default='cprofile')
+    parser.add_argument('--region', action='append', help='Train, compare and report on matches of this region only '
+                                                          '(e.g. EUN1, repeat it for more), read from the '
+                                                          'partitioned final data.')
+    parser.add_argument('--patch', action='append', help='Use matches of this patch only (e.g. 14.19, repeat it for '
+                                                         'more).')
+    parser.add_argument('--since', help='Use matches played on this date (e.g. 2024-10-01) or later only.')
+    parser.add_argument('--until', help='Use matches played on this date or earlier only.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    cache_parser = subparsers.add_parser('cache', help='Show the size of the raw timeline cache or prune it.')
+    cache_parser.add_argument('action', choices=['stats', 'prune'])
+    cache_parser.add_argument('--cache-dir', default=TIMELINE_CACHE_DIR)
+    cache_parser.add_argument('--max-bytes', type=int, help='Evict the oldest shards until the cache fits.')
+    cache_parser.add_argument('--older-than-days', type=float, help='Evict shards not written to for this long.')
+
+    bulk_parser = subparsers.add_parser('extract-bulk', help='Extract match data from every cached timeline '
+                                                             'straight into a Feather file, or a partitioned '
+                                                             'dataset when the output has no extension.')
+    bulk_parser.add_argument('--cache-dir', default=TIMELINE_CACHE_DIR)
+    bulk_parser.add_argument('--output', default='Data_initial/match_data.feather')
+    bulk_parser.add_argument('--cutoff-minute', type=int, default=15)
+    bulk_parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the CPU count.')
+    bulk_parser.add_argument('--minutes', type=int, nargs='+',
+                             help='Write snapshots at these minute marks (a row per match and minute) instead of '
+                                  'one row per match at the cutoff minute.')
+
+    collect_parser = subparsers.add_parser('collect', help='Collect match IDs from many servers and tiers at once.')
+    collect_parser.add_argument('--platforms', nargs='+', default=['eun1', 'euw1'])
+    collect_parser.add_argument('--tiers', nargs='+', default=['CHALLENGER', 'GRANDMASTER', 'MASTER'])
+    collect_parser.add_argument('--min-players', type=int, default=200, help='Minimum players gathered per ladder.')
+    collect_parser.add_argument('--output-dir', default='Data_initial/regions')
+    collect_parser.add_argument('--state-file', default='Data_initial/collection_state.sqlite')
+    collect_parser.add_argument('--match-data-file', help='Also harvest match data of the collected matches.')
+    collect_parser.add_argument('--api-key', default=os.environ.get('RIOT_API_KEY'))
+
+    report_parser = subparsers.add_parser('report', help='Render every analysis to image files and an HTML index '
+                                                         'without a display.')
+    report_parser.add_argument('--data', default=FINAL_DATA)
+    report_parser.add_argument('--output-dir', default='report')
+    report_parser.add_argument('--predictions',
+                               help='Test set predictions saved by the pipeline, used for the ROC curve. Defaults to '
+                                    'those of the selected subset.')
+    report_parser.add_argument('--format', choices=['png', 'svg'], default='png')
+    report_parser.add_argument('--sample-rows', type=int, help='Analyse a random sample of this many rows.')
+    report_parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the CPU count.')
+    report_parser.add_argument('--force', action='store_true', help='Render unchanged figures again.')
+
+    serve_parser = subparsers.add_parser('serve', help='Serve live win probabilities of the exported model.')
+    serve_parser.add_argument('--model', help='Exported weights, defaults to those of the saved model.')
+    serve_parser.add_argument('--cache-dir', help='Timeline cache to look match IDs up in.')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+
+    curves_parser = subparsers.add_parser('curves', help='Score the win probability at every minute of every cached '
+                                                         'game with the saved model.')
+    curves_parser.add_argument('--cache-dir', default=TIMELINE_CACHE_DIR)
+    curves_parser.add_argument('--model-dir', default=MODEL_DIR)
+    curves_parser.add_argument('--output', default=CURVES_FILE)
+    curves_parser.add_argument('--workers', type=int, help='Number of worker processes, defaults to the CPU count.')
+
+    search_parser = subparsers.add_parser('search', help='Search hyperparameters of the classifiers in parallel.')
+    search_parser.add_argument('--models', nargs='+',
+                               choices=['neural_network', 'svc', 'logistic_regression', 'gradient_boosting'],
+                               default=['neural_network', 'logistic_regression', 'gradient_boosting'])
+    search_parser.add_argument('--trials', type=int, help='Random combinations per model, the whole grid if omitted.')
+    search_parser.add_argument('--threads-per-trial', type=int, default=1)
+    search_parser.add_argument('--output', default='Data/search_results.csv')
+
+    horizons_parser = subparsers.add_parser('horizons', help='Train a network per minute mark on snapshots and '
+                                                             'compare them.')
+    horizons_parser.add_argument('--minutes', type=int, nargs='+', default=HORIZONS)
+    horizons_parser.add_argument('--data', default=SNAPSHOT_DATA,
+                                 help='Cleaned snapshots, extract-bulk --minutes followed by data_to_final.')
+
+    subparsers.add_parser('baselines', help='Train the logistic regression and gradient boosting baselines and '
+                                            'compare them with the saved network.')
+
+    args = parser.parse_args()
+    if args.trace is not None:
+        instrumentation.enable(args.trace, args.trace_format, args.profile, args.profiler)
+    elif args.profile:
+        parser.error('--profile needs --trace')
+    subset = {'region': args.region, 'patch': args.patch, 'since': args.since, 'until': args.until}
+    subset = {key: value for key, value in subset.items() if value is not None}
+
+    if args.command == 'collect':
+        from collecting_data.scheduler import collect_regions
+        collect_regions(args.api_key, args.output_dir, args.platforms, args.tiers, args.min_players, args.state_file,
+                        args.match_data_file)
+    elif args.command == 'cache':
+        manage_cache(args.action, args.cache_dir, args.max_bytes, args.older_than_days)
+    elif args.command == 'extract-bulk':
+        from data_processing.bulk_extract import extract_bulk
+        extract_bulk(args.cache_dir, args.output, args.cutoff_minute, args.workers, args.minutes)
+    elif args.command == 'curves':
+        from model.win_curves import score_curves
+        score_curves(args.cache_dir, args.model_dir, args.output, args.workers)
+    elif args.command == 'report':
+        from data_processing.match_store import match_filter
+        from data_processing.report import generate_report
+        predictions = args.predictions or os.path.join(subset_locations(subset)[0], PREDICTIONS_FILE)
+        predictions = predictions if os.path.exists(predictions) else None
+        generate_report(args.data, args.output_dir, predictions, args.format, args.sample_rows, args.workers,
+                        args.force, match_filter(**subset))
+    elif args.command == 'search':
+        from model.hyperparameter_search import make_trials, search
+        print(search(make_trials(args.models, args.trials), output_file=args.output,
+                     threads_per_trial=args.threads_per_trial).head(10).to_string())
+    elif args.command == 'horizons':
+        run_horizons(args.minutes, args.data, args.retrain, subset)
+    elif args.command == 'baselines':
+        run_baselines(*subset_locations(subset))
+    elif args.command == 'serve':
+        from model.artifact import WEIGHTS_FILE
+        from model.inference import serve
+        serve(args.model or os.path.join(MODEL_DIR, WEIGHTS_FILE), args.cache_dir, args.host, args.port)
+    else:
+        run_pipeline(args.retrain, subset)
+
+
+def manage_cache(action: str, cache_dir: str, max_bytes: int = None, older_than_days: float = None) -> None:
+    """
+    Prints the size accounting of the raw timeline cache, pruning it first if asked to.
+    """
+    with TimelineCache(cache_dir) as cache:
+        if action == 'prune':
+            older_than = older_than_days * 86400 if older_than_days is not None else None
+            print('Evicted shards:', cache.prune(max_bytes=max_bytes, older_than=older_than))
+        for key, value in cache.stats().items():
+            print(f'{key}: {value}')
+
+
+def subset_locations(subset: dict) -> tuple:
+    """
+    Returns the directories of the prepared data and of the model of a subset of the matches (region, patch,
+    since and until, see match_store.match_filter), so models of different subsets do not replace each other.
+    """
+    if not subset:
+        return 'Data', MODEL_DIR
+    name = ','.join(f'{key}={"+".join(value) if isinstance(value, list) else value}' for key, value in subset.items())
+    location = os.path.join('Data', 'subsets', name)
+    os.makedirs(location, exist_ok=True)
+    return location, os.path.join(location, 'model')
+
+
+@instrumentation.instrumented('baselines')
+def run_baselines(prepared_data_location: str = 'Data', model_dir: str = MODEL_DIR) -> None:
+    """
+    Trains the baseline models on the prepared data and prints their test metrics next to the saved network's.
+    """
+    from model.artifact import read_metadata
+    from model.baselines import GradientBoostingClassifier, LogisticRegressionClassifier
+
+    paths = [f'{prepared_data_location}/prepared_data_{split}.npy' for split in ('train', 'test', 'val')]
+    for baseline in (LogisticRegressionClassifier, GradientBoostingClassifier):
+        started = time.perf_counter()
+        classifier = baseline(*paths)
+        classifier.train()
+        trained = time.perf_counter() - started
+        accuracy, precision, recall, f1, _ = classifier.evaluate(classifier.predict())
+        print(f'{baseline.__name__}: accuracy {accuracy:.4f}, precision {precision:.4f}, recall {recall:.4f}, '
+              f'F1 {f1:.4f}, trained in {trained:.2f} s')
+    metadata = read_metadata(model_dir)
+    if metadata is not None and metadata['metrics']:
+        metrics = metadata['metrics']
+        print('NeuralNetworkClassifier: ' + ', '.join(f'{name} {metrics[name]:.4f}' for name
+                                                      in ('accuracy', 'precision', 'recall', 'f1') if name in metrics))
+
+
+def train_network(prepared_data_location: str, model_dir: str, retrain: bool = False) -> tuple:
+    """
+    Trains a NeuralNetworkClassifier on the prepared data in the given directory, or loads the model saved in
+    model_dir when it was trained on the same data and hyperparameters, and predicts the test set.
+
+    Returns:
+    :return: tuple: The test targets, the predictions and the trained classifier (None when the saved model was
+             used).
+    """
+    from model.artifact import DEFAULT_HYPERPARAMETERS, data_hash, is_current, load_artifact
+    from model.feature_engineering import load_prepared_data
+
+    train_file = f'{prepared_data_location}/prepared_data_train.npy'
+    val_file = f'{prepared_data_location}/prepared_data_val.npy'
+    test_file = f'{prepared_data_location}/prepared_data_test.npy'
+    test_values, test_win = load_prepared_data(test_file)
+
+    if not retrain and is_current(model_dir, data_hash(train_file, val_file), DEFAULT_HYPERPARAMETERS):
+        # Reuse the saved model, no TensorFlow needed
+        model, metadata = load_artifact(model_dir)
+        print(f"Using the model trained at {metadata['created']}")
+        return test_win, model.predict(test_values), None
+
+    from model.building_the_model import NeuralNetworkClassifier
+    classifier = NeuralNetworkClassifier(train_file, test_file, val_file)
+
+    # Train the model
+    classifier.train()
+
+    # Make predictions
+    return test_win, classifier.predict().ravel(), classifier
+
+
+def evaluate_network(test_win: np.ndarray, predictions: np.ndarray, classifier, model_dir: str) -> tuple:
+    """
+    Computes the test metrics of train_network's predictions and saves a newly trained classifier with them.
+    """
+    from model.evaluation import evaluate_predictions
+
+    accuracy, precision, recall, f1, conf_matrix = evaluate_predictions(test_win, predictions)
+    if classifier is not None:
+        classifier.save(model_dir, {'accuracy': accuracy, 'precision': precision, 'recall': recall, 'f1': f1,
+                                    'confusion_matrix': conf_matrix.tolist()})
+    return accuracy, precision, recall, f1, conf_matrix
+
+
+@instrumentation.instrumented('horizons')
+def run_horizons(minutes: list, data_file: str = SNAPSHOT_DATA, retrain: bool = False, subset: dict = None) -> None:
+    """
+    Trains one network per minute mark on the snapshots of data_file (see extract_bulk with minutes) and prints
+    their test metrics, to see how early the winner can be told.
+    """
+    from data_processing.match_store import match_filter
+    from model.feature_engineering import prepare_horizons
+
+    location, _ = subset_locations(subset)
+    locations = prepare_horizons(data_file, f'{location}/horizons', minutes, filter=match_filter(**subset or {}))
+    for minute, prepared_data_location in locations.items():
+        with instrumentation.span('horizon', minute=minute):
+            test_win, predictions, classifier = train_network(prepared_data_location,
+                                                              f'{prepared_data_location}/model', retrain)
+            np.savez(os.path.join(prepared_data_location, PREDICTIONS_FILE), y_true=test_win, y_pred=predictions)
+            accuracy, precision, recall, f1, _ = evaluate_network(test_win, predictions, classifier,
+                                                                  f'{prepared_data_location}/model')
+        print(f'{minute} minutes: accuracy {accuracy:.4f}, precision {precision:.4f}, recall {recall:.4f}, '
+              f'F1 {f1:.4f}, {len(test_win)} test matches')
+
+
+@instrumentation.instrumented('pipeline')
+def run_pipeline(retrain: bool = False, subset: dict = None) -> None:
     summoner_ids_file = 'test_summoner_ids.txt'
     puuids_file = 'test_puuids.txt'
+    raw_match_ids_file = 'Data_initial/match_ids.txt'
+    unique_match_ids_file = 'Data_initial/unique_match_ids.txt'
     match_ids_file = 'Data_initial/unique_match_ids_part_4.txt'
+    collection_state_file = 'Data_initial/collection_state.sqlite'
     csv_data_file = 'Data_initial/match_data.csv'
     feather_data_file = 'Data_initial/match_data.feather'
-    final_data_file = 'Data/final_data.feather'
+    match_dataset = 'Data_initial/match_data'  # Partitioned by region, patch and date, see match_store
+    final_data_file = FINAL_DATA
     preview_csv_file = 'Data_initial/preview_data.csv'
-    prepared_data_location = 'Data'
+    prepared_data_location, model_dir = subset_locations(subset)
     Key = 'RIOT_API_KEY'
     tier = 'CHALLENGER'
     min_summoners = 150
 
-    #  gather_summoner_ids(API_key=Key, output_file=summoner_ids_file, tier=tier, min_players=min_summoners)
-    #  extract_puuids(API_key=Key, input_file=summoner_ids_file, output_file=puuids_file)
-    #  fetch_match_ids(API_key=Key, input_file=puuids_file, output_file=match_ids_file)
-    #  remove_duplicates(match_ids_file)
-    #  get_match_data(API_key=Key, input_file=match_ids_file, output_file=csv_data_file)
+    #  gather_summoner_ids(API_key=Key, output_file=summoner_ids_file, tier=tier, min_players=min_summoners,
+    #                      state_file=collection_state_file)
+    #  extract_puuids(API_key=Key, input_file=summoner_ids_file, output_file=puuids_file,
+    #                 state_file=collection_state_file)
+    #  fetch_match_ids(API_key=Key, input_file=puuids_file, output_file=raw_match_ids_file,
+    #                  state_file=collection_state_file, ledger_file=csv_data_file + '.ledger')
+    #  remove_duplicates(raw_match_ids_file, unique_match_ids_file, parts=4)
+    #  get_match_data(API_key=Key, input_file=match_ids_file, output_file=csv_data_file, cache_dir=TIMELINE_CACHE_DIR,
+    #                 details=True)
     #  csv_to_feather(csv_data_file, feather_data_file)
-    #  data_to_final(feather_data_file, final_data_file)
+    #  extract_bulk(TIMELINE_CACHE_DIR, match_dataset)  # Instead of the step above once timelines are cached
+    #  data_to_final(match_dataset, final_data_file)
+    #  extract_bulk(TIMELINE_CACHE_DIR, 'Data_initial/snapshots', minutes=HORIZONS)  # For run_horizons
+    #  data_to_final('Data_initial/snapshots', SNAPSHOT_DATA)
     #  feather_to_csv(final_data_file, preview_csv_file)
 
     #  analyzer = DataAnalyzer(final_data_file)
@@ -30,26 +308,23 @@ def main() -> None:
     #  analyzer.heatmap()
     #  analyzer.multicollinearity()
 
-    #  prepare_data(final_data_file, prepared_data_location)
-    #  remove_column_names('Data/prepared_data_test.csv', 'Data/prepared_data_test.csv')
-    #  remove_column_names('Data/prepared_data_train.csv', 'Data/prepared_data_train.csv')
-    #  remove_column_names('Data/prepared_data_val.csv', 'Data/prepared_data_val.csv')
+    from data_processing.match_store import match_filter
+    from model.feature_engineering import prepare_data
 
-    classifier = NeuralNetworkClassifier('Data/prepared_data_train.csv',
-                                         'Data/prepared_data_test.csv',
-                                         'Data/prepared_data_val.csv')
+    # Incremental, only prepares matches added since the last run
+    prepare_data(final_data_file, prepared_data_location, filter=match_filter(**subset or {}))
 
-    # Train the model
-    classifier.train()
+    test_win, predictions, classifier = train_network(prepared_data_location, model_dir, retrain)
+    # For the report, every subset keeps its own
+    np.savez(os.path.join(prepared_data_location, PREDICTIONS_FILE), y_true=test_win, y_pred=predictions)
 
-    # Make predictions
-    predictions = classifier.predict()
+    from model.evaluation import plot_roc_curve
 
     # Evaluate model performance
-    accuracy, precision, recall, f1, conf_matrix = classifier.evaluate(predictions)
+    accuracy, precision, recall, f1, conf_matrix = evaluate_network(test_win, predictions, classifier, model_dir)
 
     # Plot ROC curve
-    classifier.plot_roc_curve(predictions)
+    plot_roc_curve(test_win, predictions)
 
     # Print additional evaluation metrics
     print("Accuracy:", accuracy)
@@ -0,0 +1,129 @@
+"""
+Versioned artifacts of the trained network.
+
+An artifact directory holds:
+
+    model.keras            the Keras model, to keep training it (needs TensorFlow to load)
+    model_weights.npz      the same network as NumPy arrays, see model.inference.export_model
+    metadata.json          format version, feature schema, hash of the training data, hyperparameters and metrics
+
+Nothing in this module imports TensorFlow, so a saved model can be loaded and used for predictions in a fraction
+of a second.
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from model.feature_engineering import FEATURE_COLUMNS, PREPARED_DATA_VERSION, TARGET_COLUMN
+from model.inference import NumpyModel
+
+ARTIFACT_VERSION = 1
+KERAS_FILE = 'model.keras'
+WEIGHTS_FILE = 'model_weights.npz'
+METADATA_FILE = 'metadata.json'
+DEFAULT_HYPERPARAMETERS = {
+    'epochs': 300,
+    'batch_size': 1024,
+    'learning_rate': 0.001,
+    'hidden_layers': [7, 7],  # Width of every hidden Dense layer, the first one is followed by PReLU
+    'first_regularization': 0.002,  # L2 activity regularization of the first hidden layer
+    'regularization': 0.0001,  # L2 activity regularization of the other layers
+}
+
+
+def data_hash(*file_paths: str) -> str:
+    """
+    Returns a digest of the given files, e.g. the prepared training and validation sets.
+
+    A set written by prepare_data is identified by the keys of its committed matches and PREPARED_DATA_VERSION
+    (the values of a match only change with the code preparing them), so the keys file is read instead of
+    the far larger values. Other files are read whole.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for path in file_paths:
+        keys_file = path[:-len('.npy')] + '_keys.npy'
+        if os.path.basename(path).startswith('prepared_data_') and os.path.exists(keys_file):
+            digest.update(f'prepared_data v{PREPARED_DATA_VERSION} {os.path.basename(path)};'.encode())
+            digest.update(np.ascontiguousarray(np.load(keys_file, mmap_mode='r')).tobytes())
+            continue
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def array_hash(*arrays) -> str:
+    """
+    Returns a digest of the values of the given arrays, for data that does not come from files.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def write_metadata(artifact_dir: str, training_data_hash: str, hyperparameters: dict, metrics: dict = None) -> dict:
+    """
+    Writes the metadata of an artifact whose model files were already saved to artifact_dir.
+
+    Returns:
+    :return: dict: The written metadata.
+    """
+    metadata = {
+        'version': ARTIFACT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'features': FEATURE_COLUMNS,
+        'target': TARGET_COLUMN,
+        'data_hash': training_data_hash,
+        'hyperparameters': hyperparameters,
+        'metrics': metrics or {},
+    }
+    with open(os.path.join(artifact_dir, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=4)
+    return metadata
+
+
+def read_metadata(artifact_dir: str) -> dict:
+    """
+    Returns the metadata of an artifact, or None if there is no artifact in artifact_dir.
+    """
+    path = os.path.join(artifact_dir, METADATA_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def is_current(artifact_dir: str, training_data_hash: str, hyperparameters: dict) -> bool:
+    """
+    Tells whether artifact_dir holds a model trained on the same data with the same hyperparameters, in the
+    format and with the features of this version of the code.
+    """
+    metadata = read_metadata(artifact_dir)
+    return (metadata is not None and metadata['version'] == ARTIFACT_VERSION
+            and metadata['features'] == FEATURE_COLUMNS and metadata['data_hash'] == training_data_hash
+            and metadata['hyperparameters'] == hyperparameters
+            and os.path.exists(os.path.join(artifact_dir, WEIGHTS_FILE)))
+
+
+def load_artifact(artifact_dir: str) -> tuple:
+    """
+    Loads the network of an artifact for predictions, without TensorFlow.
+
+    Args:
+    :argument: artifact_dir (str): Directory the artifact was saved to, see NeuralNetworkClassifier.save.
+
+    Returns:
+    :return: tuple: The NumpyModel and the metadata of the artifact.
+    """
+    metadata = read_metadata(artifact_dir)
+    if metadata is None:
+        raise FileNotFoundError(f'No model artifact in {artifact_dir}')
+    if metadata['version'] != ARTIFACT_VERSION:
+        raise ValueError(f'Artifact version {metadata["version"]} is not supported, expected {ARTIFACT_VERSION}')
+    if metadata['features'] != FEATURE_COLUMNS:
+        raise ValueError('The artifact was trained on different features, prepare the data and train again')
+    return NumpyModel(os.path.join(artifact_dir, WEIGHTS_FILE)), metadata
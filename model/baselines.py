@@ -0,0 +1,175 @@
+"""
+Fast CPU baselines with the interface of NeuralNetworkClassifier (train, predict, evaluate, plot_roc_curve).
+
+Both read the prepared datasets memory-mapped and in chunks, so the training data never has to fit in memory:
+
+LogisticRegressionClassifier
+    Standardizes the features and trains logistic regression with SGD, one partial_fit per chunk.
+GradientBoostingClassifier
+    Histogram gradient boosting on a uniform sample of the training data, drawn chunk by chunk. Boosting cannot
+    continue on new chunks without re-binning the data under the trees already grown, so it trains once on the
+    sample, which holds every row unless the training data is larger than max_rows.
+"""
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.linear_model import SGDClassifier
+from sklearn.preprocessing import StandardScaler
+
+from instrumentation import count, instrumented
+from model.evaluation import evaluate_predictions, plot_roc_curve
+from model.feature_engineering import load_prepared_data
+
+
+def _chunks(values: np.ndarray, win: np.ndarray, chunk_size: int, order=None):
+    """
+    Yields (features, target) chunks, read from disk when the arrays are memory-mapped.
+    """
+    starts = range(0, len(values), chunk_size)
+    for start in (starts if order is None else (starts[i] for i in order)):
+        yield np.asarray(values[start:start + chunk_size]), np.asarray(win[start:start + chunk_size])
+
+
+class _BaselineClassifier:
+    DEFAULT_HYPERPARAMETERS = {}
+
+    def __init__(self, path_train: str, path_test: str, path_val: str, hyperparameters: dict = None,
+                 chunk_size: int = 100_000) -> None:
+        """
+        Initialize the classifier.
+
+        Args:
+        :argument: path_train (str): Path to the training dataset.
+        :argument: path_test (str): Path to the testing dataset.
+        :argument: path_val (str): Path to the validation dataset.
+        :argument: hyperparameters (dict): Values replacing some of DEFAULT_HYPERPARAMETERS.
+        :argument: chunk_size (int): Number of rows read from disk at once.
+
+        Returns:
+        :return: None
+        """
+        self.dataset_train_values, self.dataset_train_win = load_prepared_data(path_train)
+        self.dataset_test_values, self.dataset_test_win = load_prepared_data(path_test)
+        self.dataset_val_values, self.dataset_val_win = load_prepared_data(path_val)
+        self.hyperparameters = {**self.DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+        self.chunk_size = chunk_size
+        self.model = None
+
+    @classmethod
+    def from_arrays(cls, train: tuple, test: tuple, val: tuple, hyperparameters: dict = None,
+                    chunk_size: int = 100_000) -> '_BaselineClassifier':
+        """
+        Create a classifier from datasets already in memory, see NeuralNetworkClassifier.from_arrays.
+        """
+        classifier = cls.__new__(cls)
+        classifier.dataset_train_values, classifier.dataset_train_win = train
+        classifier.dataset_test_values, classifier.dataset_test_win = test
+        classifier.dataset_val_values, classifier.dataset_val_win = val
+        classifier.hyperparameters = {**cls.DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+        classifier.chunk_size = chunk_size
+        classifier.model = None
+        return classifier
+
+    @instrumented('predict')
+    def predict_proba(self, values: np.ndarray) -> np.ndarray:
+        """
+        Blue team win probabilities of the given feature rows, scored chunk by chunk.
+        """
+        if self.model is None:
+            raise ValueError("Model has not been trained yet.")
+
+        count('rows', len(values))
+        probabilities = np.empty(len(values))
+        for start in range(0, len(values), self.chunk_size):
+            chunk = np.asarray(values[start:start + self.chunk_size])
+            probabilities[start:start + len(chunk)] = self._predict_chunk(chunk)
+        return probabilities
+
+    def predict(self) -> np.ndarray:
+        """
+        Make predictions on the testing dataset.
+
+        Returns:
+        :return: np.ndarray: Predicted probabilities of a blue team win.
+        """
+        return self.predict_proba(self.dataset_test_values)
+
+    def evaluate(self, y_pred: np.ndarray) -> tuple:
+        """
+        Evaluate the performance of the model, see NeuralNetworkClassifier.evaluate.
+        """
+        return evaluate_predictions(self.dataset_test_win, y_pred)
+
+    def plot_roc_curve(self, y_pred: np.ndarray, output_file: str = None) -> None:
+        plot_roc_curve(self.dataset_test_win, y_pred, output_file)
+
+
+class LogisticRegressionClassifier(_BaselineClassifier):
+    DEFAULT_HYPERPARAMETERS = {'epochs': 3, 'alpha': 0.0001, 'seed': 777}
+
+    @instrumented('train')
+    def train(self) -> None:
+        """
+        Fit the scaler in one pass over the chunks, then run SGD over the chunks in a random order for the given
+        number of epochs.
+
+        Returns:
+        :return: None
+        """
+        scaler = StandardScaler()
+        for values, _ in _chunks(self.dataset_train_values, self.dataset_train_win, self.chunk_size):
+            scaler.partial_fit(values)
+
+        rng = np.random.default_rng(self.hyperparameters['seed'])
+        classifier = SGDClassifier(loss='log_loss', alpha=self.hyperparameters['alpha'],
+                                   average=True, random_state=self.hyperparameters['seed'])
+        classes = np.array([0.0, 1.0])
+        chunks = -(-len(self.dataset_train_values) // self.chunk_size)
+        count('rows', len(self.dataset_train_values) * self.hyperparameters['epochs'])
+        for _ in range(self.hyperparameters['epochs']):
+            for values, win in _chunks(self.dataset_train_values, self.dataset_train_win, self.chunk_size,
+                                       rng.permutation(chunks)):
+                shuffle = rng.permutation(len(values))
+                classifier.partial_fit(scaler.transform(values)[shuffle], win[shuffle], classes=classes)
+        self.model = (scaler, classifier)
+
+    def _predict_chunk(self, values: np.ndarray) -> np.ndarray:
+        scaler, classifier = self.model
+        return classifier.predict_proba(scaler.transform(values))[:, 1]
+
+
+class GradientBoostingClassifier(_BaselineClassifier):
+    DEFAULT_HYPERPARAMETERS = {'max_iter': 200, 'learning_rate': 0.1, 'max_leaf_nodes': 31,
+                               'l2_regularization': 0.0, 'max_rows': 1_000_000, 'seed': 777}
+
+    @instrumented('train')
+    def train(self) -> None:
+        """
+        Draw a uniform sample of at most max_rows training rows chunk by chunk and fit histogram gradient
+        boosting on it. Boosting stops early when the loss on a held-out tenth of the sample stops improving.
+
+        Returns:
+        :return: None
+        """
+        rows = len(self.dataset_train_values)
+        fraction = min(1.0, self.hyperparameters['max_rows'] / max(rows, 1))
+        rng = np.random.default_rng(self.hyperparameters['seed'])
+        sample_values, sample_win = [], []
+        for values, win in _chunks(self.dataset_train_values, self.dataset_train_win, self.chunk_size):
+            if fraction < 1.0:
+                keep = rng.random(len(values)) < fraction
+                values, win = values[keep], win[keep]
+            sample_values.append(values)
+            sample_win.append(win)
+
+        classifier = HistGradientBoostingClassifier(
+            max_iter=self.hyperparameters['max_iter'], learning_rate=self.hyperparameters['learning_rate'],
+            max_leaf_nodes=self.hyperparameters['max_leaf_nodes'],
+            l2_regularization=self.hyperparameters['l2_regularization'],
+            random_state=self.hyperparameters['seed'], early_stopping=True)
+        sample_values, sample_win = np.concatenate(sample_values), np.concatenate(sample_win)
+        count('rows', len(sample_values))
+        classifier.fit(sample_values, sample_win)
+        self.model = classifier
+
+    def _predict_chunk(self, values: np.ndarray) -> np.ndarray:
+        return self.model.predict_proba(values)[:, 1]
@@ -1,38 +1,28 @@
+import os
+
 import numpy as np
-from sklearn.metrics import (
-    accuracy_score,
-    precision_score,
-    recall_score,
-    f1_score,
-    confusion_matrix,
-    roc_curve,
-    roc_auc_score,
-)
-import matplotlib.pyplot as plt
-from keras.models import Sequential
+from keras.models import Sequential, load_model
 from keras.layers import Dense, Input, PReLU, Normalization
 from keras.optimizers import Adam
 from keras.regularizers import l2
 
-
-def _load_data(file_path: str) -> tuple:
-    """
-    Load data from a CSV file.
-
-    Args:
-    :argument: file_path (str): Path to the CSV file.
-
-    Returns:
-    :return: tuple: A tuple containing numpy arrays for features and target.
-    """
-    dataset = np.loadtxt(file_path, delimiter=',')
-    dataset_values = dataset[:, 0:13]
-    dataset_win = dataset[:, 13]
-    return dataset_values, dataset_win
+from instrumentation import count, instrumented
+from model.artifact import (
+    DEFAULT_HYPERPARAMETERS,
+    KERAS_FILE,
+    WEIGHTS_FILE,
+    array_hash,
+    data_hash,
+    read_metadata,
+    write_metadata,
+)
+from model.evaluation import evaluate_predictions, plot_roc_curve
+from model.feature_engineering import load_prepared_data as _load_data
+from model.inference import export_model
 
 
 class NeuralNetworkClassifier:
-    def __init__(self, path_train: str, path_test: str, path_val: str) -> None:
+    def __init__(self, path_train: str, path_test: str, path_val: str, hyperparameters: dict = None) -> None:
         """
         Initialize the NeuralNetworkClassifier.
 
@@ -40,6 +30,7 @@ class NeuralNetworkClassifier:
         :argument: path_train (str): Path to the training dataset.
         :argument: path_test (str): Path to the testing dataset.
         :argument: path_val (str): Path to the validation dataset.
+        :argument: hyperparameters (dict): Values replacing some of model.artifact.DEFAULT_HYPERPARAMETERS.
 
         Returns:
         :return: None
@@ -47,8 +38,35 @@ class NeuralNetworkClassifier:
         self.dataset_train_values, self.dataset_train_win = _load_data(path_train)
         self.dataset_test_values, self.dataset_test_win = _load_data(path_test)
         self.dataset_val_values, self.dataset_val_win = _load_data(path_val)
+        self.path_train, self.path_val = path_train, path_val
 
         self.model = None
+        self.hyperparameters = {**DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+
+    @classmethod
+    def from_arrays(cls, train: tuple, test: tuple, val: tuple,
+                    hyperparameters: dict = None) -> 'NeuralNetworkClassifier':
+        """
+        Create a classifier from datasets already in memory.
+
+        Args:
+        :argument: train (tuple): Features and target of the training dataset.
+        :argument: test (tuple): Features and target of the testing dataset.
+        :argument: val (tuple): Features and target of the validation dataset.
+        :argument: hyperparameters (dict): Values replacing some of model.artifact.DEFAULT_HYPERPARAMETERS.
+
+        Returns:
+        :return: NeuralNetworkClassifier: The classifier.
+        """
+        classifier = cls.__new__(cls)
+        classifier.dataset_train_values, classifier.dataset_train_win = train
+        classifier.dataset_test_values, classifier.dataset_test_win = test
+        classifier.dataset_val_values, classifier.dataset_val_win = val
+        classifier.path_train, classifier.path_val = None, None
+
+        classifier.model = None
+        classifier.hyperparameters = {**DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+        return classifier
 
     def build_model(self) -> None:
         """
@@ -57,6 +75,8 @@ class NeuralNetworkClassifier:
         Returns:
         :return: None
         """
+        hidden_layers = self.hyperparameters['hidden_layers']
+        regularization = self.hyperparameters['regularization']
         input_layer = Input(shape=(13,))
         norm_layer = Normalization()
         norm_layer.adapt(self.dataset_train_values)
@@ -64,34 +84,46 @@ class NeuralNetworkClassifier:
         model = Sequential()
         model.add(input_layer)
         model.add(norm_layer)
-        model.add(Dense(7, input_shape=(13,), activation='elu', activity_regularizer=l2(0.002)))
+        model.add(Dense(hidden_layers[0], activation='elu',
+                        activity_regularizer=l2(self.hyperparameters['first_regularization'])))
         model.add(PReLU())
-        model.add(Dense(7, activation='sigmoid', activity_regularizer=l2(0.0001)))
-        model.add(Dense(1, activation='sigmoid', activity_regularizer=l2(0.0001)))
+        for width in hidden_layers[1:]:
+            model.add(Dense(width, activation='sigmoid', activity_regularizer=l2(regularization)))
+        model.add(Dense(1, activation='sigmoid', activity_regularizer=l2(regularization)))
 
-        new_learning_rate = 0.001
+        new_learning_rate = self.hyperparameters['learning_rate']
         optimizer = Adam(learning_rate=new_learning_rate)
 
         model.compile(loss='binary_crossentropy', optimizer=optimizer, metrics=['accuracy'])
         self.model = model
 
-    def train(self, epochs: int = 300, batch_size: int = 1024) -> None:
+    @instrumented('train')
+    def train(self, epochs: int = None, batch_size: int = None, callbacks: list = None, verbose: int = 1):
         """
         Train the neural network model.
 
         Args:
-        :argument: epochs (int): Number of epochs for training.
-        :argument: batch_size (int): Batch size for training.
+        :argument: epochs (int): Number of epochs for training. Defaults to the 'epochs' hyperparameter.
+        :argument: batch_size (int): Batch size for training. Defaults to the 'batch_size' hyperparameter.
+        :argument: callbacks (list): Keras callbacks, e.g. for early stopping.
+        :argument: verbose (int): Keras verbosity.
 
         Returns:
-        :return: None
+        :return: The Keras training history.
         """
+        epochs = epochs if epochs is not None else self.hyperparameters['epochs']
+        batch_size = batch_size if batch_size is not None else self.hyperparameters['batch_size']
+        self.hyperparameters.update(epochs=epochs, batch_size=batch_size)
         if self.model is None:
             self.build_model()
 
-        self.model.fit(x=self.dataset_train_values, y=self.dataset_train_win, epochs=epochs, batch_size=batch_size,
-                       validation_data=(self.dataset_val_values, self.dataset_val_win), verbose=1)
+        count('rows', len(self.dataset_train_values) * epochs)  # Samples seen, rows_per_second is the training speed
+        count('epochs', epochs)
+        return self.model.fit(x=self.dataset_train_values, y=self.dataset_train_win, epochs=epochs,
+                              batch_size=batch_size, validation_data=(self.dataset_val_values, self.dataset_val_win),
+                              callbacks=callbacks, verbose=verbose)
 
+    @instrumented('predict')
     def predict(self) -> np.ndarray:
         """
         Make predictions using the trained model.
@@ -102,6 +134,7 @@ class NeuralNetworkClassifier:
         if self.model is None:
             raise ValueError("Model has not been trained yet.")
 
+        count('rows', len(self.dataset_test_values))
         return self.model.predict(self.dataset_test_values)
 
     def evaluate(self, y_pred: np.ndarray) -> tuple:
@@ -114,32 +147,73 @@ class NeuralNetworkClassifier:
         Returns:
         :return: tuple: Accuracy, precision, recall, F1-score, and confusion matrix.
         """
-        accuracy = accuracy_score(self.dataset_test_win, y_pred.round())
-        precision = precision_score(self.dataset_test_win, y_pred.round())
-        recall = recall_score(self.dataset_test_win, y_pred.round())
-        f1 = f1_score(self.dataset_test_win, y_pred.round())
-        conf_matrix = confusion_matrix(self.dataset_test_win, y_pred.round())
-        return accuracy, precision, recall, f1, conf_matrix
+        return evaluate_predictions(self.dataset_test_win, y_pred)
 
-    def plot_roc_curve(self, y_pred: np.ndarray) -> None:
+    def plot_roc_curve(self, y_pred: np.ndarray, output_file: str = None) -> None:
         """
         Plot the ROC curve.
 
         Args:
         :argument: y_pred (np.ndarray): Predicted values.
+        :argument: output_file (str): Save the figure to this file instead of showing it.
+
+        Returns:
+        :return: None
+        """
+        plot_roc_curve(self.dataset_test_win, y_pred, output_file)
+
+    def export(self, output_file: str) -> None:
+        """
+        Export the trained network to NumPy weights for model.inference.
+
+        Args:
+        :argument: output_file (str): Path to the output .npz file.
+
+        Returns:
+        :return: None
+        """
+        if self.model is None:
+            raise ValueError("Model has not been trained yet.")
+
+        export_model(self.model, output_file)
+
+    def training_data_hash(self) -> str:
+        """
+        Digest of the training and validation files (or arrays), see model.artifact.is_current.
+        """
+        if self.path_train is None:
+            return array_hash(self.dataset_train_values, self.dataset_train_win, self.dataset_val_values,
+                              self.dataset_val_win)
+        return data_hash(self.path_train, self.path_val)
+
+    def save(self, artifact_dir: str, metrics: dict = None) -> None:
+        """
+        Save the trained model as a versioned artifact, see model.artifact.
+
+        Args:
+        :argument: artifact_dir (str): Directory of the artifact, created if it does not exist.
+        :argument: metrics (dict): Evaluation results stored with the model.
+
+        Returns:
+        :return: None
+        """
+        if self.model is None:
+            raise ValueError("Model has not been trained yet.")
+
+        os.makedirs(artifact_dir, exist_ok=True)
+        self.model.save(os.path.join(artifact_dir, KERAS_FILE))
+        self.export(os.path.join(artifact_dir, WEIGHTS_FILE))
+        write_metadata(artifact_dir, self.training_data_hash(), self.hyperparameters, metrics)
+
+    def load(self, artifact_dir: str) -> None:
+        """
+        Load the Keras model of an artifact saved by save, e.g. to keep training it.
+
+        Args:
+        :argument: artifact_dir (str): Directory of the artifact.
 
         Returns:
         :return: None
         """
-        fpr, tpr, thresholds = roc_curve(self.dataset_test_win, y_pred)
-        auc_score = roc_auc_score(self.dataset_test_win, y_pred)
-
-        plt.figure().canvas.manager.set_window_title("ROC Curve")
-        plt.plot(fpr, tpr, label='AUC-Score: ' + str(round(auc_score, 2)), color='#1260CC')
-        plt.plot([0, 1], [0, 1], 'r--', label='Random: 0.5')
-        plt.axis((0, 1, 0, 1))
-        plt.xlabel('False Positive Rate')
-        plt.ylabel('True Positive Rate')
-        plt.title('ROC Curve')
-        plt.legend(loc='best')
-        plt.show()
+        self.model = load_model(os.path.join(artifact_dir, KERAS_FILE))
+        self.hyperparameters = read_metadata(artifact_dir)['hyperparameters']
@@ -0,0 +1,61 @@
+import matplotlib.pyplot as plt
+import numpy as np
+from sklearn.metrics import (
+    accuracy_score,
+    precision_score,
+    recall_score,
+    f1_score,
+    confusion_matrix,
+    roc_curve,
+    roc_auc_score,
+)
+
+
+def evaluate_predictions(y_true: np.ndarray, y_pred: np.ndarray) -> tuple:
+    """
+    Evaluate predicted win probabilities against the real outcomes.
+
+    Args:
+    :argument: y_true (np.ndarray): Real outcomes (1 if the blue team won).
+    :argument: y_pred (np.ndarray): Predicted probabilities of a blue team win.
+
+    Returns:
+    :return: tuple: Accuracy, precision, recall, F1-score, and confusion matrix.
+    """
+    y_label = np.asarray(y_pred).round()
+    accuracy = accuracy_score(y_true, y_label)
+    precision = precision_score(y_true, y_label)
+    recall = recall_score(y_true, y_label)
+    f1 = f1_score(y_true, y_label)
+    conf_matrix = confusion_matrix(y_true, y_label)
+    return accuracy, precision, recall, f1, conf_matrix
+
+
+def plot_roc_curve(y_true: np.ndarray, y_pred: np.ndarray, output_file: str = None) -> None:
+    """
+    Plot the ROC curve.
+
+    Args:
+    :argument: y_true (np.ndarray): Real outcomes (1 if the blue team won).
+    :argument: y_pred (np.ndarray): Predicted probabilities of a blue team win.
+    :argument: output_file (str): Save the figure to this file instead of showing it.
+
+    Returns:
+    :return: None
+    """
+    fpr, tpr, thresholds = roc_curve(y_true, y_pred)
+    auc_score = roc_auc_score(y_true, y_pred)
+
+    plt.figure().canvas.manager.set_window_title("ROC Curve")
+    plt.plot(fpr, tpr, label='AUC-Score: ' + str(round(auc_score, 2)), color='#1260CC')
+    plt.plot([0, 1], [0, 1], 'r--', label='Random: 0.5')
+    plt.axis((0, 1, 0, 1))
+    plt.xlabel('False Positive Rate')
+    plt.ylabel('True Positive Rate')
+    plt.title('ROC Curve')
+    plt.legend(loc='best')
+    if output_file is None:
+        plt.show()
+    else:
+        plt.savefig(output_file, bbox_inches='tight')
+        plt.close()
@@ -1,50 +1,363 @@
+import io
+import json
+import os
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from data_processing.clean_data import key_columns, match_keys
+from data_processing.match_store import is_dataset, open_dataset, read_table
+from data_processing.timeline_extractor import MATCH_ID_COLUMN, MINUTE_COLUMN
+from instrumentation import count, instrumented
+
+
+FEATURE_COLUMNS = [
+    'blueTeamWardRetentionRatio', 'redTeamWardRetentionRatio', 'blueTeamNetKills', 'blueTeamTeamWorkGradeDiff',
+    'blueTeamJungleMonstersKilledDiff', 'blueTeamMinionsKilledDiff', 'blueTeamAvgLevelDiff',
+    'blueTeamCsPerMinuteDiff', 'blueTeamGoldPerMinuteDiff', 'blueTeamTowersDestroyedDiff',
+    'blueTeamDragonsKilledDiff', 'blueTeamHeraldsKilledDiff', 'blueTeamVoidGrubsKilledDiff',
+]  # Model inputs, in the order of the prepared arrays
+TARGET_COLUMN = 'blueTeamWin'
+SPLITS = ('train', 'val', 'test')
+TEST_FRACTION = 0.1  # Share of the matches in the test set
+VAL_FRACTION = 0.15  # Share of the other matches in the validation set
+PREPARED_DATA_VERSION = 3  # Bump when the prepared sets change, so they are rebuilt
+
+
+def compute_features(df) -> dict:
+    """
+    Calculates the model inputs from match data columns.
+
+    Works on a DataFrame of many matches as well as on a dict of the values of one match, so training data
+    and live predictions go through the same formulas.
+
+    Arguments:
+    :argument: df (pd.DataFrame | dict): Match data, with the columns of the match data file.
+
+    Returns:
+    :return: dict: Feature name -> values, in the order of FEATURE_COLUMNS.
+    """
+    return {
+        'blueTeamWardRetentionRatio': (df['blueTeamWardsPlaced'] - df['redTeamWardsDestroyed'])
+                                      / df['blueTeamWardsPlaced'],
+        'redTeamWardRetentionRatio': -1 * (df['redTeamWardsPlaced'] - df['blueTeamWardsDestroyed'])
+                                     / df['redTeamWardsPlaced'],
+        'blueTeamNetKills': df['blueTeamKills'] - df['redTeamKills'],
+        'blueTeamTeamWorkGradeDiff': (df['blueTeamAssists'] * df['blueTeamKills'])
+                                     - (df['redTeamAssists'] * df['redTeamKills']),
+        'blueTeamJungleMonstersKilledDiff': df['blueTeamTotalJungleMonstersKilled']
+                                            - df['redTeamTotalJungleMonstersKilled'],
+        'blueTeamMinionsKilledDiff': df['blueTeamTotalMinionsKilled'] - df['redTeamTotalMinionsKilled'],
+        'blueTeamAvgLevelDiff': df['blueTeamAvgLevel'] - df['redTeamAvgLevel'],
+        'blueTeamCsPerMinuteDiff': df['blueTeamCsPerMinute'] - df['redTeamCsPerMinute'],
+        'blueTeamGoldPerMinuteDiff': df['blueTeamGoldPerMinute'] - df['redTeamGoldPerMinute'],
+        'blueTeamTowersDestroyedDiff': df['blueTeamTowersDestroyed'] - df['redTeamTowersDestroyed'],
+        'blueTeamDragonsKilledDiff': df['blueTeamDragonsKilled'] - df['redTeamDragonsKilled'],
+        'blueTeamHeraldsKilledDiff': df['blueTeamHeraldsKilled'] - df['redTeamHeraldsKilled'],
+        'blueTeamVoidGrubsKilledDiff': df['blueTeamVoidGrubsKilled'] - df['redTeamVoidGrubsKilled'],
+    }
+
+
+def sanitize_features(features: np.ndarray) -> np.ndarray:
+    """
+    Replaces the undefined model inputs with 0: the ward retention ratios divide by the wards placed, which are
+    0 in some games (often early in a game), giving NaN or infinity. Training, live predictions and win curves all
+    go through it, so the network only ever sees finite values and sees them the same way.
+
+    Arguments:
+    :argument: features (np.ndarray): Model inputs, in the order of FEATURE_COLUMNS.
+
+    Returns:
+    :return: np.ndarray: A copy with finite values only.
+    """
+    return np.nan_to_num(features, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def feature_vector(match_data: dict) -> np.ndarray:
+    """
+    Calculates the model inputs of one match, e.g. from TimelineExtractor.extract.
+
+    Arguments:
+    :argument: match_data (dict): Match data column -> value.
+
+    Returns:
+    :return: np.ndarray: float64 vector in the order of FEATURE_COLUMNS.
+    """
+    values = {column: np.float64(value) for column, value in match_data.items()}
+    with np.errstate(divide='ignore', invalid='ignore'):  # No wards placed gives inf/nan like pandas does
+        features = np.fromiter(compute_features(values).values(), dtype=np.float64, count=len(FEATURE_COLUMNS))
+    return sanitize_features(features)
+
+
+def hash_splits(keys: np.ndarray) -> np.ndarray:
+    """
+    Assigns matches to SPLITS by their keys: TEST_FRACTION of them to test, VAL_FRACTION of the rest to val.
+
+    Returns:
+    :return: np.ndarray: Index into SPLITS of every key.
+    """
+    position = (keys % np.uint64(1_000_000)) / 1_000_000  # Uniform in [0, 1), the keys are hashes
+    splits = np.zeros(len(keys), dtype=np.int64)
+    splits[position < TEST_FRACTION + (1 - TEST_FRACTION) * VAL_FRACTION] = SPLITS.index('val')
+    splits[position < TEST_FRACTION] = SPLITS.index('test')
+    return splits
+
+
+def _open_npy(f) -> tuple:
+    """
+    Reads the header of an open .npy file.
+
+    Returns:
+    :return: tuple: The shape, whether the data is in Fortran order, the dtype, the offset of the data and a
+             function returning the header of the same file with another shape.
+    """
+    version = np.lib.format.read_magic(f)
+    read_header, write_header = ((np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0)
+                                 if version == (1, 0) else
+                                 (np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0))
+    shape, fortran_order, dtype = read_header(f)
+
+    def header(new_shape: tuple) -> bytes:
+        buffer = io.BytesIO()
+        buffer.write(np.lib.format.magic(*version))
+        write_header(buffer, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                              'shape': new_shape})
+        return buffer.getvalue()
+    return shape, fortran_order, dtype, f.tell(), header
+
+
+def _save_npy(file_path: str, array: np.ndarray) -> None:
+    """
+    Writes a whole .npy file to a temporary file first and moves it in place, so the file is never half written.
+    """
+    with open(file_path + '.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(file_path + '.tmp', file_path)
+
+
+def _append_npy(file_path: str, rows: np.ndarray) -> None:
+    """
+    Appends rows to a 2D (or 1D) .npy file in place: the rows are written after the data, then the shape in the header
+    is updated. NumPy pads headers so the row count can grow, the file is only rewritten if it does not fit.
+    """
+    if not os.path.exists(file_path):
+        _save_npy(file_path, rows)
+        return
+    with open(file_path, 'r+b') as f:
+        shape, fortran_order, dtype, data_start, header = _open_npy(f)
+        if fortran_order or dtype != rows.dtype or shape[1:] != rows.shape[1:]:
+            raise ValueError(f'Cannot append {rows.dtype} rows of shape {rows.shape[1:]} to {file_path}')
+
+        new_header = header((shape[0] + len(rows),) + shape[1:])
+        if len(new_header) == data_start:
+            f.seek(data_start + shape[0] * dtype.itemsize * int(np.prod(shape[1:])))
+            f.truncate()  # Rows of an append that was interrupted before its header was written
+            f.write(np.ascontiguousarray(rows).tobytes())
+            f.seek(0)
+            f.write(new_header)
+            return
+    _save_npy(file_path, np.concatenate([np.load(file_path), rows]))
+
+
+def _truncate_npy(file_path: str, rows: int) -> None:
+    """
+    Keeps only the first rows of a .npy file, e.g. the values of an append whose keys were never written. The
+    header is shortened before the data, so the file can be read at every moment.
+    """
+    with open(file_path, 'r+b') as f:
+        shape, _, dtype, data_start, header = _open_npy(f)
+        if shape[0] <= rows:
+            return
+        new_header = header((rows,) + shape[1:])
+        if len(new_header) == data_start:
+            f.seek(0)
+            f.write(new_header)
+            f.truncate(data_start + rows * dtype.itemsize * int(np.prod(shape[1:])))
+            return
+    _save_npy(file_path, np.load(file_path)[:rows])
+
+
+def prepared_rows(output_location: str, split: str) -> int:
+    """
+    Number of rows of a set whose keys were written, None for sets without keys. prepare_data appends the keys
+    last, so rows of the values file past them belong to a run that did not finish and are not read.
+    """
+    keys_file = f'{output_location}/prepared_data_{split}_keys.npy'
+    return len(np.load(keys_file, mmap_mode='r')) if os.path.exists(keys_file) else None
 
 
-def prepare_data(input_file: str, output_location: str) -> None:
+def _read_new_rows(input_file: str, filter, key_frame: pd.DataFrame, new: np.ndarray) -> pa.Table:
+    """
+    Reads the rows of the matches prepare_data has not prepared yet, without reading the others where the format
+    allows it: the new rows of a Feather file are taken from the memory-mapped file, and a dataset is read with
+    the match IDs of the new rows added to the filter, so the Parquet row groups holding none of them are skipped.
+    The table can still hold rows of prepared matches, prepare_data drops them by their keys.
+
+    Arguments:
+    :argument: input_file (str): Feather file or dataset directory.
+    :argument: filter (pyarrow.compute.Expression): Filter the keys were read with, or None.
+    :argument: key_frame (pd.DataFrame): Key columns (see key_columns) of the rows read with the filter.
+    :argument: new (np.ndarray): Mask of the rows of key_frame to read.
+
+    Returns:
+    :return: pa.Table: Every column of (at least) the new rows.
+    """
+    if new.all():
+        return read_table(input_file, filter=filter)
+    if filter is None and not is_dataset(input_file):
+        return read_table(input_file).take(np.flatnonzero(new))
+    if MATCH_ID_COLUMN not in key_frame:  # Rows of data without match IDs cannot be selected before reading them
+        return read_table(input_file, filter=filter)
+    selection = ds.field(MATCH_ID_COLUMN).isin(pa.array(pd.unique(key_frame[MATCH_ID_COLUMN].to_numpy()[new])))
+    return read_table(input_file, filter=selection if filter is None else filter & selection)
+
+
+def _describe(filter) -> str:
+    return None if filter is None else str(filter)
+
+
+@instrumented()
+def prepare_data(input_file: str, output_location: str, rebuild: bool = False, filter=None) -> int:
     """
     Prepares the data for machine learning by calculating various statistics and splitting it into training
     and testing sets.
 
+    The stage is incremental: every match is identified by its key (see match_keys) and the keys of the
+    prepared matches are stored next to the sets, so only the matches added to the input file since the last
+    run are read and prepared. A match is assigned to a set by its key (see hash_splits), so prepared matches
+    never move to another set and new ones are appended to the sets, and a daily refresh costs as much as the
+    day's matches.
+
     This function performs the following steps:
-    1. Reads data from a Feather file.
-    2. Creates a new DataFrame with calculated differences and ratios for blue team metrics.
-    3. Saves the prepared DataFrame to a CSV file.
-    4. Splits the DataFrame into training, validation and testing sets.
-    5. Saves the training, validation and testing sets to separate CSV files.
+    1. Reads the key columns of the (selected) matches in the Feather file or dataset, then the rows of the
+       matches not prepared yet (see _read_new_rows).
+    2. Creates a new DataFrame with calculated differences and ratios for blue team metrics, undefined ratios
+       are set to 0 (see sanitize_features).
+    3. Splits the DataFrame into training, validation and testing sets by the keys of the matches.
+    4. Appends every set to a float64 .npy array (features in the order of FEATURE_COLUMNS, then the target),
+       which can be loaded memory-mapped, and the keys to prepared_data_<set>_keys.npy, and writes the schema
+       of the arrays to prepared_data_schema.json.
 
     Arguments:
-    :argument: input_file (str): The path to the input Feather file containing the original data.
-    :argument: output_location (str): The directory where the output CSV files will be saved.
-
-    Returns:
-    :return: None
-    """
-    df = pd.read_feather(input_file)
-    df2 = pd.DataFrame()
-    df2['blueTeamWardRetentionRatio'] = (df.blueTeamWardsPlaced - df.redTeamWardsDestroyed)/df.blueTeamWardsPlaced
-    df2['redTeamWardRetentionRatio'] = -1 * (df.redTeamWardsPlaced - df.blueTeamWardsDestroyed)/df.redTeamWardsPlaced
-    df2['blueTeamNetKills'] = (df.blueTeamKills - df.redTeamKills)
-    df2['blueTeamTeamWorkGradeDiff'] = (df.blueTeamAssists * df.blueTeamKills) - (df.redTeamAssists * df.redTeamKills)
-    df2['blueTeamJungleMonstersKilledDiff'] = (
-            df.blueTeamTotalJungleMonstersKilled - df.redTeamTotalJungleMonstersKilled)
-    df2['blueTeamMinionsKilledDiff'] = (df.blueTeamTotalMinionsKilled - df.redTeamTotalMinionsKilled)
-    df2['blueTeamAvgLevelDiff'] = (df.blueTeamAvgLevel - df.redTeamAvgLevel)
-    df2['blueTeamCsPerMinuteDiff'] = (df.blueTeamCsPerMinute - df.redTeamCsPerMinute)
-    df2['blueTeamGoldPerMinuteDiff'] = (df.blueTeamGoldPerMinute - df.redTeamGoldPerMinute)
-    df2['blueTeamTowersDestroyedDiff'] = (df.blueTeamTowersDestroyed - df.redTeamTowersDestroyed)
-    df2['blueTeamDragonsKilledDiff'] = (df.blueTeamDragonsKilled - df.redTeamDragonsKilled)
-    df2['blueTeamHeraldsKilledDiff'] = (df.blueTeamHeraldsKilled - df.redTeamHeraldsKilled)
-    df2['blueTeamVoidGrubsKilledDiff'] = (df.blueTeamVoidGrubsKilled - df.redTeamVoidGrubsKilled)
+    :argument: input_file (str): The path to the input Feather file or dataset directory containing the original
+                                 data.
+    :argument: output_location (str): The directory where the output files will be saved.
+    :argument: rebuild (bool): Prepare every match again. Sets written by older versions, with other features,
+                               another filter or without keys are always rebuilt.
+    :argument: filter (pyarrow.compute.Expression): Prepare only the matches it selects, e.g. of one patch (see
+                                                    match_store.match_filter). Only the partitions of a dataset it
+                                                    selects are read.
+
+    Returns:
+    :return: int: Number of matches added to the sets.
+    """
+    schema_file = f'{output_location}/prepared_data_schema.json'
+    schema = None
+    if os.path.exists(schema_file) and not rebuild:
+        with open(schema_file, 'r') as f:
+            schema = json.load(f)
+    if schema is None or schema.get('version') != PREPARED_DATA_VERSION \
+            or schema['columns'] != FEATURE_COLUMNS + [TARGET_COLUMN] or schema.get('filter') != _describe(filter):
+        schema = {'version': PREPARED_DATA_VERSION, 'columns': FEATURE_COLUMNS + [TARGET_COLUMN],
+                  'features': len(FEATURE_COLUMNS), 'dtype': 'float64', 'filter': _describe(filter),
+                  'split': {'method': 'hash', 'test': TEST_FRACTION, 'val': VAL_FRACTION},
+                  'rows': dict.fromkeys(SPLITS, 0)}
+        for split in SPLITS:  # Start over
+            for path in (f'{output_location}/prepared_data_{split}.npy',
+                         f'{output_location}/prepared_data_{split}_keys.npy'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    for split in SPLITS:  # Rows of values appended by a run that died before appending their keys
+        if os.path.exists(f'{output_location}/prepared_data_{split}.npy'):
+            _truncate_npy(f'{output_location}/prepared_data_{split}.npy', prepared_rows(output_location, split) or 0)
+    known = [np.load(f'{output_location}/prepared_data_{split}_keys.npy', mmap_mode='r') for split in SPLITS
+             if os.path.exists(f'{output_location}/prepared_data_{split}_keys.npy')]
+    columns = key_columns(open_dataset(input_file).schema)
+    key_frame = read_table(input_file, columns=columns, filter=filter).to_pandas()
+    keys = match_keys(key_frame)
+    count('rows', len(keys))
+    new = ~np.isin(keys, np.concatenate(known)) if known else np.ones(len(keys), dtype=bool)
+    new &= ~pd.Index(keys).duplicated()  # The first row of a match prepared twice in the file wins
+
+    df = _read_new_rows(input_file, filter, key_frame, new).to_pandas()
+    new_keys, keys = keys[new], match_keys(df[columns])
+    fresh = np.isin(keys, new_keys) & ~pd.Index(keys).duplicated()
+    df, keys = df[fresh].reset_index(drop=True), keys[fresh]
+    count('new_rows', len(df))
+    df2 = pd.DataFrame(compute_features(df))
     df2['blueTeamWin'] = df.blueTeamWin
-    df2.to_csv(f'{output_location}/prepared_data.csv', index=False)
+    values = df2[FEATURE_COLUMNS + [TARGET_COLUMN]].to_numpy(dtype=np.float64)
+    values[:, :-1] = sanitize_features(values[:, :-1])
+
+    # Snapshots of a match are in the same set at every minute mark
+    splits = hash_splits(match_keys(df[[MATCH_ID_COLUMN]]) if MINUTE_COLUMN in df else keys)
+    for index, split in enumerate(SPLITS):
+        rows = splits == index
+        _append_npy(f'{output_location}/prepared_data_{split}.npy', values[rows])
+        _append_npy(f'{output_location}/prepared_data_{split}_keys.npy', keys[rows])  # Commits the rows
+        schema['rows'][split] = prepared_rows(output_location, split)
+    with open(schema_file, 'w') as f:
+        json.dump(schema, f, indent=4)
+    return len(df)
+
 
-    df_train_val = df2.sample(frac=0.9, random_state=777)
-    df_test = df2.drop(df_train_val.index)
+def prepare_horizons(input_file: str, output_location: str, minutes: list, rebuild: bool = False,
+                     filter=None) -> dict:
+    """
+    Prepares the snapshots of every minute mark (see bulk_extract.extract_bulk with minutes) as separate sets,
+    one model is trained per horizon.
+
+    Arguments:
+    :argument: input_file (str): Feather file or dataset directory with snapshots in long format.
+    :argument: output_location (str): Directory of the sets, those of minute m are written to '<it>/minute_<m>'.
+    :argument: minutes (list): Minute marks to prepare, e.g. [5, 10, 15, 20].
+    :argument: rebuild (bool): Prepare every snapshot again, see prepare_data.
+    :argument: filter (pyarrow.compute.Expression): Prepare only the matches it selects, see prepare_data.
+
+    Returns:
+    :return: dict: Minute -> directory of its sets.
+    """
+    locations = {}
+    for minute in minutes:
+        locations[minute] = f'{output_location}/minute_{minute}'
+        os.makedirs(locations[minute], exist_ok=True)
+        horizon = ds.field(MINUTE_COLUMN) == minute
+        prepare_data(input_file, locations[minute], rebuild, horizon if filter is None else filter & horizon)
+    return locations
 
-    df_val = df_train_val.sample(frac=0.15, random_state=777)
-    df_train = df_train_val.drop(df_val.index)
 
-    df_train.to_csv(f'{output_location}/prepared_data_train.csv', index=False)
-    df_val.to_csv(f'{output_location}/prepared_data_val.csv', index=False)
-    df_test.to_csv(f'{output_location}/prepared_data_test.csv', index=False)
+def load_prepared_rows(output_location: str, split: str) -> np.ndarray:
+    """
+    Memory-maps a set written by prepare_data, features followed by the target, without rows that were not
+    committed (see prepared_rows).
+    """
+    return np.load(f'{output_location}/prepared_data_{split}.npy', mmap_mode='r')[
+        :prepared_rows(output_location, split)]
+
+
+def load_prepared_data(file_path: str) -> tuple:
+    """
+    Load data prepared by prepare_data.
+
+    .npy files are memory-mapped, so loading costs next to nothing until the values are used.
+    Header-less CSV files of older runs are still parsed.
+
+    Arguments:
+    :argument: file_path (str): Path to the .npy (or CSV) file.
+
+    Returns:
+    :return: tuple: A tuple containing numpy arrays for features and target.
+    """
+    location, name = os.path.split(file_path)
+    if name.startswith('prepared_data_') and name.endswith('.npy'):  # Without the rows of an interrupted run
+        dataset = load_prepared_rows(location or '.', name[len('prepared_data_'):-len('.npy')])
+    elif file_path.endswith('.npy'):
+        dataset = np.load(file_path, mmap_mode='r')
+    else:
+        dataset = np.loadtxt(file_path, delimiter=',')
+    dataset_values = dataset[:, 0:len(FEATURE_COLUMNS)]
+    dataset_win = dataset[:, len(FEATURE_COLUMNS)]
+    return dataset_values, dataset_win
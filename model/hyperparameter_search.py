@@ -0,0 +1,288 @@
+"""
+Parallel search over hyperparameters of the neural network and the baseline models.
+
+The prepared datasets are loaded once into shared memory, every worker process of the pool maps them without
+copying. Each worker is pinned to its own CPU cores and limits TensorFlow, BLAS and OpenMP to them, so trials do
+not fight over cores and the pool keeps every core of a CPU-only machine busy. Neural network trials stop early
+when the validation loss stops improving or when their validation accuracy falls too far behind the best trial
+finished so far. Run it with:
+
+    python main.py search --trials 40
+"""
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, instrumented
+from model.artifact import DEFAULT_HYPERPARAMETERS
+from model.feature_engineering import FEATURE_COLUMNS, SPLITS, load_prepared_rows
+
+NEURAL_NETWORK = 'neural_network'
+SVC_MODEL = 'svc'
+LOGISTIC_REGRESSION = 'logistic_regression'
+GRADIENT_BOOSTING = 'gradient_boosting'
+
+NEURAL_NETWORK_SPACE = {
+    'hidden_layers': [[7, 7], [7, 7, 7], [14, 7], [16, 8], [32, 16]],
+    'first_regularization': [0.0001, 0.0005, 0.002],
+    'regularization': [0.0, 0.0001, 0.001],
+    'learning_rate': [0.0003, 0.001, 0.003],
+    'batch_size': [256, 1024, 4096],
+    'epochs': [300],
+}
+SVC_SPACE = {
+    'kernel': ['linear', 'rbf', 'poly'],
+    'C': [0.1, 1.0, 10.0],
+}
+LOGISTIC_REGRESSION_SPACE = {
+    'alpha': [0.00001, 0.0001, 0.001, 0.01],
+    'epochs': [3, 10],
+}
+GRADIENT_BOOSTING_SPACE = {
+    'max_iter': [100, 300],
+    'learning_rate': [0.03, 0.1],
+    'max_leaf_nodes': [15, 31, 63],
+    'l2_regularization': [0.0, 1.0],
+}
+
+_data = {}  # Split -> (features, target) views of the shared memory, set in every worker by _init_worker
+_best = None  # Shared best validation accuracy of the finished trials
+
+
+def grid(space: dict) -> list:
+    """
+    Returns every combination of the values in space (name -> list of values).
+    """
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_samples(space: dict, samples: int, seed: int = 777) -> list:
+    """
+    Returns that many different combinations drawn at random from the grid of space.
+    """
+    combinations = grid(space)
+    return random.Random(seed).sample(combinations, min(samples, len(combinations)))
+
+
+def make_trials(models: list, samples: int = None, seed: int = 777) -> list:
+    """
+    Returns the trials of the standard search spaces (NEURAL_NETWORK_SPACE and SVC_SPACE).
+
+    Args:
+    :argument: models (list): Some of NEURAL_NETWORK, SVC_MODEL, LOGISTIC_REGRESSION and GRADIENT_BOOSTING.
+    :argument: samples (int): Number of random combinations per model, None for the whole grids.
+    :argument: seed (int): Seed of the random combinations.
+
+    Returns:
+    :return: list: Trials for search.
+    """
+    spaces = {NEURAL_NETWORK: NEURAL_NETWORK_SPACE, SVC_MODEL: SVC_SPACE,
+              LOGISTIC_REGRESSION: LOGISTIC_REGRESSION_SPACE, GRADIENT_BOOSTING: GRADIENT_BOOSTING_SPACE}
+    trials = []
+    for model in models:
+        combinations = grid(spaces[model]) if samples is None else random_samples(spaces[model], samples, seed)
+        trials.extend({'model': model, **combination} for combination in combinations)
+    return trials
+
+
+def _share_datasets(data_location: str) -> tuple:
+    """
+    Copies the prepared datasets into one shared memory block.
+
+    Returns:
+    :return: tuple: The shared memory and the layout {split: (first row, rows)} of the block.
+    """
+    arrays = {split: load_prepared_rows(data_location, split) for split in SPLITS}
+    columns = len(FEATURE_COLUMNS) + 1
+    total = sum(len(array) for array in arrays.values())
+    memory = shared_memory.SharedMemory(create=True, size=max(1, total * columns * 8))
+    block = np.ndarray((total, columns), dtype=np.float64, buffer=memory.buf)
+    layout = {}
+    first = 0
+    for split, array in arrays.items():
+        block[first:first + len(array)] = array
+        layout[split] = (first, len(array))
+        first += len(array)
+    return memory, layout
+
+
+def _init_worker(memory_name: str, layout: dict, cores, best, threads: int) -> None:
+    """
+    Attaches a worker to the shared datasets and pins it to its cores.
+    """
+    from threadpoolctl import threadpool_limits
+
+    global _best
+    # NumPy's BLAS was loaded when this module was imported to unpickle the initializer, its thread pool is
+    # resized directly. The variables limit the libraries loaded later (TensorFlow, scikit-learn's OpenMP).
+    threadpool_limits(threads)
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS'):
+        os.environ[variable] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores.get())
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    columns = len(FEATURE_COLUMNS) + 1
+    total = sum(rows for _, rows in layout.values())
+    block = np.ndarray((total, columns), dtype=np.float64, buffer=memory.buf)
+    block.flags.writeable = False
+    for split, (first, rows) in layout.items():
+        _data[split] = (block[first:first + rows, :-1], block[first:first + rows, -1])
+    _data['memory'] = memory  # Keeps the mapping alive
+    _best = best
+
+
+def _pruning_callback(margin: float, min_epochs: int):
+    """
+    Keras callback stopping a trial whose validation accuracy is more than margin below the best finished trial.
+    """
+    from keras.callbacks import Callback
+
+    class Pruning(Callback):
+        def __init__(self) -> None:
+            super().__init__()
+            self.pruned = False
+
+        def on_epoch_end(self, epoch: int, logs: dict = None) -> None:
+            if epoch + 1 >= min_epochs and logs and logs.get('val_accuracy', 1.0) < _best.value - margin:
+                self.pruned = True
+                self.model.stop_training = True
+
+    return Pruning()
+
+
+def _neural_network_trial(hyperparameters: dict, patience: int, margin: float, min_epochs: int) -> dict:
+    import tensorflow as tf
+    from keras.callbacks import EarlyStopping
+    from model.building_the_model import NeuralNetworkClassifier
+
+    tf.config.threading.set_intra_op_parallelism_threads(int(os.environ['TF_NUM_INTRAOP_THREADS']))
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    classifier = NeuralNetworkClassifier.from_arrays(_data['train'], _data['test'], _data['val'], hyperparameters)
+    pruning = _pruning_callback(margin, min_epochs)
+    history = classifier.train(callbacks=[EarlyStopping(patience=patience, restore_best_weights=True), pruning],
+                               verbose=0)
+    val_pred = classifier.model.predict(_data['val'][0], verbose=0).ravel()
+    test_pred = classifier.model.predict(_data['test'][0], verbose=0).ravel()
+    return {'epochs_run': len(history.history['loss']), 'pruned': pruning.pruned,
+            'val_pred': val_pred, 'test_pred': test_pred}
+
+
+def _svc_trial(hyperparameters: dict) -> dict:
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.svm import SVC
+
+    scaler = StandardScaler().fit(_data['train'][0])
+    classifier = SVC(**hyperparameters).fit(scaler.transform(_data['train'][0]), _data['train'][1])
+    # Decision values for the AUC, the labels for the other metrics
+    val_scores = classifier.decision_function(scaler.transform(_data['val'][0]))
+    test_scores = classifier.decision_function(scaler.transform(_data['test'][0]))
+    return {'val_pred': (val_scores > 0).astype(np.float64), 'test_pred': (test_scores > 0).astype(np.float64),
+            'test_scores': test_scores}
+
+
+def _baseline_trial(model: str, hyperparameters: dict) -> dict:
+    from model.baselines import GradientBoostingClassifier, LogisticRegressionClassifier
+
+    classes = {LOGISTIC_REGRESSION: LogisticRegressionClassifier, GRADIENT_BOOSTING: GradientBoostingClassifier}
+    classifier = classes[model].from_arrays(_data['train'], _data['test'], _data['val'], hyperparameters)
+    classifier.train()
+    return {'val_pred': classifier.predict_proba(_data['val'][0]), 'test_pred': classifier.predict()}
+
+
+def _run_trial(trial: dict, patience: int, margin: float, min_epochs: int) -> dict:
+    """
+    Worker of search, trains and evaluates one trial.
+    """
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    from model.evaluation import evaluate_predictions
+
+    started = time.perf_counter()
+    model, hyperparameters = trial['model'], {name: value for name, value in trial.items() if name != 'model'}
+    if model == NEURAL_NETWORK:
+        outcome = _neural_network_trial(hyperparameters, patience, margin, min_epochs)
+    elif model == SVC_MODEL:
+        outcome = _svc_trial(hyperparameters)
+    elif model in (LOGISTIC_REGRESSION, GRADIENT_BOOSTING):
+        outcome = _baseline_trial(model, hyperparameters)
+    else:
+        raise ValueError(f'Unknown model: {model}')
+
+    val_accuracy = accuracy_score(_data['val'][1], outcome['val_pred'].round())
+    accuracy, precision, recall, f1, _ = evaluate_predictions(_data['test'][1], outcome['test_pred'])
+    with _best.get_lock():
+        _best.value = max(_best.value, val_accuracy)
+    return {**trial, 'val_accuracy': val_accuracy, 'test_accuracy': accuracy, 'precision': precision,
+            'recall': recall, 'f1': f1,
+            'auc': roc_auc_score(_data['test'][1], outcome.get('test_scores', outcome['test_pred'])),
+            'epochs_run': outcome.get('epochs_run'), 'pruned': outcome.get('pruned', False),
+            'seconds': round(time.perf_counter() - started, 2)}
+
+
+@instrumented()
+def search(trials: list, data_location: str = 'Data', output_file: str = 'Data/search_results.csv',
+           threads_per_trial: int = 1, patience: int = 20, prune_margin: float = 0.02,
+           min_epochs: int = 30) -> pd.DataFrame:
+    """
+    Trains and evaluates every trial on a process pool.
+
+    Args:
+    :argument: trials (list): Trials, dicts with 'model' (see make_trials) and its hyperparameters.
+               Neural network hyperparameters missing in a trial keep their default, see DEFAULT_HYPERPARAMETERS.
+    :argument: data_location (str): Directory of the datasets written by prepare_data.
+    :argument: output_file (str): CSV the results table is written to, rewritten as trials finish.
+    :argument: threads_per_trial (int): CPU cores of one trial, the pool runs cores / threads_per_trial trials.
+    :argument: patience (int): Epochs without a better validation loss after which a neural network trial stops.
+    :argument: prune_margin (float): A neural network trial stops once its validation accuracy is this far below
+               the best finished trial...
+    :argument: min_epochs (int): ...but not before this many epochs.
+
+    Returns:
+    :return: pd.DataFrame: Results, best validation accuracy first.
+    """
+    if not trials:
+        raise ValueError('search needs at least one trial')
+    trials = [{'model': trial['model'], **DEFAULT_HYPERPARAMETERS, **trial} if trial['model'] == NEURAL_NETWORK
+              else trial for trial in trials]
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    workers = max(1, min(len(trials), len(available) // threads_per_trial))
+
+    context = multiprocessing.get_context('spawn')  # Workers import TensorFlow themselves, never a forked copy
+    cores = context.Queue()
+    for worker in range(workers):
+        cores.put(set(available[worker * threads_per_trial:(worker + 1) * threads_per_trial]))
+    best = context.Value('d', 0.0)
+    memory, layout = _share_datasets(data_location)
+
+    results = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(memory.name, layout, cores, best, threads_per_trial)) as executor:
+            futures = {executor.submit(_run_trial, trial, patience, prune_margin, min_epochs): trial
+                       for trial in trials}
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                    count('trials')
+                except Exception as error:
+                    results.append({**futures[future], 'error': repr(error)})
+                    count('failed')
+                table = pd.DataFrame(results)
+                if 'val_accuracy' in table:
+                    table = table.sort_values('val_accuracy', ascending=False, na_position='last')
+                table.to_csv(output_file, index=False)
+                print(f'{len(results)}/{len(trials)} trials done, best validation accuracy: {best.value:.4f}')
+    finally:
+        memory.close()
+        memory.unlink()
+    return table
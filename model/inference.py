@@ -0,0 +1,253 @@
+"""
+Scores games with the trained network without Keras.
+
+The network is exported to plain NumPy arrays (see export_model) and evaluated by NumpyModel, which scores
+a single feature vector in microseconds. The service started with:
+
+    python main.py serve --model Data/model/model_weights.npz
+
+answers POST /predict with the blue team win probability of a game at the 15 minutes mark. The JSON body holds
+one of 'features' (the 13 model inputs), 'timeline' (a match-v5 timeline) or 'matchId' (of a timeline in the
+timeline cache). Concurrent requests are scored together in micro-batches. Bodies that are not such an object
+are answered with 400 and a message.
+"""
+import asyncio
+import json
+
+import numpy as np
+from aiohttp import web
+
+from collecting_data.timeline_cache import TIMELINE, TimelineCache
+from data_processing.timeline_extractor import TimelineExtractor
+from model.feature_engineering import FEATURE_COLUMNS, feature_vector
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0.0))),
+    'sigmoid': lambda x: 0.5 * (1.0 + np.tanh(0.5 * x)),  # Same as 1 / (1 + exp(-x)) without overflowing
+    'tanh': np.tanh,
+}
+NORMALIZATION_EPSILON = 1e-7  # keras.backend.epsilon(), the smallest standard deviation Normalization divides by
+
+
+def export_model(model, output_file: str) -> None:
+    """
+    Exports the weights of a trained Keras model (Normalization, Dense and PReLU layers) to a .npz file.
+
+    Args:
+    :argument: model: Trained keras Sequential model.
+    :argument: output_file (str): Path to the output .npz file.
+
+    Returns:
+    :return: None
+    """
+    layers = []
+    arrays = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        weights = layer.get_weights()
+        prefix = f'layer_{len(layers)}'
+        if kind == 'InputLayer':
+            continue
+        elif kind == 'Normalization':
+            arrays[prefix + '_mean'] = np.asarray(weights[0], dtype=np.float64).reshape(-1)
+            arrays[prefix + '_variance'] = np.asarray(weights[1], dtype=np.float64).reshape(-1)
+            layers.append({'kind': kind})
+        elif kind == 'Dense':
+            arrays[prefix + '_kernel'] = np.asarray(weights[0], dtype=np.float64)
+            arrays[prefix + '_bias'] = np.asarray(weights[1], dtype=np.float64)
+            layers.append({'kind': kind, 'activation': layer.activation.__name__})
+        elif kind == 'PReLU':
+            arrays[prefix + '_alpha'] = np.asarray(weights[0], dtype=np.float64).reshape(-1)
+            layers.append({'kind': kind})
+        else:
+            raise ValueError(f'Layer {layer.name} of type {kind} cannot be exported')
+    np.savez(output_file, layers=np.array(json.dumps(layers)), **arrays)
+
+
+class NumpyModel:
+    def __init__(self, model_file: str) -> None:
+        """
+        The exported network evaluated with NumPy.
+
+        Normalization is folded into the first Dense layer when loading, so a prediction is a few small matrix
+        products and element-wise functions.
+
+        Args:
+        :argument: model_file (str): Path to the .npz file written by export_model.
+        """
+        with np.load(model_file) as weights:
+            layers = json.loads(str(weights['layers']))
+            arrays = {name: weights[name] for name in weights.files if name != 'layers'}
+
+        self.steps = []  # (kernel, bias, activation) of Dense layers and (None, alpha, 'prelu') of PReLU layers
+        shift, scale = None, None
+        for index, layer in enumerate(layers):
+            prefix = f'layer_{index}'
+            if layer['kind'] == 'Normalization':
+                shift = arrays[prefix + '_mean']
+                scale = np.maximum(np.sqrt(arrays[prefix + '_variance']), NORMALIZATION_EPSILON)
+            elif layer['kind'] == 'Dense':
+                kernel, bias = arrays[prefix + '_kernel'], arrays[prefix + '_bias']
+                if shift is not None:  # ((x - mean) / std) @ W + b == x @ (W / std) + (b - (mean / std) @ W)
+                    kernel, bias = kernel / scale[:, None], bias - (shift / scale) @ kernel
+                    shift, scale = None, None
+                if layer['activation'] not in ACTIVATIONS:
+                    raise ValueError(f'Unsupported activation: {layer["activation"]}')
+                self.steps.append((kernel, bias, layer['activation']))
+            elif layer['kind'] == 'PReLU':
+                self.steps.append((None, arrays[prefix + '_alpha'], 'prelu'))
+        if shift is not None:
+            raise ValueError('Normalization has to be followed by a Dense layer')
+        self.input_size = next(kernel.shape[0] for kernel, _, _ in self.steps if kernel is not None)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Scores one feature vector or a batch of them.
+
+        Args:
+        :argument: features (np.ndarray): Shape (13,) or (n, 13), in the order of FEATURE_COLUMNS.
+
+        Returns:
+        :return: np.ndarray: Blue team win probability, shape () or (n,).
+        """
+        x = np.asarray(features, dtype=np.float64)
+        for kernel, bias, activation in self.steps:
+            if kernel is None:
+                x = np.where(x > 0, x, bias * x)
+            else:
+                x = ACTIVATIONS[activation](x @ kernel + bias)
+        return x[..., 0]
+
+    def predict_one(self, features) -> float:
+        return float(self.predict(features))
+
+
+class MicroBatcher:
+    def __init__(self, model: NumpyModel, max_batch: int = 256, max_delay: float = 0.001) -> None:
+        """
+        Collects concurrent predictions and scores them with one call of the model.
+
+        Args:
+        :argument: model (NumpyModel): Model to score with.
+        :argument: max_batch (int): A batch is scored as soon as it holds this many requests.
+        :argument: max_delay (float): Seconds the first request of a batch waits for others to arrive.
+        """
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+
+    async def predict(self, features: np.ndarray) -> float:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((features, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            probabilities = self.model.predict(np.stack([features for features, _ in batch]))
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for (_, future), probability in zip(batch, probabilities):
+            if not future.done():
+                future.set_result(float(probability))
+
+
+def create_app(model_file: str, cache_dir: str = None, cutoff_minute: int = 15, max_batch: int = 256,
+               max_delay: float = 0.001) -> web.Application:
+    """
+    Creates the inference service.
+
+    Args:
+    :argument: model_file (str): Path to the .npz file written by export_model.
+    :argument: cache_dir (str): Timeline cache the 'matchId' requests are looked up in.
+    :argument: cutoff_minute (int): Minute mark the model was trained for.
+    :argument: max_batch (int): See MicroBatcher.
+    :argument: max_delay (float): See MicroBatcher.
+
+    Returns:
+    :return: web.Application: aiohttp application, run it with web.run_app.
+    """
+    model = NumpyModel(model_file)
+    if model.input_size != len(FEATURE_COLUMNS):
+        raise ValueError(f'The model expects {model.input_size} features, the pipeline makes {len(FEATURE_COLUMNS)}')
+    batcher = MicroBatcher(model, max_batch, max_delay)
+    extractor = TimelineExtractor(cutoff_minute)
+    cache = TimelineCache(cache_dir) if cache_dir is not None else None
+
+    def error(status: int, message: str) -> web.Response:
+        return web.json_response({'error': message}, status=status)
+
+    async def predict(request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            return error(400, 'The body has to be JSON')
+        if not isinstance(body, dict):
+            return error(400, "The body has to be a JSON object with 'features', 'timeline' or 'matchId'")
+
+        if 'features' in body:
+            features = body['features']
+            if not isinstance(features, list) or len(features) != len(FEATURE_COLUMNS):
+                return error(400, f'Expected a list of {len(FEATURE_COLUMNS)} features: {FEATURE_COLUMNS}')
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in features):
+                return error(400, 'Features have to be numbers')
+            features = np.array(features, dtype=np.float64)
+            if not np.isfinite(features).all():
+                return error(400, 'Features have to be finite numbers')
+        else:
+            timeline = body.get('timeline')
+            if timeline is None and 'matchId' in body:
+                if cache is None:
+                    return error(400, 'The service was started without a timeline cache')
+                if not isinstance(body['matchId'], str):
+                    return error(400, "'matchId' has to be a string")
+                timeline = cache.get(body['matchId'], TIMELINE)
+                if timeline is None:
+                    return error(404, f'Timeline of {body["matchId"]} is not cached')
+            if timeline is None:
+                return error(400, "The body needs 'features', 'timeline' or 'matchId'")
+            try:
+                if timeline['info']['frames'][-1]['timestamp'] <= cutoff_minute * 60000:
+                    return error(422, f'The timeline does not reach minute {cutoff_minute} yet')
+                features = feature_vector(extractor.extract(timeline))
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError):
+                return error(400, 'Malformed timeline')
+
+        probability = await batcher.predict(features)
+        return web.json_response({'blueTeamWinProbability': probability})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({'status': 'ok'})
+
+    async def close_cache(app: web.Application) -> None:
+        if cache is not None:
+            cache.close()
+
+    app = web.Application()
+    app.router.add_post('/predict', predict)
+    app.router.add_get('/health', health)
+    app.on_cleanup.append(close_cache)
+    return app
+
+
+def serve(model_file: str, cache_dir: str = None, host: str = '127.0.0.1', port: int = 8000) -> None:
+    """
+    Runs the inference service until it is interrupted.
+    """
+    web.run_app(create_app(model_file, cache_dir), host=host, port=port)
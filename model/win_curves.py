@@ -0,0 +1,156 @@
+"""
+Win probability at every minute of a game, for replays and dashboards.
+
+score_curves turns every cached timeline into a row of model inputs per frame (see
+TimelineExtractor.extract_frames) and scores all frames of a cache shard in large batches with the exported
+network, shards being spread over a process pool. The curves of all games are written to one .npz file in CSR
+layout, the curve of a game is a slice of two flat arrays:
+
+    match_ids       (games,)       match IDs
+    offsets         (games + 1,)   the points of game i are offsets[i]:offsets[i + 1]
+    minutes         (points,)      float32 time of every point in minutes, a point per minute and one at the end
+    probabilities   (points,)      float32 blue team win probability at that point
+
+and read back by match ID with WinCurves:
+
+    curves = WinCurves('Data/win_curves.npz')
+    minutes, probabilities = curves['EUN1_3600000000']
+
+The network was trained at a single minute mark (see run_horizons for others), so points far from it are less
+reliable than the prediction at that minute.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from collecting_data.timeline_cache import TIMELINE, TimelineCache, decode_payload, read_shard
+from data_processing.timeline_extractor import MINUTE_COLUMN, TimelineExtractor
+from instrumentation import count, instrumented
+from model.artifact import WEIGHTS_FILE, load_artifact
+from model.feature_engineering import compute_features, sanitize_features
+from model.inference import NumpyModel
+
+BATCH_ROWS = 65_536  # Frames scored with one call of the model
+
+
+def score_frames(model: NumpyModel, games: list) -> tuple:
+    """
+    Scores every frame of many games at once.
+
+    Args:
+    :argument: model (NumpyModel): Exported network.
+    :argument: games (list): Columns of every game, see TimelineExtractor.extract_frames.
+
+    Returns:
+    :return: tuple: Number of points of every game, and the minutes and win probabilities of all points (float32,
+             game after game).
+    """
+    lengths = np.array([len(game[MINUTE_COLUMN]) for game in games], dtype=np.int64)
+    if not lengths.sum():
+        return lengths, np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    columns = {column: np.concatenate([game[column] for game in games]) for column in games[0]}
+    with np.errstate(divide='ignore', invalid='ignore'):  # Ward retention is undefined until the first ward
+        features = sanitize_features(np.column_stack(list(compute_features(columns).values())))
+    probabilities = np.empty(len(features), dtype=np.float32)
+    for start in range(0, len(features), BATCH_ROWS):
+        probabilities[start:start + BATCH_ROWS] = model.predict(features[start:start + BATCH_ROWS])
+    return lengths, columns[MINUTE_COLUMN].astype(np.float32), probabilities
+
+
+def _score_shard(path: str, entries: list, model_file: str) -> tuple:
+    """
+    Worker of score_curves, scores the timelines of one cache shard.
+
+    Returns:
+    :return: tuple: Match IDs, number of points of every match, minutes, probabilities and the number of timelines
+             that could not be extracted.
+    """
+    model = NumpyModel(model_file)
+    extractor = TimelineExtractor()
+    match_ids = []
+    games = []
+    failed = 0
+    for match_id, payload in read_shard(path, entries):
+        try:
+            games.append(extractor.extract_frames(decode_payload(payload)))
+        except (KeyError, IndexError, TypeError, ValueError):
+            failed += 1
+            continue
+        match_ids.append(match_id)
+    return (match_ids, *score_frames(model, games), failed)
+
+
+@instrumented()
+def score_curves(cache_dir: str, model_dir: str, output_file: str, workers: int = None) -> int:
+    """
+    Scores every frame of every cached timeline and writes the win probability curves of the games.
+
+    Args:
+    :argument: cache_dir (str): Directory of the raw timeline cache.
+    :argument: model_dir (str): Directory of the model artifact, see NeuralNetworkClassifier.save.
+    :argument: output_file (str): Path to the output .npz file.
+    :argument: workers (int): Number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+    :return: int: Number of games scored.
+    """
+    load_artifact(model_dir)  # Fails early when the model does not fit the features
+    model_file = os.path.join(model_dir, WEIGHTS_FILE)
+    with TimelineCache(cache_dir) as cache:
+        jobs = [(cache.shard_path(shard), cache.shard_entries(shard, TIMELINE)) for shard in cache.shards()]
+
+    match_ids, lengths, minutes, probabilities = [], [], [], []
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(_score_shard, path, entries, model_file) for path, entries in jobs if entries]
+        for future in futures:
+            shard_ids, shard_lengths, shard_minutes, shard_probabilities, shard_failed = future.result()
+            match_ids.extend(shard_ids)
+            lengths.append(shard_lengths)
+            minutes.append(shard_minutes)
+            probabilities.append(shard_probabilities)
+            failed += shard_failed
+
+    offsets = np.zeros(len(match_ids) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(lengths or [np.empty(0, dtype=np.int64)]), out=offsets[1:])
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    np.savez(output_file, match_ids=np.array(match_ids, dtype=str), offsets=offsets,
+             minutes=np.concatenate(minutes or [np.empty(0, dtype=np.float32)]),
+             probabilities=np.concatenate(probabilities or [np.empty(0, dtype=np.float32)]))
+
+    count('rows', int(offsets[-1]))
+    count('games', len(match_ids))
+    count('failed', failed)
+    print(f'Scored {offsets[-1]} frames of {len(match_ids)} games, {failed} timelines could not be extracted')
+    return len(match_ids)
+
+
+class WinCurves:
+    def __init__(self, curves_file: str) -> None:
+        """
+        Win probability curves written by score_curves, looked up by match ID.
+
+        Args:
+        :argument: curves_file (str): Path to the .npz file.
+        """
+        with np.load(curves_file) as curves:
+            self.match_ids = curves['match_ids']
+            self.offsets = curves['offsets']
+            self.minutes = curves['minutes']
+            self.probabilities = curves['probabilities']
+        self._index = {match_id: index for index, match_id in enumerate(self.match_ids.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.match_ids)
+
+    def __contains__(self, match_id: str) -> bool:
+        return match_id in self._index
+
+    def __getitem__(self, match_id: str) -> tuple:
+        """
+        Returns the minutes and the blue team win probabilities of the points of a game.
+        """
+        index = self._index[match_id]
+        points = slice(self.offsets[index], self.offsets[index + 1])
+        return self.minutes[points], self.probabilities[points]
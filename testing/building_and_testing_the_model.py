@@ -1,15 +1,15 @@
 from keras.regularizers import l1, l2
 from matplotlib import pyplot as plt
-from numpy import loadtxt
+from numpy import load
 from keras.optimizers import Adam
 from keras.models import Sequential
 from keras.layers import Dense, Normalization, Input, PReLU
 from sklearn.metrics import roc_curve, roc_auc_score, accuracy_score, precision_score, recall_score, f1_score, \
     confusion_matrix
 
-dataset_train = loadtxt('../Data/prepared_data_train.csv', delimiter=',')
-dataset_test = loadtxt('../Data/prepared_data_test.csv', delimiter=',')
-dataset_val = loadtxt('../Data/prepared_data_val.csv', delimiter=',')
+dataset_train = load('../Data/prepared_data_train.npy', mmap_mode='r')
+dataset_test = load('../Data/prepared_data_test.npy', mmap_mode='r')
+dataset_val = load('../Data/prepared_data_val.npy', mmap_mode='r')
 
 dataset_train_values = dataset_train[:, 0:13]
 dataset_train_win = dataset_train[:, 13]
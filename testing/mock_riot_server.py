@@ -0,0 +1,288 @@
+"""
+Local stand-in for the Riot API used to run the collectors offline.
+
+It serves generated league entries, summoners, match ID lists, match details and timelines and enforces the same
+application and method rate limits as a personal development key, answering with Riot-style headers and
+429 responses. Start it with:
+
+    python -m testing.mock_riot_server --port 8080
+
+and point the collectors at it with RiotClient(API_key, url_template='http://127.0.0.1:8080/{route}').
+
+Timelines come from testing.timeline_generator, calibrated on the collected data. To measure the collectors under
+realistic conditions the server can answer late, fail a share of the requests and throttle like Riot's services
+do when they are busy, e.g. --latency 0.08 --latency-jitter 0.03 --error-rate 0.01 --throttle-rate 0.02.
+"""
+import argparse
+import asyncio
+import http
+import random
+import time
+import zlib
+
+from aiohttp import web
+
+from testing.timeline_generator import TimelineGenerator, game_start_timestamp, match_details
+
+APP_RATE_LIMIT = '20:1,100:120'
+METHOD_RATE_LIMITS = {
+    'league-exp-v4.entries': '50:10',
+    'summoner-v4.by-id': '1600:60',
+    'match-v5.ids-by-puuid': '2000:10',
+    'match-v5.match': '2000:10',
+    'match-v5.timeline': '2000:10',
+}
+PAGE_SIZE = 205
+MATCH_NUMBER_BASE = 3599980000
+
+
+class FixedWindowLimit:
+    def __init__(self, header: str) -> None:
+        """
+        Riot-style fixed window counters. A window starts with the first request made after the previous one ended.
+
+        Args:
+        :argument: header (str): Limits in the X-App-Rate-Limit format, e.g. '20:1,100:120'.
+        """
+        self.header = header
+        self.windows = []
+        for window in header.split(','):
+            count, seconds = window.split(':')
+            self.windows.append([int(count), float(seconds), 0.0, 0])  # limit, length, start, count
+
+    def hit(self, now: float) -> float:
+        """
+        Counts a request. Returns 0 when it is allowed, otherwise the number of seconds until it would be.
+        """
+        for window in self.windows:
+            if now - window[2] >= window[1]:
+                window[2], window[3] = now, 0
+        retry_after = max((window[2] + window[1] - now for window in self.windows if window[3] >= window[0]),
+                          default=0.0)
+        if retry_after > 0:
+            return retry_after
+        for window in self.windows:
+            window[3] += 1
+        return 0.0
+
+    def counts(self) -> str:
+        return ','.join(f'{window[3]}:{int(window[1])}' for window in self.windows)
+
+
+def game_start(number: int) -> int:
+    """
+    Epoch seconds the generated game with the given number (relative to MATCH_NUMBER_BASE) started at,
+    the newest one started now.
+    """
+    return int(time.time()) - (20000 - number) * 600
+
+
+def _rng(*parts) -> random.Random:
+    return random.Random(zlib.crc32('/'.join(str(part) for part in parts).encode()))
+
+
+def generate_timeline(match_id: str) -> dict:
+    """
+    Generates a deterministic match-v5 timeline containing every field the collectors read.
+
+    Args:
+    :argument: match_id (str): Match ID, used as the random seed.
+
+    Returns:
+    :return: dict: Timeline in the match-v5 format.
+    """
+    rng = _rng('timeline', match_id)
+    minutes = rng.randint(16, 40)
+    blue_strength = rng.gauss(0, 1)
+    frames = []
+    gold = {p: 500 for p in range(1, 11)}
+    minions = {p: 0 for p in range(1, 11)}
+    jungle = {p: 0 for p in range(1, 11)}
+    first_blood = True
+
+    for minute in range(minutes + 1):
+        timestamp = minute * 60000 + (rng.randint(0, 600) if minute else 0)
+        events = []
+        for _ in range(rng.randint(2, 6)):
+            events.append({'type': 'WARD_PLACED', 'creatorId': rng.randint(1, 10), 'timestamp': timestamp})
+        for _ in range(rng.randint(0, 2)):
+            events.append({'type': 'WARD_KILL', 'killerId': rng.randint(1, 10), 'timestamp': timestamp})
+        for _ in range(rng.randint(0, 2) if minute > 1 else 0):
+            killer = rng.randint(1, 5) if rng.random() < 0.5 + blue_strength / 10 else rng.randint(6, 10)
+            team = range(1, 6) if killer <= 5 else range(6, 11)
+            assists = rng.sample([p for p in team if p != killer], rng.randint(0, 3))
+            events.append({'type': 'CHAMPION_KILL', 'killerId': killer, 'assistingParticipantIds': assists,
+                           'timestamp': timestamp})
+            if first_blood:
+                events.append({'type': 'CHAMPION_SPECIAL_KILL', 'killType': 'KILL_FIRST_BLOOD', 'killerId': killer,
+                               'timestamp': timestamp})
+                first_blood = False
+        if minute > 5 and rng.random() < 0.3:
+            monster = rng.choice(['DRAGON', 'RIFTHERALD', 'HORDE'])
+            events.append({'type': 'ELITE_MONSTER_KILL', 'monsterType': monster, 'killerId': rng.randint(1, 10),
+                           'timestamp': timestamp})
+        if minute > 10 and rng.random() < 0.3:
+            events.append({'type': 'BUILDING_KILL', 'buildingType': 'TOWER_BUILDING', 'killerId': rng.randint(1, 10),
+                           'timestamp': timestamp})
+
+        participant_frames = {}
+        for participant in range(1, 11):
+            bonus = blue_strength if participant <= 5 else -blue_strength
+            gold[participant] += int(rng.gauss(380 + 25 * bonus, 40)) if minute else 0
+            minions[participant] += rng.randint(4, 9) if minute > 1 else 0
+            jungle[participant] += rng.randint(0, 2) if minute > 1 else 0
+            participant_frames[str(participant)] = {
+                'participantId': participant, 'totalGold': gold[participant], 'level': min(18, 1 + minute * 2 // 3),
+                'minionsKilled': minions[participant], 'jungleMinionsKilled': jungle[participant]}
+        frames.append({'timestamp': timestamp, 'events': events, 'participantFrames': participant_frames})
+
+    winning_team = 100 if rng.gauss(blue_strength, 1) > 0 else 200
+    frames[-1]['events'].append({'type': 'GAME_END', 'winningTeam': winning_team, 'timestamp': frames[-1]['timestamp'],
+                                 'realTimestamp': game_start_timestamp(match_id) + frames[-1]['timestamp']})
+    participants = [f'{match_id}-puuid-{p}' for p in range(1, 11)]
+    return {'metadata': {'matchId': match_id, 'participants': participants},
+            'info': {'frameInterval': 60000, 'frames': frames}}
+
+
+def create_app(app_rate_limit: str = APP_RATE_LIMIT, platform_prefix: str = 'EUN1', latency: float = 0.0,
+               latency_jitter: float = 0.0, error_rate: float = 0.0, throttle_rate: float = 0.0,
+               method_rate_limits: dict = None, timeline_source=None, seed: int = 0) -> web.Application:
+    """
+    Creates the mock server application.
+
+    Args:
+    :argument: app_rate_limit (str): Application rate limit enforced per routing value.
+    :argument: platform_prefix (str): Prefix of the generated match IDs of PUUIDs not generated by this server.
+    :argument: latency (float): Mean number of seconds every answered request takes.
+    :argument: latency_jitter (float): Standard deviation of the latency.
+    :argument: error_rate (float): Share of requests answered with 500, 502, 503 or 504.
+    :argument: throttle_rate (float): Share of requests answered with a service 429 (without X-Rate-Limit-Type,
+                                      not counted by the application and method limits).
+    :argument: method_rate_limits (dict): Method name -> limit replacing some of METHOD_RATE_LIMITS, e.g. to
+                                          load-test the collectors far beyond a development key.
+    :argument: timeline_source: Function returning the timeline of a match ID, as a dict or as encoded JSON.
+                                Defaults to TimelineGenerator(seed=seed).generate, generate_timeline gives smaller
+                                timelines.
+    :argument: seed (int): Seed of the timelines, latencies, errors and throttled requests.
+
+    Returns:
+    :return: web.Application: aiohttp application, run it with web.run_app or aiohttp's test utilities.
+    """
+    app_limits = {}
+    method_limits = {}
+    method_rate_limits = {**METHOD_RATE_LIMITS, **(method_rate_limits or {})}
+    rng = random.Random(seed)
+    timeline_source = timeline_source or TimelineGenerator(seed=seed).generate
+
+    def limited(method: str):
+        def decorator(handler):
+            async def wrapper(request: web.Request) -> web.Response:
+                route = request.match_info['route']
+                app_limit = app_limits.setdefault(route, FixedWindowLimit(app_rate_limit))
+                method_limit = method_limits.setdefault((route, method), FixedWindowLimit(method_rate_limits[method]))
+                now = time.monotonic()
+                headers = {'X-App-Rate-Limit': app_limit.header, 'X-Method-Rate-Limit': method_limit.header}
+
+                retry_after = app_limit.hit(now)
+                limit_type = 'application'
+                if not retry_after:
+                    retry_after = method_limit.hit(now)
+                    limit_type = 'method'
+                headers['X-App-Rate-Limit-Count'] = app_limit.counts()
+                headers['X-Method-Rate-Limit-Count'] = method_limit.counts()
+                request.app['stats']['requests'] += 1
+                if retry_after:
+                    request.app['stats']['throttled'] += 1
+                    headers.update({'Retry-After': str(int(retry_after) + 1), 'X-Rate-Limit-Type': limit_type})
+                    return web.json_response({'status': {'message': 'Rate limit exceeded', 'status_code': 429}},
+                                             status=429, headers=headers)
+                if 'X-Riot-Token' not in request.headers:
+                    return web.json_response({'status': {'message': 'Unauthorized', 'status_code': 401}},
+                                             status=401, headers=headers)
+                if latency or latency_jitter:
+                    await asyncio.sleep(max(rng.gauss(latency, latency_jitter), 0.0))
+                if throttle_rate and rng.random() < throttle_rate:
+                    request.app['stats']['throttled'] += 1
+                    headers['Retry-After'] = '1'
+                    return web.json_response({'status': {'message': 'Rate limit exceeded', 'status_code': 429}},
+                                             status=429, headers=headers)
+                if error_rate and rng.random() < error_rate:
+                    request.app['stats']['errors'] += 1
+                    status = rng.choice([500, 502, 503, 504])
+                    return web.json_response({'status': {'message': http.HTTPStatus(status).phrase,
+                                                         'status_code': status}}, status=status, headers=headers)
+                response = await handler(request)
+                response.headers.update(headers)
+                return response
+            return wrapper
+        return decorator
+
+    @limited('league-exp-v4.entries')
+    async def league_entries(request: web.Request) -> web.Response:
+        tier = request.match_info['tier']
+        page = int(request.query.get('page', 1))
+        size = {'CHALLENGER': 300, 'GRANDMASTER': 700, 'MASTER': 3000}.get(tier, 10000)
+        first = (page - 1) * PAGE_SIZE
+        entries = [{'summonerId': f'{request.match_info["route"]}-{tier}-summoner-{n}',
+                    'puuid': f'{request.match_info["route"]}-{tier}-puuid-{n}', 'tier': tier,
+                    'rank': request.match_info['division'], 'leaguePoints': 1000 - n}
+                   for n in range(first, min(first + PAGE_SIZE, size))]
+        return web.json_response(entries)
+
+    @limited('summoner-v4.by-id')
+    async def summoner(request: web.Request) -> web.Response:
+        summoner_id = request.match_info['summoner_id']
+        return web.json_response({'id': summoner_id, 'puuid': summoner_id.replace('summoner', 'puuid')})
+
+    @limited('match-v5.ids-by-puuid')
+    async def match_ids(request: web.Request) -> web.Response:
+        puuid = request.match_info['puuid']
+        start = int(request.query.get('start', 0))
+        count = int(request.query.get('count', 20))
+        start_time = int(request.query.get('startTime', 0))
+        rng = _rng('ids', puuid)
+        # Players of the same ladder share most of their games, like the real high elo ladder does
+        numbers = sorted({rng.randint(0, 20000) for _ in range(300)})
+        prefix = puuid.split('-')[0].upper() if '-' in puuid else platform_prefix  # Generated PUUIDs name their server
+        history = [f'{prefix}_{MATCH_NUMBER_BASE + number}' for number in reversed(numbers)
+                   if game_start(number) >= start_time]  # Newest first
+        return web.json_response(history[start:start + count])
+
+    @limited('match-v5.match')
+    async def match(request: web.Request) -> web.Response:
+        return web.json_response(match_details(request.match_info['match_id']))
+
+    @limited('match-v5.timeline')
+    async def timeline(request: web.Request) -> web.Response:
+        timeline = timeline_source(request.match_info['match_id'])
+        if isinstance(timeline, bytes):
+            return web.Response(body=timeline, content_type='application/json')
+        return web.json_response(timeline)
+
+    app = web.Application()
+    app['stats'] = {'requests': 0, 'throttled': 0, 'errors': 0}
+    app.router.add_get('/{route}/lol/league-exp/v4/entries/{queue}/{tier}/{division}', league_entries)
+    app.router.add_get('/{route}/lol/summoner/v4/summoners/{summoner_id}', summoner)
+    app.router.add_get('/{route}/lol/match/v5/matches/by-puuid/{puuid}/ids', match_ids)
+    app.router.add_get('/{route}/lol/match/v5/matches/{match_id}', match)
+    app.router.add_get('/{route}/lol/match/v5/matches/{match_id}/timeline', timeline)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mock Riot API server enforcing development key rate limits.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--app-rate-limit', default=APP_RATE_LIMIT)
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean seconds every request takes.')
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help='Standard deviation of the latency.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with a 5xx.')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of requests answered with a service 429.')
+    parser.add_argument('--simple-timelines', action='store_true',
+                        help='Serve the small generate_timeline timelines instead of calibrated ones.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.app_rate_limit, latency=args.latency, latency_jitter=args.latency_jitter,
+                           error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                           timeline_source=generate_timeline if args.simple_timelines else None, seed=args.seed),
+                host='127.0.0.1', port=args.port)
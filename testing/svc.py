@@ -1,5 +1,5 @@
 import matplotlib.pyplot as plt
-from numpy import loadtxt
+from numpy import load
 from sklearn.metrics import confusion_matrix, accuracy_score, f1_score, recall_score, precision_score, roc_auc_score, \
     roc_curve
 from sklearn.preprocessing import StandardScaler
@@ -11,8 +11,8 @@ clf = SVC(kernel='linear')
 # POLY -> 75.51% (ACC)
 sc = StandardScaler()
 
-dataset_train = loadtxt('../Data/prepared_data_train.csv', delimiter=',')
-dataset_test = loadtxt('../Data/prepared_data_test.csv', delimiter=',')
+dataset_train = load('../Data/prepared_data_train.npy', mmap_mode='r')
+dataset_test = load('../Data/prepared_data_test.npy', mmap_mode='r')
 
 dataset_train_values = dataset_train[:, 0:13]
 Y_train = dataset_train[:, 13]
@@ -0,0 +1,382 @@
+"""
+Realistic match-v5 timelines at any volume, to load-test the collection and extraction pipeline offline.
+
+The team totals at the 15 minutes mark (gold, minions, jungle monsters, levels, kills, assists, wards and
+objectives) are drawn from distributions calibrated on the collected match data, correlated through the gold lead
+of the blue team, and the winner is drawn from the gold lead like in the real games. Frames and events
+are then laid out so that TimelineExtractor reads exactly these totals back, and the rest of the game, the
+participant stats and the item and skill events the extractor skips are filled in so a timeline has the shape
+and roughly the size of a real one.
+
+The calibration is kept in timeline_calibration.json next to this module, refresh it after collecting new data with:
+
+    python -m testing.timeline_generator calibrate --data Data/final_data.feather
+
+and write timelines for extraction benchmarks with:
+
+    python -m testing.timeline_generator write --count 10000 --output timelines.jsonl
+"""
+import argparse
+import json
+import math
+import os
+import random
+import zlib
+
+CALIBRATION_FILE = os.path.join(os.path.dirname(__file__), 'timeline_calibration.json')
+CUTOFF_MINUTE = 15  # Minute mark the calibrated totals are taken at
+
+# Team totals at the cutoff: name -> (match data column, factor turning the column into a count of the timeline)
+TEAM_STATS = {
+    'gold': ('TotalGold', 1),
+    'minions': ('TotalMinionsKilled', 1),
+    'jungle': ('TotalJungleMonstersKilled', 1),
+    'levels': ('AvgLevel', 5),
+    'kills': ('Kills', 1),
+    'assists': ('Assists', 1),
+    'wards_placed': ('WardsPlaced', 5),
+    'wards_destroyed': ('WardsDestroyed', 5),
+    'dragons': ('DragonsKilled', 1),
+    'heralds': ('HeraldsKilled', 1),
+    'void_grubs': ('VoidGrubsKilled', 1),
+    'towers': ('TowersDestroyed', 1),
+}
+# Earliest minute an event can happen in, the objectives spawn later in the game
+FIRST_MINUTE = {'kills': 2, 'wards_placed': 1, 'wards_destroyed': 3, 'dragons': 5, 'heralds': 14, 'void_grubs': 6,
+                'towers': 8}
+MONSTER_TYPES = {'dragons': 'DRAGON', 'heralds': 'RIFTHERALD', 'void_grubs': 'HORDE'}
+# Share of the team's gold, minions, jungle monsters and levels of the top, jungle, mid, bottom and support player
+ROLE_SHARES = {
+    'gold': (0.22, 0.2, 0.22, 0.23, 0.13),
+    'minions': (0.28, 0.03, 0.3, 0.33, 0.06),
+    'jungle': (0.04, 0.86, 0.04, 0.04, 0.02),
+    'levels': (0.21, 0.2, 0.21, 0.2, 0.18),
+}
+GAME_EPOCH = 1_704_067_200_000  # Generated games start in the year after this (2024-01-01 UTC, ms)
+PATCH_DAYS = 14  # A new patch every two weeks, like the live game
+ITEMS = (1001, 1036, 1037, 1038, 1052, 1055, 1056, 1058, 2003, 2055, 3006, 3020, 3047, 3067, 3134, 3802, 6653)
+
+
+def calibrate(data_file: str = 'Data/final_data.feather', output_file: str = CALIBRATION_FILE) -> dict:
+    """
+    Fits the distributions of the generator to collected match data.
+
+    The gold of both teams together and the gold lead of the blue team (which the hidden strength stands for),
+    and for every team total: the mean and standard deviation on each side, the correlation with the team's gold
+    lead and the largest value of one team and of both teams together. The game duration is kept as
+    percentiles, the winner as a logistic regression on the gold lead.
+
+    Args:
+    :argument: data_file (str): Feather file with clean match data, see clean_data.data_to_final.
+    :argument: output_file (str): Path to save the calibration to as JSON.
+
+    Returns:
+    :return: dict: The calibration.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.read_feather(data_file)
+    gold_lead = (df['blueTeamTotalGold'] - df['redTeamTotalGold']).to_numpy(dtype=np.float64)
+    stats = {}
+    for name, (column, factor) in TEAM_STATS.items():
+        blue = df['blueTeam' + column].to_numpy(dtype=np.float64) * factor
+        red = df['redTeam' + column].to_numpy(dtype=np.float64) * factor
+        correlation = (np.corrcoef(blue, gold_lead)[0, 1] + np.corrcoef(red, -gold_lead)[0, 1]) / 2
+        stats[name] = {'blue': [blue.mean(), blue.std()], 'red': [red.mean(), red.std()],
+                       'correlation': 0.0 if np.isnan(correlation) else correlation,
+                       'max': max(blue.max(), red.max()), 'total_max': (blue + red).max()}
+
+    # Logistic regression of the win on the gold lead in thousands, fitted with Newton's method
+    x = np.column_stack([np.ones(len(df)), gold_lead / 1000])
+    y = (df['blueTeamWin'] == 1).to_numpy(dtype=np.float64)
+    weights = np.zeros(2)
+    for _ in range(25):
+        p = 1 / (1 + np.exp(-x @ weights))
+        weights += np.linalg.solve((x * (p * (1 - p))[:, None]).T @ x, x.T @ (y - p))
+
+    gold_total = (df['blueTeamTotalGold'] + df['redTeamTotalGold']).to_numpy(dtype=np.float64)
+    calibration = {
+        'source': os.path.basename(data_file),
+        'rows': len(df),
+        'cutoff_minute': CUTOFF_MINUTE,
+        'gold_lead': [gold_lead.mean(), gold_lead.std()],
+        'gold_total': [gold_total.mean(), gold_total.std()],
+        'stats': stats,
+        'duration_percentiles': np.percentile(df['gameDuration'], np.arange(101)).round(3).tolist(),
+        'win': {'intercept': weights[0], 'gold_lead_per_1000': weights[1]},
+    }
+    calibration = json.loads(json.dumps(calibration, default=float))  # NumPy scalars to plain floats
+    with open(output_file, 'w') as f:
+        json.dump(calibration, f, indent=4)
+    return calibration
+
+
+def game_start_timestamp(match_id: str) -> int:
+    """
+    Epoch milliseconds the generated game with the given match ID started at, within a year of GAME_EPOCH.
+    """
+    return GAME_EPOCH + zlib.crc32(f'start/{match_id}'.encode()) * (365 * 86_400_000) // 2 ** 32
+
+
+def match_details(match_id: str) -> dict:
+    """
+    The fields of the match-v5 match details the pipeline reads: the start and the patch of the game.
+    """
+    start = game_start_timestamp(match_id)
+    patch = 1 + (start - GAME_EPOCH) // (PATCH_DAYS * 86_400_000)
+    return {'metadata': {'dataVersion': '2', 'matchId': match_id},
+            'info': {'gameCreation': start - 60_000, 'gameStartTimestamp': start, 'queueId': 420,
+                     'gameVersion': f'14.{patch}.{600 + patch}.{zlib.crc32(match_id.encode()) % 9000 + 1000}',
+                     'platformId': match_id.partition('_')[0]}}
+
+
+def _split(total: int, shares: tuple, rng: random.Random) -> list:
+    """
+    Splits a total into integers roughly proportional to the jittered shares, summing exactly to the total.
+    """
+    weights = [share * rng.uniform(0.8, 1.2) for share in shares]
+    scale = total / sum(weights)
+    parts = [int(weight * scale) for weight in weights]
+    for index in sorted(range(len(parts)), key=lambda i: weights[i] * scale - parts[i], reverse=True):
+        if sum(parts) == total:
+            break
+        parts[index] += 1
+    return parts
+
+
+class TimelineGenerator:
+    def __init__(self, calibration_file: str = CALIBRATION_FILE, seed: int = 0) -> None:
+        """
+        Generates match-v5 timelines whose features follow the calibrated distributions.
+
+        A timeline only depends on the seed and the match ID, so the same match always gets the same timeline.
+
+        Args:
+        :argument: calibration_file (str): JSON file written by calibrate.
+        :argument: seed (int): Seed mixed into the seed of every match.
+        """
+        with open(calibration_file, 'r') as f:
+            self.calibration = json.load(f)
+        self.seed = seed
+        self.cutoff_minute = self.calibration['cutoff_minute']
+
+    def _totals(self, rng: random.Random) -> tuple:
+        """
+        Draws the blue and red team totals at the cutoff and the winning team.
+        """
+        strength = rng.gauss(0, 1)  # The standardized gold lead of the blue team
+        lead = self.calibration['gold_lead'][0] + self.calibration['gold_lead'][1] * strength
+        total = rng.gauss(*self.calibration['gold_total'])
+        totals = {}
+        for team, sign in (('blue', 1), ('red', -1)):
+            values = {'gold': int(round(max(total + sign * lead, 5000) / 2))}
+            for name, stat in self.calibration['stats'].items():
+                if name == 'gold':
+                    continue
+                mean, std = stat[team]
+                r = stat['correlation']
+                value = mean + std * (r * sign * strength + math.sqrt(1 - r * r) * rng.gauss(0, 1))
+                values[name] = min(max(int(round(value)), 0), int(stat['max']))
+            values['levels'] = min(max(values['levels'], 5), 90)
+            values['assists'] = min(values['assists'], 4 * values['kills'])
+            totals[team] = values
+
+        for name in ('dragons', 'heralds', 'void_grubs', 'towers'):  # Both teams share the objectives
+            while totals['blue'][name] + totals['red'][name] > self.calibration['stats'][name]['total_max']:
+                larger = max(('blue', 'red'), key=lambda team: (totals[team][name], rng.random()))
+                totals[larger][name] -= 1
+
+        win = self.calibration['win']
+        lead = (totals['blue']['gold'] - totals['red']['gold']) / 1000
+        blue_wins = rng.random() < 1 / (1 + math.exp(-(win['intercept'] + win['gold_lead_per_1000'] * lead)))
+        return totals, 100 if blue_wins else 200
+
+    def _duration(self, rng: random.Random) -> int:
+        """
+        Draws the game duration in milliseconds, at least half a minute past the cutoff.
+        """
+        percentiles = self.calibration['duration_percentiles']
+        position = rng.uniform(0, len(percentiles) - 1)
+        low = int(position)
+        high = min(low + 1, len(percentiles) - 1)
+        seconds = percentiles[low] + (percentiles[high] - percentiles[low]) * (position - low)
+        return int(max(seconds, self.cutoff_minute * 60 + 30) * 1000)
+
+    def generate(self, match_id: str) -> dict:
+        """
+        Generates the timeline of a match.
+
+        Args:
+        :argument: match_id (str): Match ID, seeds the match together with the seed of the generator.
+
+        Returns:
+        :return: dict: Timeline in the match-v5 format.
+        """
+        rng = random.Random(zlib.crc32(f'{self.seed}/{match_id}'.encode()))
+        totals, winning_team = self._totals(rng)
+        duration = self._duration(rng)
+        cutoff = self.cutoff_minute
+        last_minute = duration // 60000
+        events = [[] for _ in range(last_minute + 2)]  # Events of frame m happened in the minute before it
+        teams = {'blue': range(1, 6), 'red': range(6, 11)}
+
+        def add(first_minute: int, last: int, event: dict) -> None:
+            minute = rng.randint(first_minute, last)
+            end = min(minute * 60000, duration)
+            event['timestamp'] = rng.randint(max((minute - 1) * 60000, 0), end)
+            events[minute].append(event)
+
+        # Per player values at the cutoff, the frames grow towards them
+        players = {}
+        for team, participants in teams.items():
+            shares = {name: _split(totals[team][name], ROLE_SHARES[name], rng) for name in ROLE_SHARES}
+            levels = shares['levels']
+            for index in range(10):  # Levels are 1..18, move levels of capped players to the next one
+                overflow = max(levels[index % 5] - 18, 0) + min(levels[index % 5] - 1, 0)
+                levels[index % 5] -= overflow
+                levels[(index + 1) % 5] += overflow
+            for index, participant in enumerate(participants):
+                players[participant] = {name: shares[name][index] for name in ROLE_SHARES}
+
+        # Counted events before the cutoff, then the same rates until the end of the game
+        post_cutoff = max(last_minute - cutoff, 0)
+        for team, participants in teams.items():
+            enemies = teams['red' if team == 'blue' else 'blue']
+            kills = totals[team]['kills']
+            assists = [0] * kills
+            for _ in range(totals[team]['assists']):  # At most 4 helpers per kill, the total was capped to fit
+                assists[rng.choice([index for index, count in enumerate(assists) if count < 4])] += 1
+            late_kills = int(kills / cutoff * post_cutoff * rng.uniform(0.8, 1.5))
+            for index in range(kills + late_kills):
+                killer = rng.choice(participants)
+                count = assists[index] if index < kills else rng.randint(0, 4)
+                helpers = rng.sample([p for p in participants if p != killer], count)
+                first, last = (FIRST_MINUTE['kills'], cutoff) if index < kills else (cutoff + 1, last_minute + 1)
+                add(first, last, {'type': 'CHAMPION_KILL', 'killerId': killer, 'victimId': rng.choice(enemies),
+                                  'assistingParticipantIds': helpers, 'bounty': 300, 'shutdownBounty': 0,
+                                  'position': {'x': rng.randint(0, 14800), 'y': rng.randint(0, 14800)}})
+
+            for name, (event_type, key) in (('wards_placed', ('WARD_PLACED', 'creatorId')),
+                                            ('wards_destroyed', ('WARD_KILL', 'killerId'))):
+                count = totals[team][name]
+                for index in range(count + int(count / cutoff * post_cutoff)):
+                    first, last = (FIRST_MINUTE[name], cutoff) if index < count else (cutoff + 1, last_minute + 1)
+                    add(first, last, {'type': event_type, key: rng.choice(participants),
+                                      'wardType': rng.choice(['YELLOW_TRINKET', 'CONTROL_WARD', 'SIGHT_WARD'])})
+
+            for name, monster in MONSTER_TYPES.items():
+                for _ in range(totals[team][name]):
+                    add(FIRST_MINUTE[name], cutoff, {'type': 'ELITE_MONSTER_KILL', 'monsterType': monster,
+                                                     'killerId': participants[1], 'killerTeamId': 100 if team == 'blue'
+                                                     else 200, 'assistingParticipantIds': []})
+            for _ in range(totals[team]['towers']):
+                add(FIRST_MINUTE['towers'], cutoff, {'type': 'BUILDING_KILL', 'buildingType': 'TOWER_BUILDING',
+                                                     'killerId': rng.choice(participants),
+                                                     'teamId': 200 if team == 'blue' else 100,
+                                                     'towerType': 'OUTER_TURRET', 'laneType': 'BOT_LANE'})
+
+        for frame_events in events:
+            frame_events.sort(key=lambda event: event['timestamp'])
+        first_kill = next((event for frame_events in events for event in frame_events
+                           if event['type'] == 'CHAMPION_KILL'), None)
+        if first_kill is not None:
+            for frame_events in events:
+                if first_kill in frame_events:
+                    frame_events.insert(frame_events.index(first_kill) + 1, {
+                        'type': 'CHAMPION_SPECIAL_KILL', 'killType': 'KILL_FIRST_BLOOD',
+                        'killerId': first_kill['killerId'], 'timestamp': first_kill['timestamp']})
+                    break
+
+        frames = []
+        previous_levels = {participant: 1 for participant in players}
+        for minute in range(last_minute + 2):
+            if minute > last_minute:
+                timestamp = duration
+            else:
+                timestamp = min(minute * 60000 + (rng.randint(1, 600) if minute else 0), duration - 1)
+            progress = timestamp / (cutoff * 60000)
+            participant_frames = {}
+            for participant, player in players.items():
+                gold = 500 + (player['gold'] - 500) * (progress ** 1.1 if progress <= 1 else 1.1 * progress - 0.1)
+                farm = max(progress - 0.1, 0) / 0.9
+                level = min(18, 1 + round((player['levels'] - 1) * min(progress, 1) ** 0.8
+                                          + max(progress - 1, 0) * 5))
+                if minute == cutoff:
+                    level = player['levels']
+                for _ in range(level - previous_levels[participant]):
+                    frame_events = events[minute]
+                    frame_events.append({'type': 'LEVEL_UP', 'participantId': participant, 'level': level,
+                                         'timestamp': timestamp})
+                    frame_events.append({'type': 'SKILL_LEVEL_UP', 'participantId': participant,
+                                         'skillSlot': rng.randint(1, 4), 'levelUpType': 'NORMAL',
+                                         'timestamp': timestamp})
+                previous_levels[participant] = level
+                if minute and rng.random() < 0.35:
+                    events[minute].append({'type': 'ITEM_PURCHASED', 'participantId': participant,
+                                           'itemId': rng.choice(ITEMS), 'timestamp': timestamp})
+                participant_frames[str(participant)] = {
+                    'participantId': participant,
+                    'totalGold': round(gold) if minute != cutoff else player['gold'],
+                    'currentGold': rng.randint(0, 1500),
+                    'goldPerSecond': 0 if minute == 0 else 20,
+                    'level': level,
+                    'xp': int(280 * level ** 1.5),
+                    'minionsKilled': round(player['minions'] * farm) if minute != cutoff else player['minions'],
+                    'jungleMinionsKilled': round(player['jungle'] * farm) if minute != cutoff else player['jungle'],
+                    'timeEnemySpentControlled': rng.randint(0, 2000) * minute,
+                    'position': {'x': rng.randint(0, 14800), 'y': rng.randint(0, 14800)},
+                    'championStats': {'abilityPower': 0, 'armor': 30 + 4 * level, 'attackDamage': 60 + 3 * level,
+                                      'attackSpeed': 100 + 2 * level, 'health': 600 + 90 * level,
+                                      'healthMax': 600 + 90 * level, 'magicResist': 30 + level,
+                                      'movementSpeed': 335, 'power': 300 + 40 * level, 'powerMax': 300 + 40 * level},
+                    'damageStats': {'magicDamageDone': rng.randint(0, 4000) * minute,
+                                    'physicalDamageDone': rng.randint(0, 6000) * minute,
+                                    'totalDamageDone': rng.randint(0, 10000) * minute,
+                                    'totalDamageDoneToChampions': rng.randint(0, 1000) * minute,
+                                    'totalDamageTaken': rng.randint(0, 1200) * minute,
+                                    'trueDamageDone': rng.randint(0, 500) * minute},
+                }
+            frames.append({'timestamp': timestamp, 'events': events[minute], 'participantFrames': participant_frames})
+
+        frames[-1]['events'].append({'type': 'GAME_END', 'winningTeam': winning_team, 'timestamp': duration,
+                                     'realTimestamp': game_start_timestamp(match_id) + duration,
+                                     'gameId': zlib.crc32(match_id.encode())})
+        participants = [f'{match_id}-puuid-{p}' for p in range(1, 11)]
+        return {'metadata': {'dataVersion': '2', 'matchId': match_id, 'participants': participants},
+                'info': {'endOfGameResult': 'GameComplete', 'frameInterval': 60000, 'frames': frames,
+                         'gameId': zlib.crc32(match_id.encode()),
+                         'participants': [{'participantId': p, 'puuid': participants[p - 1]} for p in range(1, 11)]}}
+
+
+def write_timelines(output_file: str, count: int, seed: int = 0, prefix: str = 'EUN1_') -> None:
+    """
+    Writes generated timelines to a JSON lines file, one timeline per line.
+
+    Args:
+    :argument: output_file (str): Path to the output file.
+    :argument: count (int): Number of timelines.
+    :argument: seed (int): Seed of the generator.
+    :argument: prefix (str): Prefix of the match IDs, followed by the number of the timeline.
+    """
+    generator = TimelineGenerator(seed=seed)
+    with open(output_file, 'w') as f:
+        for number in range(count):
+            f.write(json.dumps(generator.generate(f'{prefix}{number}'), separators=(',', ':')) + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate realistic match-v5 timelines.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    calibrate_parser = subparsers.add_parser('calibrate', help='Fit the generator to collected match data.')
+    calibrate_parser.add_argument('--data', default='Data/final_data.feather')
+    write_parser = subparsers.add_parser('write', help='Write timelines to a JSON lines file.')
+    write_parser.add_argument('--count', type=int, required=True)
+    write_parser.add_argument('--output', required=True)
+    write_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'calibrate':
+        calibrate(args.data)
+    else:
+        write_timelines(args.output, args.count, args.seed)
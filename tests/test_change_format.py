@@ -0,0 +1,8 @@
+from data_processing.change_format import StreamingDeduplicator
+
+
+def test_unseen_after_a_chunk_of_seen_lines():
+    deduplicator = StreamingDeduplicator()
+    assert deduplicator.unseen(['EUN1_1', 'EUN1_2']) == ['EUN1_1', 'EUN1_2']
+    assert deduplicator.unseen(['EUN1_1']) == []
+    assert deduplicator.unseen(['EUN1_3', 'EUN1_2']) == ['EUN1_3']
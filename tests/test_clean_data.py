@@ -0,0 +1,17 @@
+import pandas as pd
+import pyarrow.feather as feather
+
+from data_processing.clean_data import data_to_final
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS, MATCH_ID_COLUMN
+
+
+def test_data_to_final_after_a_chunk_without_valid_rows(tmp_path):
+    rows = [dict.fromkeys(MATCH_DATA_COLUMNS, 1) | {'gameDuration': 1000.0, MATCH_ID_COLUMN: f'EUN1_{match}'}
+            for match in range(15)]
+    for row in rows[:5]:
+        row['blueTeamWin'] = 2
+    feather.write_feather(pd.DataFrame(rows), tmp_path / 'match_data.feather')
+
+    assert data_to_final(str(tmp_path / 'match_data.feather'), str(tmp_path / 'final_data.feather'), chunk_rows=5) == 10
+    assert feather.read_table(tmp_path / 'final_data.feather')[MATCH_ID_COLUMN].to_pylist() == \
+        [f'EUN1_{match}' for match in range(5, 15)]
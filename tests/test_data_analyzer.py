@@ -0,0 +1,71 @@
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+import pyarrow as pa  # noqa: E402
+import pyarrow.feather as feather  # noqa: E402
+import pytest  # noqa: E402
+
+from data_processing import data_analyzer  # noqa: E402
+from data_processing.data_analyzer import DataAnalyzer  # noqa: E402
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS  # noqa: E402
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    rng = np.random.default_rng(0)
+    rows = 2000
+    columns = {column: rng.integers(0, 50, rows).astype(np.float64) for column in MATCH_DATA_COLUMNS}
+    columns['blueTeamWin'] = rng.integers(0, 2, rows).astype(np.float64)
+    columns['redTeamWin'] = 1 - columns['blueTeamWin']
+    columns['blueTeamFirstBlood'] = rng.integers(0, 2, rows).astype(np.float64)
+    columns['redTeamFirstBlood'] = 1 - columns['blueTeamFirstBlood']
+    columns['gameDuration'] = rng.uniform(900, 3000, rows)
+    path = tmp_path / 'final_data.feather'
+    feather.write_feather(pa.table(columns), str(path))
+    return str(path)
+
+
+def test_show_without_output_file_shows_the_figure(monkeypatch):
+    shown = []
+    monkeypatch.setattr(plt, 'show', lambda: shown.append(True))
+    plt.figure()
+    data_analyzer._show()  # Used to call itself until the recursion limit
+    assert shown == [True]
+    plt.close('all')
+
+
+@pytest.mark.parametrize('figure', DataAnalyzer.FIGURES)
+def test_figures_are_saved_to_the_output_file(data_file, tmp_path, figure):
+    output_file = tmp_path / f'{figure}.png'
+    getattr(DataAnalyzer(data_file), figure)(str(output_file))
+    assert output_file.stat().st_size > 0
+    assert not plt.get_fignums()
+
+
+def test_quantile_buckets_hold_the_values_their_labels_describe():
+    values = np.random.default_rng(1).normal(size=10_000).round(1)
+    codes, labels = data_analyzer._bucket(values, 10)
+    assert len(np.unique(codes)) == len(labels)
+    for code, label in enumerate(labels):
+        assert all(value in label for value in np.unique(values[codes == code]))
+    assert values.max() in labels[-1]
+
+
+def test_constant_feature_is_one_bucket():
+    codes, labels = data_analyzer._bucket(np.full(100, 3.0), 10)
+    assert (codes == 0).all() and len(labels) == 1 and 3.0 in labels[0]
+
+
+def test_bucket_edges_need_two_values():
+    with pytest.raises(ValueError):
+        data_analyzer._bucket(np.arange(10.0), [5])
+
+
+def test_winrate_by_counts_every_game(data_file):
+    result = DataAnalyzer(data_file).winrate_by(['GoldPerMinuteDiff', 'blueTeamDragonsKilled'],
+                                                bins={'GoldPerMinuteDiff': 4})
+    assert result['games'].sum() == 2000
+    assert ((result['ci_low'] <= result['winrate']) & (result['winrate'] <= result['ci_high'])).all()
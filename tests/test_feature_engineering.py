@@ -0,0 +1,133 @@
+import struct
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pytest
+
+from data_processing.clean_data import match_keys
+from data_processing.match_store import match_filter, write_dataset
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS, MATCH_ID_COLUMN
+from model import feature_engineering
+from model.feature_engineering import (
+    FEATURE_COLUMNS, SPLITS, _append_npy, _truncate_npy, hash_splits, load_prepared_data, prepare_data,
+    prepared_rows,
+)
+
+
+def _matches(first: int, count: int, region: str = 'EUN1') -> pa.Table:
+    rng = np.random.default_rng(first)
+    columns = {column: rng.integers(1, 60, count).astype(np.float64) for column in MATCH_DATA_COLUMNS}
+    columns['blueTeamWin'] = rng.integers(0, 2, count).astype(np.float64)
+    columns[MATCH_ID_COLUMN] = [f'{region}_{3600000000 + number}' for number in range(first, first + count)]
+    columns['region'] = [region] * count
+    columns['patch'] = ['14.19'] * count
+    columns['date'] = ['2024-10-02'] * count
+    return pa.table(columns)
+
+
+def _prepared_keys(location) -> dict:
+    return {split: np.load(f'{location}/prepared_data_{split}_keys.npy') for split in SPLITS}
+
+
+def test_hash_splits_are_stable_and_follow_the_fractions():
+    keys = match_keys(_matches(0, 20_000).to_pandas()[[MATCH_ID_COLUMN]])
+    splits = hash_splits(keys)
+    assert (splits == hash_splits(keys.copy())).all()
+    assert (splits[:100] == hash_splits(keys[:100])).all()  # Independent of the other keys
+    shares = np.bincount(splits, minlength=3) / len(keys)
+    assert shares[SPLITS.index('test')] == pytest.approx(feature_engineering.TEST_FRACTION, abs=0.01)
+    assert shares[SPLITS.index('val')] == pytest.approx(
+        (1 - feature_engineering.TEST_FRACTION) * feature_engineering.VAL_FRACTION, abs=0.01)
+
+
+def test_prepare_data_only_adds_new_matches(tmp_path):
+    input_file = str(tmp_path / 'final_data.feather')
+    feather.write_feather(_matches(0, 500), input_file)
+    assert prepare_data(input_file, str(tmp_path)) == 500
+    before = _prepared_keys(tmp_path)
+
+    feather.write_feather(pa.concat_tables([_matches(0, 500), _matches(500, 300), _matches(100, 10)]), input_file)
+    assert prepare_data(input_file, str(tmp_path)) == 300
+    assert prepare_data(input_file, str(tmp_path)) == 0
+
+    after = _prepared_keys(tmp_path)
+    for split in SPLITS:  # Prepared matches stay in their set, new ones are appended
+        assert (after[split][:len(before[split])] == before[split]).all()
+    keys = np.concatenate(list(after.values()))
+    assert len(keys) == len(np.unique(keys)) == 800
+    values, target = load_prepared_data(f'{tmp_path}/prepared_data_train.npy')
+    assert values.shape == (len(after['train']), len(FEATURE_COLUMNS)) and len(target) == len(after['train'])
+
+
+def test_prepare_data_reads_new_rows_of_a_dataset(tmp_path):
+    dataset = str(tmp_path / 'final_data')
+    write_dataset(_matches(0, 400).to_batches(), dataset, _matches(0, 1).schema)
+    write_dataset(_matches(0, 200, 'EUW1').to_batches(), dataset, _matches(0, 1).schema)
+    location = tmp_path / 'eun1'
+    location.mkdir()
+    assert prepare_data(dataset, str(location), filter=match_filter(region='EUN1')) == 400
+
+    write_dataset(_matches(0, 450).to_batches(), dataset, _matches(0, 1).schema)  # Replaces the EUN1 partition
+    assert prepare_data(dataset, str(location), filter=match_filter(region='EUN1')) == 50
+    keys = np.concatenate(list(_prepared_keys(location).values()))
+    expected = match_keys(_matches(0, 450).to_pandas()[[MATCH_ID_COLUMN]])
+    assert sorted(keys) == sorted(expected)
+
+
+def test_rows_of_an_interrupted_run_are_dropped(tmp_path):
+    input_file = str(tmp_path / 'final_data.feather')
+    feather.write_feather(_matches(0, 300), input_file)
+    prepare_data(input_file, str(tmp_path))
+    committed = {split: prepared_rows(str(tmp_path), split) for split in SPLITS}
+
+    # A run that died after appending values but before appending their keys
+    _append_npy(f'{tmp_path}/prepared_data_train.npy', np.full((7, len(FEATURE_COLUMNS) + 1), -1.0))
+    assert len(load_prepared_data(f'{tmp_path}/prepared_data_train.npy')[0]) == committed['train']
+
+    feather.write_feather(_matches(0, 350), input_file)
+    assert prepare_data(input_file, str(tmp_path)) == 50
+    train = np.load(f'{tmp_path}/prepared_data_train.npy')
+    assert len(train) == prepared_rows(str(tmp_path), 'train') and not (train == -1).all(axis=1).any()
+
+
+def test_truncate_and_append_npy(tmp_path):
+    path = str(tmp_path / 'values.npy')
+    _append_npy(path, np.arange(12.0).reshape(4, 3))
+    _append_npy(path, np.arange(12.0, 18.0).reshape(2, 3))
+    assert (np.load(path) == np.arange(18.0).reshape(6, 3)).all()
+    _truncate_npy(path, 2)
+    assert (np.load(path) == np.arange(6.0).reshape(2, 3)).all()
+    _truncate_npy(path, 5)  # Never grows
+    assert np.load(path).shape == (2, 3)
+    with pytest.raises(ValueError):
+        _append_npy(path, np.zeros((1, 4)))
+
+
+def _write_unpadded_npy(path, array):
+    """
+    Writes a .npy file whose header has no room to grow, as older NumPy versions did.
+    """
+    header = repr({'descr': '<f8', 'fortran_order': False, 'shape': array.shape}).encode()
+    header += b' ' * (-(len(header) + 11) % 64) + b'\n'
+    with open(path, 'wb') as f:
+        f.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header + array.tobytes())
+
+
+def test_files_that_have_to_be_rewritten_are_replaced_atomically(tmp_path, monkeypatch):
+    path = str(tmp_path / 'values.npy')
+    _write_unpadded_npy(path, np.arange(9.0).reshape(3, 3))
+    _append_npy(path, np.arange(9.0, 9.0 + 3 * 100_000).reshape(-1, 3))
+    assert (np.load(path) == np.arange(9.0 + 3 * 100_000).reshape(-1, 3)).all()
+
+    _write_unpadded_npy(path, np.arange(9.0).reshape(3, 3))
+
+    def interrupted(file, array):
+        file.write(b'\x93NUMPY')
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(np, 'save', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        _append_npy(path, np.zeros((100_000, 3)))
+    monkeypatch.undo()
+    assert (np.load(path) == np.arange(9.0).reshape(3, 3)).all()
@@ -0,0 +1,89 @@
+import asyncio
+
+from aiohttp.test_utils import TestServer
+
+from collecting_data.get_data import get_match_data_async
+from collecting_data.ledger import DONE, FAILED, PENDING, MatchLedger
+from collecting_data.riot_client import RiotAPIError, RiotClient
+from testing.mock_riot_server import create_app, generate_timeline
+
+MATCH_IDS = [f'EUN1_{3600000000 + n}' for n in range(5)]
+
+
+def test_ledger_retries_with_backoff_until_the_budget_is_spent(tmp_path):
+    with MatchLedger(str(tmp_path / 'ledger'), max_attempts=2, retry_delay=60) as ledger:
+        ledger.add(['EUN1_1', 'EUN1_2'])
+        ledger.mark_done('EUN1_1')
+        ledger.mark_failed('EUN1_2', 'timeout')
+        assert ledger.status('EUN1_2') == PENDING
+        assert ledger.ready() == []  # Waiting for its backoff
+        assert 59 < ledger.next_retry_in() <= 60
+
+        ledger.mark_failed('EUN1_2', 'timeout')
+        assert ledger.status('EUN1_2') == FAILED
+        assert ledger.next_retry_in() is None
+
+        ledger.retry_failed()
+        assert ledger.ready() == ['EUN1_2']
+        ledger.add(['EUN1_1'])  # Known matches keep their status
+        assert ledger.status('EUN1_1') == DONE
+
+
+def test_ledger_survives_a_restart(tmp_path):
+    with MatchLedger(str(tmp_path / 'ledger')) as ledger:
+        ledger.add(['EUN1_1', 'EUN1_2'])
+        ledger.mark_done('EUN1_1')
+    with MatchLedger(str(tmp_path / 'ledger')) as ledger:
+        assert ledger.ready() == ['EUN1_2']
+
+
+def _harvest(tmp_path, **options):
+    async def run():
+        server = TestServer(create_app(timeline_source=generate_timeline))
+        await server.start_server()
+        try:
+            async with RiotClient('key', url_template=f'http://{server.host}:{server.port}/{{route}}') as client:
+                await get_match_data_async(client, str(tmp_path / 'match_ids.txt'), str(tmp_path / 'match_data.csv'),
+                                           **options)
+        finally:
+            await server.close()
+    asyncio.run(run())
+    with open(tmp_path / 'match_data.csv') as f:
+        return f.read().splitlines()
+
+
+def test_get_match_data_resumes_and_restarts_without_duplicates(tmp_path):
+    (tmp_path / 'match_ids.txt').write_text('\n'.join(MATCH_IDS[:3]) + '\n')
+    assert len(_harvest(tmp_path)) == 3
+
+    (tmp_path / 'match_ids.txt').write_text('\n'.join(MATCH_IDS) + '\n')
+    rows = _harvest(tmp_path)
+    assert len(rows) == 5  # Only the two new matches were appended
+    assert sorted(_harvest(tmp_path, resume=False)) == sorted(rows)  # Rewritten, not appended a second time
+
+
+def test_get_match_data_records_errors_in_the_ledger(tmp_path):
+    class Client:
+        def max_in_flight(self, route: str) -> int:
+            return 2
+
+        async def get(self, route: str, path: str, method: str, raw: bool = False):
+            if MATCH_IDS[0] in path:
+                raise RiotAPIError(404, path)
+            return b'{"info": {"frames": [{"eve'  # Truncated
+
+    (tmp_path / 'match_ids.txt').write_text('\n'.join(MATCH_IDS[:2]) + '\n')
+
+    async def run():
+        harvest = asyncio.create_task(get_match_data_async(Client(), str(tmp_path / 'match_ids.txt'),
+                                                           str(tmp_path / 'match_data.csv')))
+        await asyncio.sleep(0.5)  # The truncated timeline waits for its retry
+        harvest.cancel()
+        await asyncio.gather(harvest, return_exceptions=True)
+    asyncio.run(run())
+
+    with MatchLedger(str(tmp_path / 'match_data.csv.ledger')) as ledger:
+        assert ledger.status(MATCH_IDS[0]) == FAILED  # A missing match is not retried
+        assert ledger.status(MATCH_IDS[1]) == PENDING
+        assert 'JSONDecodeError' in ledger.connection.execute('SELECT reason FROM matches WHERE match_id = ?',
+                                                              (MATCH_IDS[1],)).fetchone()[0]
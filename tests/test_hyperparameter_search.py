@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+from threadpoolctl import threadpool_info
+
+from model.feature_engineering import FEATURE_COLUMNS, SPLITS
+from model.hyperparameter_search import (
+    LOGISTIC_REGRESSION, LOGISTIC_REGRESSION_SPACE, NEURAL_NETWORK, _init_worker, _share_datasets, make_trials,
+    search,
+)
+
+
+@pytest.fixture
+def data_location(tmp_path):
+    rng = np.random.default_rng(0)
+    for split, rows in zip(SPLITS, (600, 150, 150)):
+        features = rng.normal(size=(rows, len(FEATURE_COLUMNS)))
+        target = (features[:, 2] + rng.normal(0, 0.5, rows) > 0).astype(np.float64)
+        np.save(tmp_path / f'prepared_data_{split}.npy', np.column_stack([features, target]))
+        np.save(tmp_path / f'prepared_data_{split}_keys.npy', rng.integers(0, 2 ** 63, rows, dtype=np.uint64))
+    return str(tmp_path)
+
+
+def test_make_trials():
+    trials = make_trials([LOGISTIC_REGRESSION])
+    assert len(trials) == len(LOGISTIC_REGRESSION_SPACE['alpha']) * len(LOGISTIC_REGRESSION_SPACE['epochs'])
+    assert all(trial['model'] == LOGISTIC_REGRESSION for trial in trials)
+    sampled = make_trials([NEURAL_NETWORK, LOGISTIC_REGRESSION], 3)
+    assert len(sampled) == 6 and sampled == make_trials([NEURAL_NETWORK, LOGISTIC_REGRESSION], 3)
+
+
+def test_search_needs_trials(data_location):
+    with pytest.raises(ValueError):
+        search([], data_location)
+
+
+def test_search_ranks_the_trials(data_location, tmp_path):
+    results = search(make_trials([LOGISTIC_REGRESSION], 2), data_location, str(tmp_path / 'results.csv'))
+    assert len(results) == 2 and 'error' not in results
+    assert results['val_accuracy'].is_monotonic_decreasing
+    assert (tmp_path / 'results.csv').exists()
+
+
+def test_workers_limit_the_thread_pools_already_loaded(data_location):
+    memory, layout = _share_datasets(data_location)
+    context = multiprocessing.get_context('spawn')
+    cores = context.Queue()
+    cores.put(os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else set())
+    try:
+        with ProcessPoolExecutor(1, mp_context=context, initializer=_init_worker,
+                                 initargs=(memory.name, layout, cores, context.Value('d', 0.0), 1)) as executor:
+            pools = executor.submit(threadpool_info).result()
+    finally:
+        memory.close()
+        memory.unlink()
+    assert [pool for pool in pools if pool['user_api'] == 'blas']
+    assert all(pool['num_threads'] == 1 for pool in pools)
@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from model.feature_engineering import FEATURE_COLUMNS
+from model.inference import NumpyModel, create_app, export_model
+from testing.mock_riot_server import generate_timeline
+
+
+def _write_model(path, rng) -> dict:
+    """
+    Writes a Normalization, Dense(elu), PReLU, Dense(sigmoid) network like export_model does, returns its arrays.
+    """
+    features = len(FEATURE_COLUMNS)
+    arrays = {'layer_0_mean': rng.normal(size=features), 'layer_0_variance': rng.uniform(0.5, 4, features),
+              'layer_1_kernel': rng.normal(size=(features, 7)), 'layer_1_bias': rng.normal(size=7),
+              'layer_2_alpha': rng.uniform(0, 0.5, 7),
+              'layer_3_kernel': rng.normal(size=(7, 1)), 'layer_3_bias': rng.normal(size=1)}
+    layers = [{'kind': 'Normalization'}, {'kind': 'Dense', 'activation': 'elu'}, {'kind': 'PReLU'},
+              {'kind': 'Dense', 'activation': 'sigmoid'}]
+    np.savez(path, layers=np.array(json.dumps(layers)), **arrays)
+    return arrays
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    _write_model(tmp_path / 'model_weights.npz', np.random.default_rng(0))
+    return str(tmp_path / 'model_weights.npz')
+
+
+def test_numpy_model_computes_the_layers_it_was_exported_with(tmp_path):
+    arrays = _write_model(tmp_path / 'model_weights.npz', np.random.default_rng(1))
+    x = np.random.default_rng(2).normal(size=(50, len(FEATURE_COLUMNS)))
+
+    hidden = (x - arrays['layer_0_mean']) / np.sqrt(arrays['layer_0_variance'])
+    hidden = hidden @ arrays['layer_1_kernel'] + arrays['layer_1_bias']
+    hidden = np.where(hidden > 0, hidden, np.exp(hidden) - 1)
+    hidden = np.where(hidden > 0, hidden, arrays['layer_2_alpha'] * hidden)
+    expected = 1 / (1 + np.exp(-(hidden @ arrays['layer_3_kernel'] + arrays['layer_3_bias'])))[:, 0]
+
+    model = NumpyModel(str(tmp_path / 'model_weights.npz'))
+    assert model.input_size == len(FEATURE_COLUMNS)
+    np.testing.assert_allclose(model.predict(x), expected, rtol=1e-12)
+    assert model.predict_one(x[0]) == pytest.approx(expected[0])
+
+
+def test_numpy_model_matches_keras(tmp_path):
+    keras = pytest.importorskip('keras')
+    rng = np.random.default_rng(3)
+    x = rng.normal(5, 3, size=(200, len(FEATURE_COLUMNS))).astype(np.float32)
+    normalization = keras.layers.Normalization()
+    normalization.adapt(x)
+    model = keras.models.Sequential([
+        keras.layers.Input(shape=(len(FEATURE_COLUMNS),)), normalization,
+        keras.layers.Dense(7, activation='elu'), keras.layers.PReLU(),
+        keras.layers.Dense(7, activation='sigmoid'), keras.layers.Dense(1, activation='sigmoid')])
+    export_model(model, str(tmp_path / 'model_weights.npz'))
+
+    expected = model.predict(x, verbose=0)[:, 0]
+    np.testing.assert_allclose(NumpyModel(str(tmp_path / 'model_weights.npz')).predict(x), expected, atol=1e-5)
+
+
+async def _post(model_file, body, cache_dir=None) -> tuple:
+    async with TestClient(TestServer(create_app(model_file, cache_dir, max_delay=0))) as client:
+        response = await (client.post('/predict', data=body) if isinstance(body, str)
+                          else client.post('/predict', json=body))
+        return response.status, await response.json()
+
+
+def test_predict_scores_features_and_timelines(model_file):
+    features = list(np.linspace(-1, 1, len(FEATURE_COLUMNS)))
+    status, result = asyncio.run(_post(model_file, {'features': features}))
+    assert status == 200
+    assert result['blueTeamWinProbability'] == pytest.approx(NumpyModel(model_file).predict_one(features))
+
+    status, result = asyncio.run(_post(model_file, {'timeline': generate_timeline('EUN1_3600000000')}))
+    assert status == 200 and 0 <= result['blueTeamWinProbability'] <= 1
+
+
+@pytest.mark.parametrize('body', [
+    'not json',
+    [1, 2, 3],
+    'null',
+    {},
+    {'features': [1.0] * (len(FEATURE_COLUMNS) - 1)},
+    {'features': 'abc'},
+    {'features': {'blueTeamNetKills': 1}},
+    {'features': ['1'] * len(FEATURE_COLUMNS)},
+    {'features': [True] * len(FEATURE_COLUMNS)},
+    {'features': [[1.0]] * len(FEATURE_COLUMNS)},
+    {'features': [1.0] * (len(FEATURE_COLUMNS) - 1) + [None]},
+    {'timeline': 'abc'},
+    {'timeline': {'info': {'frames': []}}},
+    {'timeline': {'info': {'frames': [{'timestamp': 'late'}]}}},
+])
+def test_predict_rejects_malformed_bodies(model_file, body):
+    status, result = asyncio.run(_post(model_file, body))
+    assert status == 400
+    assert result['error']
+
+
+def test_predict_rejects_non_finite_features(model_file):
+    body = '{"features": [NaN' + ', 1.0' * (len(FEATURE_COLUMNS) - 1) + ']}'
+    status, result = asyncio.run(_post(model_file, body))
+    assert status == 400 and 'finite' in result['error']
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import pstats
+
+import numpy as np
+import pytest
+
+import instrumentation
+from instrumentation import count, instrumented, span, timed
+
+
+@pytest.fixture
+def trace_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, '_tracer', None)  # Disabled again after the test, nothing written at exit
+    return tmp_path / 'trace.jsonl'
+
+
+def _spans(trace_file) -> list:
+    instrumentation.flush()
+    return [json.loads(line) for line in trace_file.read_text().splitlines()]
+
+
+def test_nothing_is_recorded_until_enabled(trace_file):
+    with span('stage') as stage:
+        stage.count('rows', 3)
+        count('rows')
+    assert stage is instrumentation._NULL_SPAN
+    assert not trace_file.exists()
+
+
+def test_spans_record_counters_and_memory(trace_file):
+    instrumentation.enable(str(trace_file))
+    with span('outer', file='a.csv'):
+        count('rows', 10)
+        with span('inner') as inner:
+            inner.count('requests')
+            rss, peak = instrumentation._rss()
+            with timed('parse_seconds'):
+                data = np.ones((peak - (rss or 0) + 64 * 2 ** 20) // 8)  # 64 MB more than the process ever held
+            del data
+        count('rows', 5)
+
+    inner, outer = _spans(trace_file)
+    assert (outer['name'], outer['parent'], outer['file']) == ('outer', None, 'a.csv')
+    assert (inner['name'], inner['parent']) == ('inner', 'outer')
+    assert outer['counters'] == {'rows': 15} and outer['rows_per_second'] > 0
+    assert inner['counters']['requests'] == 1 and inner['counters']['parse_seconds'] > 0
+    assert inner['raised_peak'] and inner['process_peak_rss_mb'] >= peak / 2 ** 20 + 64
+    if inner['rss_mb'] is not None:  # Where /proc is available
+        assert inner['rss_growth_mb'] < 32 <= inner['process_peak_rss_mb'] - inner['rss_mb']
+
+
+def test_instrumented_functions_and_coroutines(trace_file):
+    @instrumented()
+    def prepare():
+        count('rows', 2)
+
+    @instrumented('fetch')
+    async def download():
+        count('requests')
+
+    instrumentation.enable(str(trace_file))
+    prepare()
+    asyncio.run(download())
+    assert [(record['name'], record['counters']) for record in _spans(trace_file)] == [
+        ('prepare', {'rows': 2}), ('fetch', {'requests': 1})]
+
+
+def test_errors_are_recorded(trace_file):
+    instrumentation.enable(str(trace_file))
+    with pytest.raises(KeyError):
+        with span('stage'):
+            raise KeyError('x')
+    assert _spans(trace_file)[0]['error'] == 'KeyError'
+
+
+def test_every_run_of_a_profiled_stage_gets_its_own_profile(trace_file, tmp_path):
+    instrumentation.enable(str(trace_file), profile=['train'])
+    for epochs in (1, 2):
+        with span('train'):
+            sum(range(10_000 * epochs))
+    with span('predict'):
+        pass
+    profiles = sorted(path.name for path in tmp_path.glob('*.prof'))
+    assert profiles == ['trace.train.1.prof', 'trace.train.2.prof']
+    pstats.Stats(str(tmp_path / profiles[0]))
+
+
+def test_chrome_trace_format(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, '_tracer', None)
+    instrumentation.enable(str(tmp_path / 'trace.json'), trace_format='chrome')
+    with span('stage'):
+        count('rows')
+    instrumentation.flush()
+    events = json.loads((tmp_path / 'trace.json').read_text())['traceEvents']
+    assert events[0]['name'] == 'stage' and events[0]['ph'] == 'X' and events[0]['args']['counters'] == {'rows': 1}
+
+
+def test_unknown_formats_are_rejected(trace_file):
+    with pytest.raises(ValueError):
+        instrumentation.enable(str(trace_file), trace_format='xml')
+    with pytest.raises(ValueError):
+        instrumentation.enable(str(trace_file), profiler='perf')
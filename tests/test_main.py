@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+import numpy as np
+
+from model.artifact import data_hash
+
+
+def test_main_imports_no_heavy_modules():
+    heavy = ('pandas', 'pyarrow', 'aiohttp', 'matplotlib', 'keras')
+    code = f'import sys, main; print([module for module in {heavy} if module in sys.modules])'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_prepared_sets_are_hashed_by_their_keys(tmp_path):
+    train, keys = tmp_path / 'prepared_data_train.npy', tmp_path / 'prepared_data_train_keys.npy'
+    np.save(train, np.zeros((3, 14)))
+    np.save(keys, np.arange(3, dtype=np.uint64))
+    digest = data_hash(str(train))
+
+    np.save(train, np.ones((4, 14)))  # Rows appended after the keys were committed do not count
+    assert data_hash(str(train)) == digest
+    np.save(keys, np.arange(4, dtype=np.uint64))
+    assert data_hash(str(train)) != digest
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp.test_utils import TestServer
+
+from collecting_data.riot_client import RateLimitBucket, RiotAPIError, RiotClient, WINDOW_MARGIN, parse_rate_limits
+from testing.mock_riot_server import create_app, generate_timeline
+
+
+async def _with_server(test, **app_options):
+    server = TestServer(create_app(timeline_source=generate_timeline, **app_options))
+    await server.start_server()
+    try:
+        return await test(server)
+    finally:
+        await server.close()
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits('20:1,100:120') == [(20, 1.0), (100, 120.0)]
+    assert parse_rate_limits('') == []
+
+
+def test_bucket_returns_a_token_one_period_after_it_was_used():
+    bucket = RateLimitBucket(2, 1)
+    bucket.consume(0.0)
+    bucket.consume(0.5)
+    assert bucket.delay(0.6) == pytest.approx(1 + WINDOW_MARGIN - 0.6)
+    assert bucket.delay(1 + WINDOW_MARGIN) == 0
+
+
+def test_client_stays_within_the_limits_of_the_mock_server():
+    async def test(server):
+        url = f'http://{server.host}:{server.port}/{{route}}'
+        async with RiotClient('key', app_rate_limit='10:1', url_template=url) as client:
+            started = time.monotonic()
+            timelines = await asyncio.gather(*(
+                client.get('europe', f'/lol/match/v5/matches/EUN1_{3600000000 + n}/timeline', 'match-v5.timeline')
+                for n in range(15)))
+            return timelines, time.monotonic() - started, client.stats
+
+    timelines, elapsed, stats = asyncio.run(_with_server(test, app_rate_limit='10:1'))
+    assert [timeline['metadata']['matchId'] for timeline in timelines] == \
+        [f'EUN1_{3600000000 + n}' for n in range(15)]
+    assert stats['throttled'] == 0  # The client waited for its own limiter instead of being answered with 429
+    assert elapsed >= 1  # The last 5 requests had to wait for the first window to end
+
+
+def test_client_raises_api_errors_that_are_not_retried():
+    async def test(server):
+        url = f'http://{server.host}:{server.port}/{{route}}'
+        async with RiotClient('key', url_template=url) as client:
+            with pytest.raises(RiotAPIError) as error:
+                await client.get('europe', '/lol/match/v5/unknown', 'match-v5.timeline')
+            return error.value.status, client.stats['requests']
+
+    assert asyncio.run(_with_server(test)) == (404, 1)
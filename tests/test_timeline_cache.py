@@ -0,0 +1,56 @@
+import json
+
+from collecting_data.timeline_cache import MATCH, TIMELINE, TimelineCache, read_shard
+
+
+def _payload(match_id: str) -> bytes:
+    return json.dumps({'metadata': {'matchId': match_id}, 'info': {'frames': []}}).encode()
+
+
+def test_put_and_get_round_trip(tmp_path):
+    with TimelineCache(str(tmp_path)) as cache:
+        cache.put('EUN1_1', TIMELINE, _payload('EUN1_1'))
+        cache.put('EUN1_1', MATCH, b'{"info": {"gameVersion": "14.19.1"}}')
+        assert cache.get_raw('EUN1_1', TIMELINE) == _payload('EUN1_1')
+        assert cache.get('EUN1_1', MATCH) == {'info': {'gameVersion': '14.19.1'}}
+        assert cache.get('EUN1_2', TIMELINE) is None
+        assert cache.contains('EUN1_1', MATCH) and not cache.contains('EUN1_2', MATCH)
+
+    with TimelineCache(str(tmp_path)) as cache:  # Reopened from disk
+        assert cache.match_ids() == ['EUN1_1']
+        assert cache.get('EUN1_1', TIMELINE)['metadata']['matchId'] == 'EUN1_1'
+
+
+def test_identical_payloads_are_stored_once(tmp_path):
+    with TimelineCache(str(tmp_path)) as cache:
+        cache.put('EUN1_1', TIMELINE, _payload('shared'))
+        cache.put('EUN1_2', TIMELINE, _payload('shared'))
+        cache.put('EUN1_1', TIMELINE, _payload('shared'))  # Stored again, e.g. by a resumed harvest
+        stats = cache.stats()
+        assert (stats['payloads'], stats['blobs']) == (2, 1)
+        assert cache.get_raw('EUN1_2', TIMELINE) == _payload('shared')
+
+
+def test_shards_are_filled_in_order_and_read_without_the_index(tmp_path):
+    with TimelineCache(str(tmp_path), shard_size=2) as cache:
+        for number in range(5):
+            cache.put(f'EUN1_{number}', TIMELINE, _payload(f'EUN1_{number}'))
+        assert cache.shards() == [0, 1, 2]
+        payloads = [payload for shard in cache.shards()
+                    for _, payload in read_shard(cache.shard_path(shard), cache.shard_entries(shard))]
+        assert payloads == [_payload(f'EUN1_{number}') for number in range(5)]
+
+
+def test_prune_evicts_the_oldest_shards_first(tmp_path):
+    with TimelineCache(str(tmp_path), shard_size=2) as cache:
+        for number in range(6):
+            cache.put(f'EUN1_{number}', TIMELINE, _payload(f'EUN1_{number}'))
+        newer_bytes, = cache.index.execute('SELECT SUM(length) FROM blobs WHERE shard > 0').fetchone()
+        assert cache.prune(max_bytes=newer_bytes) == 1
+        assert cache.shards() == [1, 2]
+        assert cache.get('EUN1_0', TIMELINE) is None and cache.get('EUN1_5', TIMELINE) is not None
+        assert not (tmp_path / 'shard_000000.bin').exists()
+
+        assert cache.prune(older_than=3600) == 0
+        assert cache.prune(older_than=0) == 2
+        assert cache.stats()['payloads'] == 0
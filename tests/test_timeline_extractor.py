@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS, TimelineExtractor, extract_match_row
+from testing.mock_riot_server import generate_timeline
+from testing.timeline_generator import TimelineGenerator
+
+
+def _per_event_row(data: dict) -> list:
+    """
+    The original extraction of get_match_data, one if chain per event over frames 0..15, kept as the reference.
+    """
+    team = {column: 0 for column in MATCH_DATA_COLUMNS}
+    team['blueTeamFirstBlood'] = team['redTeamFirstBlood'] = 2
+    team['blueTeamWin'] = team['redTeamWin'] = 2
+
+    def side(participant):
+        if 1 <= participant <= 5:
+            return 'blueTeam', 'redTeam'
+        if 6 <= participant <= 10:
+            return 'redTeam', 'blueTeam'
+        return None, None
+
+    lastEvent = data['info']['frames'][-1]['events'][-1]
+    if lastEvent['timestamp'] > 870000:
+        if lastEvent.get('winningTeam') == 100:
+            team['blueTeamWin'], team['redTeamWin'] = 1, 0
+        elif lastEvent.get('winningTeam') == 200:
+            team['blueTeamWin'], team['redTeamWin'] = 0, 1
+        team['gameDuration'] = lastEvent['timestamp'] / 1000
+
+        for x in range(16):
+            for event in data['info']['frames'][x]['events']:
+                if event['type'] == 'WARD_PLACED':
+                    own, _ = side(event['creatorId'])
+                    if own:
+                        team[own + 'WardsPlaced'] += 1
+                if event['type'] == 'WARD_KILL':
+                    own, _ = side(event['killerId'])
+                    if own:
+                        team[own + 'WardsDestroyed'] += 1
+                if event['type'] == 'BUILDING_KILL' and event['buildingType'] == 'TOWER_BUILDING':
+                    own, _ = side(event['killerId'])
+                    if own:
+                        team[own + 'TowersDestroyed'] += 1
+                if event['type'] == 'ELITE_MONSTER_KILL':
+                    own, _ = side(event['killerId'])
+                    column = {'DRAGON': 'DragonsKilled', 'RIFTHERALD': 'HeraldsKilled',
+                              'HORDE': 'VoidGrubsKilled'}.get(event['monsterType'])
+                    if own and column:
+                        team[own + column] += 1
+                if event['type'] == 'CHAMPION_KILL':
+                    own, enemy = side(event['killerId'])
+                    if own:
+                        team[own + 'Kills'] += 1
+                        team[enemy + 'Deaths'] += 1
+                        team[own + 'Assists'] += len(event.get('assistingParticipantIds', []))
+                if event.get('killType') == 'KILL_FIRST_BLOOD':
+                    own, enemy = side(event['killerId'])
+                    if own:
+                        team[own + 'FirstBlood'], team[enemy + 'FirstBlood'] = 1, 0
+
+            frame = data['info']['frames'][x]
+            if 900000 < frame['timestamp'] < 901000:
+                for participant, stats in frame['participantFrames'].items():
+                    own = 'blueTeam' if int(participant) <= 5 else 'redTeam'
+                    team[own + 'TotalGold'] += stats['totalGold']
+                    team[own + 'AvgLevel'] += stats['level']
+                    team[own + 'TotalMinionsKilled'] += stats['minionsKilled']
+                    team[own + 'TotalJungleMonstersKilled'] += stats['jungleMinionsKilled']
+
+    for own in ('blueTeam', 'redTeam'):
+        team[own + 'AvgLevel'] = round(team[own + 'AvgLevel'] / 5, 2)
+        team[own + 'CsPerMinute'] = round(
+            (team[own + 'TotalMinionsKilled'] + team[own + 'TotalJungleMonstersKilled']) / 15, 2)
+        team[own + 'GoldPerMinute'] = round(team[own + 'TotalGold'] / 15, 2)
+        team[own + 'WardsPlaced'] = round(team[own + 'WardsPlaced'] / 5, 2)
+        team[own + 'WardsDestroyed'] = round(team[own + 'WardsDestroyed'] / 5, 2)
+    return [team[column] for column in MATCH_DATA_COLUMNS]
+
+
+def _timelines() -> list:
+    generator = TimelineGenerator(seed=7)
+    return ([generator.generate(f'EUN1_{3600000000 + number}') for number in range(40)]
+            + [generate_timeline(f'EUN1_{3700000000 + number}') for number in range(40)])
+
+
+TIMELINES = _timelines()
+
+
+@pytest.mark.parametrize('timeline', TIMELINES)
+def test_extractor_matches_the_per_event_loop(timeline):
+    assert extract_match_row(timeline) == _per_event_row(timeline)
+
+
+def test_snapshots_agree_with_extract():
+    extractor = TimelineExtractor()
+    for timeline in TIMELINES:
+        snapshots = extractor.extract_snapshots(timeline, [20, 15, 5])
+        assert snapshots[1] == extractor.extract(timeline)
+        assert snapshots == [TimelineExtractor(minute).extract(timeline) for minute in (20, 15, 5)]
+
+
+def test_frames_agree_with_extract_at_the_cutoff():
+    extractor = TimelineExtractor()
+    compared = 0
+    for timeline in TIMELINES:
+        frames = timeline['info']['frames']
+        if len(frames) <= 15 or not 900000 < frames[15]['timestamp'] < 901000:
+            continue
+        columns = extractor.extract_frames(timeline)
+        record = extractor.extract(timeline)
+        for column, values in columns.items():
+            if column in record and not column.endswith('PerMinute'):
+                assert values[14] == record[column], column
+        # Per-minute columns divide by the exact frame time instead of 15 minutes
+        for column in ('blueTeamGoldPerMinute', 'redTeamCsPerMinute'):
+            assert np.isclose(columns[column][14], record[column], atol=0.02 + record[column] * 0.002)
+        compared += 1
+    assert compared
+
+
+def test_registered_features_are_appended():
+    extractor = TimelineExtractor()
+    extractor.register_feature('blueTeamPlates', None)
+    extractor.register_event_handler('TURRET_PLATE_DESTROYED', lambda event, record: record.__setitem__(
+        'blueTeamPlates', record['blueTeamPlates'] + (event['teamId'] == 200)))
+    timeline = TIMELINES[0]
+    row = extractor.extract_row(timeline)
+    assert extractor.columns[-1] == 'blueTeamPlates'
+    assert row[:-1] == extract_match_row(timeline)
+    assert row[-1] == sum(event['type'] == 'TURRET_PLATE_DESTROYED' and event['teamId'] == 200
+                          for frame in timeline['info']['frames'][:16] for event in frame['events'])
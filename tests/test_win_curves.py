@@ -0,0 +1,75 @@
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import pytest
+
+from benchmarks.synthetic import _random_model
+from collecting_data.timeline_cache import TIMELINE, TimelineCache
+from data_processing.timeline_extractor import MATCH_DATA_COLUMNS, MATCH_ID_COLUMN, TimelineExtractor
+from model.artifact import DEFAULT_HYPERPARAMETERS, WEIGHTS_FILE, write_metadata
+from model.feature_engineering import FEATURE_COLUMNS, feature_vector, load_prepared_data, prepare_data
+from model.inference import NumpyModel
+from model.win_curves import WinCurves, score_curves, score_frames
+from testing.mock_riot_server import generate_timeline
+
+MATCH_IDS = [f'EUN1_{3600000000 + number}' for number in range(30)]
+
+
+def _without_wards(timeline: dict) -> dict:
+    for frame in timeline['info']['frames']:
+        frame['events'] = [event for event in frame['events'] if event['type'] != 'WARD_PLACED']
+    return timeline
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    train = np.random.default_rng(0).normal(size=(1000, len(FEATURE_COLUMNS) + 1))
+    directory = tmp_path / 'model'
+    directory.mkdir()
+    _random_model(str(directory / WEIGHTS_FILE), train)
+    write_metadata(str(directory), 'test', DEFAULT_HYPERPARAMETERS)
+    return str(directory)
+
+
+def test_curves_agree_with_the_prediction_at_minute_15(tmp_path, model_dir):
+    with TimelineCache(str(tmp_path / 'cache'), shard_size=8) as cache:
+        for match_id in MATCH_IDS:
+            cache.put(match_id, TIMELINE, json.dumps(generate_timeline(match_id)).encode())
+    assert score_curves(str(tmp_path / 'cache'), model_dir, str(tmp_path / 'curves.npz'), workers=1) == 30
+
+    curves = WinCurves(str(tmp_path / 'curves.npz'))
+    model = NumpyModel(f'{model_dir}/{WEIGHTS_FILE}')
+    extractor = TimelineExtractor()
+    compared = 0
+    for match_id in MATCH_IDS:
+        timeline = generate_timeline(match_id)
+        minutes, probabilities = curves[match_id]
+        assert len(minutes) == len(timeline['info']['frames']) - 1 and (np.diff(minutes) > 0).all()
+        if 900000 < timeline['info']['frames'][15]['timestamp'] < 901000:
+            # Per-minute columns are divided by the exact time of the frame, not by 15 minutes
+            assert probabilities[14] == pytest.approx(model.predict_one(feature_vector(extractor.extract(timeline))),
+                                                      abs=1e-3)
+            compared += 1
+    assert compared
+
+
+def test_undefined_features_are_sanitized_the_same_everywhere(tmp_path, model_dir):
+    timeline = _without_wards(generate_timeline(MATCH_IDS[0]))
+    extractor = TimelineExtractor()
+    served = feature_vector(extractor.extract(timeline))
+    assert np.isfinite(served).all()
+    assert served[FEATURE_COLUMNS.index('blueTeamWardRetentionRatio')] == 0
+
+    _, _, probabilities = score_frames(NumpyModel(f'{model_dir}/{WEIGHTS_FILE}'), [extractor.extract_frames(timeline)])
+    assert np.isfinite(probabilities).all()
+
+    record = extractor.extract(timeline)
+    columns = {column: [float(record[column])] * 20 for column in MATCH_DATA_COLUMNS}
+    columns[MATCH_ID_COLUMN] = [f'EUN1_{number}' for number in range(20)]
+    feather.write_feather(pa.table(columns), str(tmp_path / 'final_data.feather'))
+    prepare_data(str(tmp_path / 'final_data.feather'), str(tmp_path))
+    values = np.concatenate([load_prepared_data(f'{tmp_path}/prepared_data_{split}.npy')[0]
+                             for split in ('train', 'val', 'test')])
+    assert (values == served).all()